@@ -0,0 +1,105 @@
+import io
+import posixpath
+import tarfile
+import threading
+import zipfile
+
+from image_decode import ImageTooLargeError
+from sizing_pipeline import parse_manifest
+
+MANIFEST_NAMES = ("manifest.csv", "manifest.jsonl", "manifest.ndjson")
+
+
+class PhotoArchive:
+    """
+    Read-only view of a zip or tar archive of photo pairs
+
+    The archive holds the photos and a manifest (manifest.csv or
+    manifest.jsonl, see sizing_pipeline.parse_manifest) whose paths are
+    relative to the manifest's directory. Members are read one at a time
+    straight from the uploaded file, nothing is extracted to disk.
+
+    Args:
+        fileobj: Seekable binary file object holding the archive
+        max_member_bytes: Largest photo read from the archive (0 disables the limit)
+
+    Raises:
+        ValueError: If the file is not a zip or tar archive, or has no manifest
+    """
+
+    def __init__(self, fileobj, max_member_bytes=0):
+        self.max_member_bytes = max_member_bytes
+        # Zip and tar readers share the file position, so members are read one at a time
+        self._lock = threading.Lock()
+
+        fileobj.seek(0)
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            self._zip = zipfile.ZipFile(fileobj)
+            self._tar = None
+            self._members = {
+                posixpath.normpath(info.filename): info for info in self._zip.infolist() if not info.is_dir()
+            }
+        else:
+            fileobj.seek(0)
+            try:
+                self._tar = tarfile.open(fileobj=fileobj, mode="r:*")
+            except tarfile.TarError:
+                raise ValueError("Archive is neither a zip nor a tar file")
+            self._zip = None
+            self._members = {
+                posixpath.normpath(member.name): member for member in self._tar.getmembers() if member.isfile()
+            }
+
+        # The shallowest manifest wins (archives of a folder keep it one level down)
+        manifests = sorted(
+            (name for name in self._members if posixpath.basename(name) in MANIFEST_NAMES),
+            key=lambda name: (name.count("/"), name)
+        )
+        if not manifests:
+            raise ValueError(f"Archive has no manifest ({', '.join(MANIFEST_NAMES)})")
+        self.manifest_name = manifests[0]
+        self._base_dir = posixpath.dirname(self.manifest_name)
+
+    def read_manifest(self):
+        """Photo pairs listed in the manifest, with image paths relative to the archive root"""
+        text = self._read(self.manifest_name, 0).decode("utf-8-sig")
+        pairs = parse_manifest(io.StringIO(text, newline=""), jsonl=not self.manifest_name.endswith(".csv"))
+        for pair in pairs:
+            pair["front"] = posixpath.normpath(posixpath.join(self._base_dir, pair["front"]))
+            pair["side"] = posixpath.normpath(posixpath.join(self._base_dir, pair["side"]))
+        return pairs
+
+    def read_photo(self, name):
+        """
+        Read a photo from the archive
+
+        Raises:
+            FileNotFoundError: If the archive has no such file
+            ImageTooLargeError: If the file is larger than max_member_bytes
+        """
+        return self._read(name, self.max_member_bytes)
+
+    def _read(self, name, max_bytes):
+        member = self._members.get(name)
+        if member is None:
+            raise FileNotFoundError(f"{name} not found in archive")
+        size = member.file_size if self._zip is not None else member.size
+        if max_bytes and size > max_bytes:
+            raise ImageTooLargeError(f"{name} is larger than {max_bytes / (1024 * 1024):g} MB")
+
+        with self._lock:
+            if self._zip is not None:
+                with self._zip.open(member) as f:
+                    data = f.read(max_bytes + 1 if max_bytes else -1)
+            else:
+                data = self._tar.extractfile(member).read()
+        if max_bytes and len(data) > max_bytes:
+            raise ImageTooLargeError(f"{name} is larger than {max_bytes / (1024 * 1024):g} MB")
+        return data
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
@@ -0,0 +1,135 @@
+"""
+Minimal in-process ASGI client for driving the API without a server or HTTP library
+
+Runs the application's lifespan and sends requests straight to the ASGI
+callable, so endpoint benchmarks measure the application (routing, form
+parsing, the sizing pipeline) and nothing of the network stack.
+"""
+
+import asyncio
+import secrets
+
+
+class ASGIClient:
+    """
+    Send requests to an ASGI application in the running event loop
+
+    Use as an async context manager to run the application's startup and
+    shutdown (lifespan) around the requests.
+
+    Args:
+        app: ASGI application
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan_task = None
+        self._lifespan_queue = None
+        self._lifespan_events = None
+
+    async def __aenter__(self):
+        self._lifespan_queue = asyncio.Queue()
+        self._lifespan_events = asyncio.Queue()
+
+        async def send(message):
+            await self._lifespan_events.put(message)
+
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan_task = asyncio.ensure_future(self.app(scope, self._lifespan_queue.get, send))
+        await self._lifespan_queue.put({"type": "lifespan.startup"})
+        message = await self._lifespan_events.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"Application startup failed: {message.get('message', '')}")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._lifespan_queue.put({"type": "lifespan.shutdown"})
+        await self._lifespan_events.get()
+        await self._lifespan_task
+
+    async def request(self, method, path, fields=(), files=(), headers=()):
+        """
+        Send one request and wait for the complete response
+
+        Args:
+            method: HTTP method
+            path: Request path, optionally with a query string
+            fields: (name, value) form fields, sent as multipart/form-data with the files
+            files: (name, filename, content, content_type) file uploads
+            headers: Extra (name, value) request headers
+
+        Returns:
+            (status, headers dict, body bytes)
+        """
+        path, _, query = path.partition("?")
+        request_headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        body = b""
+        if fields or files:
+            body, content_type = encode_multipart(fields, files)
+            request_headers.append((b"content-type", content_type.encode("latin-1")))
+        request_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method.upper(),
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode("latin-1"),
+            "query_string": query.encode("latin-1"),
+            "root_path": "",
+            "headers": request_headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+
+        response = {"status": None, "headers": {}, "body": []}
+        finished = asyncio.Event()
+        body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # The client stays connected until the whole response has been sent
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {
+                    name.decode("latin-1").lower(): value.decode("latin-1") for name, value in message["headers"]
+                }
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    finished.set()
+
+        await self.app(scope, receive, send)
+        finished.set()
+        return response["status"], response["headers"], b"".join(response["body"])
+
+
+def encode_multipart(fields, files):
+    """
+    Encode form fields and files as multipart/form-data
+
+    Returns:
+        (body, content type header value)
+    """
+    boundary = secrets.token_hex(16)
+    parts = []
+    for name, value in fields:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+        )
+    for name, filename, content, content_type in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
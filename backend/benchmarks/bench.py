@@ -0,0 +1,356 @@
+"""
+Benchmark suite of the sizing pipeline
+
+Times the CPU-side stages of the pipeline and both sizing endpoints end to
+end, on synthetic photos at several resolutions and with the deterministic
+stand-in network of synthetic_pose (so the OpenPose model isn't needed and
+the forward pass costs next to nothing; what's measured is our own code).
+
+Usage (from backend/):
+    python benchmarks/bench.py run [--save NAME] [--filter TEXT] [--min-time SECONDS]
+    python benchmarks/bench.py compare BASELINE [CURRENT] [--threshold 0.1]
+
+`run` prints the median, p90, mean and minimum of every case and with
+--save stores them as benchmarks/baselines/NAME.json. `compare` compares the
+medians of two result files (or of a result file and a fresh run) and exits
+with status 1 if any case got slower than the threshold allows.
+"""
+
+import argparse
+import asyncio
+import datetime
+import functools
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+BASELINES_DIR = os.path.join(BENCHMARKS_DIR, "baselines")
+sys.path.insert(0, BACKEND_DIR)
+
+# Deterministic service configuration; must be in place before config is imported. Every
+# request runs the full pipeline (no pose cache), on one thread worker with the stand-in network.
+for name, value in {
+    "POSE_BACKEND": "synthetic",
+    "INFERENCE_EXECUTOR": "thread",
+    "INFERENCE_WORKERS": "1",
+    "INFERENCE_MAX_WAIT_MS": "0",
+    "OPENPOSE_NUM_THREADS": "1",
+    "WARMUP_PASSES": "0",
+    "OPENPOSE_STARTUP_BENCHMARK_RUNS": "0",
+    "POSE_CACHE_MAX_ENTRIES": "0",
+    "DEBUG_ARTIFACT_SAMPLE_RATE": "0",
+    "CHART_RELOAD_INTERVAL_SECONDS": "0",
+    "TRACE_FILE": "",
+}.items():
+    os.environ.setdefault(name, value)
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+from asgi_client import ASGIClient  # noqa: E402
+from body_measurements import calculate_body_measurements  # noqa: E402
+from openpose_utils import OpenPoseDetector  # noqa: E402
+from side_view_processing import prepare_side_view, process_side_view  # noqa: E402
+from size_prediction import (  # noqa: E402
+    SizeChartIndex, determine_dress_size, determine_jeans_size, determine_skirt_size
+)
+from sizing_pipeline import load_size_charts, measure_and_size  # noqa: E402
+from synthetic_pose import SyntheticPoseNet, synthetic_photo, synthetic_photo_jpeg  # noqa: E402
+
+# Photo resolutions (width, height): a small upload, a typical phone export, a full-size phone photo
+RESOLUTIONS = [(480, 640), (1080, 1440), (3024, 4032)]
+
+HEIGHT_CM = 170.0
+
+
+class Case:
+    """
+    One benchmark: a function timed repeatedly
+
+    Args:
+        name: Unique case name, stable across runs (results are compared by name)
+        func: Callable or coroutine function taking no arguments
+    """
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+
+
+def measure(func, min_time, min_runs=5, max_runs=10000, warmup=1):
+    """
+    Time func() until both min_runs and min_time are reached
+
+    Returns:
+        Dictionary of median/p90/mean/min in milliseconds and the number of runs
+    """
+    for _ in range(warmup):
+        func()
+    times = []
+    deadline = time.perf_counter() + min_time
+    while len(times) < max_runs and (len(times) < min_runs or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return summarize(times)
+
+
+async def measure_async(func, min_time, min_runs=5, max_runs=10000, warmup=1):
+    """measure() for a coroutine function"""
+    for _ in range(warmup):
+        await func()
+    times = []
+    deadline = time.perf_counter() + min_time
+    while len(times) < max_runs and (len(times) < min_runs or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        await func()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return summarize(times)
+
+
+def summarize(times):
+    times = sorted(times)
+    return {
+        "median_ms": round(statistics.median(times), 4),
+        "p90_ms": round(times[min(len(times) - 1, int(len(times) * 0.9))], 4),
+        "mean_ms": round(statistics.fmean(times), 4),
+        "min_ms": round(times[0], 4),
+        "runs": len(times),
+    }
+
+
+def pipeline_cases(detector, crop_detector, size_index, size_charts):
+    """Cases of the pipeline stages, per resolution where the stage depends on it"""
+    cases = []
+    waist_hip_bust = {"waist": 76.0, "hip": 100.0, "bust": 92.0}
+    cases.append(Case("determine_sizes", functools.partial(size_index.determine_sizes, waist_hip_bust)))
+
+    def legacy_sizing():
+        determine_jeans_size(76.0, 100.0, size_charts)
+        determine_dress_size(92.0, 76.0, 100.0, size_charts)
+        determine_skirt_size(76.0, 100.0, size_charts)
+    cases.append(Case("legacy_size_functions", legacy_sizing))
+
+    input_shape = detector.input_shapes()[-1]
+    for width, height in RESOLUTIONS:
+        resolution = f"{width}x{height}"
+        front = synthetic_photo(width, height, "front")
+        side = synthetic_photo(width, height, "side", seed=1)
+        front_results = detector.detect_pose(front)
+        side_results = detector.detect_pose(side)
+
+        # Network output of the front photo, for timing the heatmap post-processing alone
+        blob, content_sizes = detector._prepare_blob([front], *input_shape)
+        net = detector.nets[input_shape]
+        net.setInput(blob)
+        heatmaps = net.forward()[0, :detector.profile.num_keypoints]
+
+        # Landmarks as they are when the inference of the (undetected) left ear runs
+        landmarks = {k: v for k, v in front_results["landmarks"].items() if k != "LEFT_EAR"}
+
+        measurements = calculate_body_measurements(front_results["landmarks"], front.shape, HEIGHT_CM)
+        prepared = prepare_side_view(side)
+
+        cases += [
+            Case(f"detect_pose[{resolution}]", functools.partial(detector.detect_pose, front)),
+            Case(f"detect_pose_two_pass[{resolution}]", functools.partial(crop_detector.detect_pose, front)),
+            Case(f"heatmaps_to_pose[{resolution}]", functools.partial(
+                detector._heatmaps_to_pose, heatmaps, width, height, input_shape, content_sizes[0]
+            )),
+            Case(f"infer_missing_keypoint[{resolution}]", functools.partial(
+                detector._infer_missing_keypoint, "LEFT_EAR", landmarks
+            )),
+            Case(f"calculate_body_measurements[{resolution}]", functools.partial(
+                calculate_body_measurements, front_results["landmarks"], front.shape, HEIGHT_CM
+            )),
+            Case(f"prepare_side_view[{resolution}]", functools.partial(prepare_side_view, side)),
+            Case(f"process_side_view[{resolution}]", functools.partial(
+                process_side_view, side_results["landmarks"], side, measurements["waist_y_offset"], prepared
+            )),
+            Case(f"measure_and_size[{resolution}]", functools.partial(
+                measure_and_size, front_results, side_results, side, HEIGHT_CM, size_index, prepared
+            )),
+        ]
+    return cases
+
+
+def endpoint_cases(client):
+    """Cases sending requests to both sizing endpoints through the in-process client"""
+    cases = []
+    for width, height in RESOLUTIONS:
+        resolution = f"{width}x{height}"
+        front = synthetic_photo_jpeg(width, height, "front")
+        side = synthetic_photo_jpeg(width, height, "side", seed=1)
+
+        async def detect(front=front):
+            status, _, body = await client.request(
+                "POST", "/detect-pose/", files=[("image", "front.jpg", front, "image/jpeg")]
+            )
+            if status != 200:
+                raise RuntimeError(f"/detect-pose/ returned {status}: {body[:200]!r}")
+
+        async def predict(front=front, side=side):
+            status, _, body = await client.request(
+                "POST", "/predict-size/",
+                fields=[("height_cm", str(HEIGHT_CM))],
+                files=[("image", "front.jpg", front, "image/jpeg"), ("side_image", "side.jpg", side, "image/jpeg")]
+            )
+            if status != 200:
+                raise RuntimeError(f"/predict-size/ returned {status}: {body[:200]!r}")
+
+        cases += [Case(f"endpoint_detect_pose[{resolution}]", detect),
+                  Case(f"endpoint_predict_size[{resolution}]", predict)]
+    return cases
+
+
+async def run_suite(min_time, name_filter=None):
+    """
+    Run every case (or those whose name contains name_filter)
+
+    Returns:
+        Dictionary of case name -> timing summary
+    """
+    cv2.setNumThreads(1)
+    detector = OpenPoseDetector(color_order="rgb", read_net=SyntheticPoseNet)
+    crop_detector = OpenPoseDetector(color_order="rgb", read_net=SyntheticPoseNet, person_crop=True)
+    size_charts = load_size_charts()
+    size_index = SizeChartIndex(size_charts)
+
+    results = {}
+
+    def selected(cases):
+        return [case for case in cases if not name_filter or name_filter in case.name]
+
+    for case in selected(pipeline_cases(detector, crop_detector, size_index, size_charts)):
+        results[case.name] = measure(case.func, min_time)
+        print_result(case.name, results[case.name])
+
+    # The service, with the stand-in network in its inference workers (POSE_BACKEND above)
+    import main
+    async with ASGIClient(main.app) as client:
+        while main.startup_state["status"] == "starting":
+            await asyncio.sleep(0.01)
+        if main.startup_state["status"] != "ready":
+            raise RuntimeError(f"Service failed to start: {main.startup_state['error']}")
+        for case in selected(endpoint_cases(client)):
+            results[case.name] = await measure_async(case.func, min_time)
+            print_result(case.name, results[case.name])
+    return results
+
+
+def print_result(name, result):
+    print(f"{name:<48} {result['median_ms']:>10.3f} {result['p90_ms']:>10.3f} "
+          f"{result['mean_ms']:>10.3f} {result['min_ms']:>10.3f} {result['runs']:>7}")
+
+
+def environment():
+    """Machine and library versions the results were taken with"""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def load_results(path):
+    """Read a result file, given as a path or as the name of a saved baseline"""
+    if not os.path.exists(path):
+        path = os.path.join(BASELINES_DIR, f"{path}.json")
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold):
+    """
+    Print the median of every case in both results and flag regressions
+
+    A case regresses when its median grew by more than `threshold` (a fraction).
+
+    Returns:
+        Names of the regressed cases
+    """
+    base_results = baseline["results"]
+    current_results = current["results"]
+    regressions = []
+    print(f"{'case':<48} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in current_results.items():
+        if name not in base_results:
+            print(f"{name:<48} {'-':>10} {result['median_ms']:>10.3f}      new")
+            continue
+        before = base_results[name]["median_ms"]
+        after = result["median_ms"]
+        change = after / before - 1.0 if before > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<48} {before:>10.3f} {after:>10.3f} {change:>+7.1%}{flag}")
+    for name in base_results:
+        if name not in current_results:
+            print(f"{name:<48} {base_results[name]['median_ms']:>10.3f} {'-':>10}  missing")
+    if baseline.get("environment") != current.get("environment"):
+        print("Note: the results were taken on different machines or library versions")
+    return regressions
+
+
+def run_and_collect(args):
+    print(f"{'case (ms)':<48} {'median':>10} {'p90':>10} {'mean':>10} {'min':>10} {'runs':>7}")
+    results = asyncio.run(run_suite(args.min_time, args.filter))
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "min_time": args.min_time,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sizing pipeline")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subcommands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--save", nargs="?", const=socket.gethostname(), default=None,
+                            help="Save the results as benchmarks/baselines/NAME.json (default name: the hostname)")
+    compare_parser = subcommands.add_parser("compare", help="Compare results against a baseline")
+    compare_parser.add_argument("baseline", help="Result file or saved baseline name")
+    compare_parser.add_argument("current", nargs="?", default=None,
+                                help="Result file or saved baseline name (default: run the benchmarks now)")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Allowed slowdown of the median as a fraction (default 0.1)")
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument("--filter", default=None, help="Only run cases whose name contains this text")
+        subparser.add_argument("--min-time", type=float, default=1.0,
+                               help="Minimum time spent timing each case in seconds (default 1.0)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        current = run_and_collect(args)
+        if args.save:
+            os.makedirs(BASELINES_DIR, exist_ok=True)
+            path = os.path.join(BASELINES_DIR, f"{args.save}.json")
+            with open(path, "w") as f:
+                json.dump(current, f, indent=2)
+            print(f"Results saved to {path}")
+        return 0
+
+    baseline = load_results(args.baseline)
+    current = load_results(args.current) if args.current else run_and_collect(args)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
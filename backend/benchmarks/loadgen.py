@@ -0,0 +1,388 @@
+"""
+Load generator for the sizing endpoints
+
+Sends /detect-pose/ and /predict-size/ requests at a target rate (open loop:
+requests are scheduled by the clock, not by the previous response, so a slow
+service builds up a backlog instead of slowing the generator down) with
+synthetic photos at realistic phone resolutions, and reports throughput,
+latency percentiles and errors.
+
+To load-test without the OpenPose model, run the service with the synthetic
+pose backend, e.g. `POSE_BACKEND=synthetic SYNTHETIC_INFERENCE_MS=150`, or
+pass --spawn to start such a service on a free port.
+
+Usage (from backend/):
+    python benchmarks/loadgen.py --spawn --rate 20 --duration 30
+    python benchmarks/loadgen.py --url http://127.0.0.1:8000 --rate 5 --endpoint predict-size
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from asgi_client import encode_multipart  # noqa: E402
+from synthetic_pose import synthetic_photo_jpeg  # noqa: E402
+
+ENDPOINTS = {"detect-pose": "/detect-pose/", "predict-size": "/predict-size/"}
+
+# Typical upload sizes: a resized web upload, a phone photo exported at reduced size, a full-size phone photo
+DEFAULT_RESOLUTIONS = "1080x1440,1536x2048,3024x4032"
+
+HEIGHT_CM = 170.0
+
+
+class Payloads:
+    """
+    Request bodies with synthetic photos, encoded once up front
+
+    Args:
+        resolutions: List of (width, height) photo sizes, picked uniformly per request
+        variants: Photos per resolution and view (different backgrounds, so file sizes vary)
+        unique: Append a random trailer to every photo so the service's pose cache never hits
+            (JPEG decoders ignore data after the end-of-image marker)
+    """
+
+    def __init__(self, resolutions, variants=3, unique=True):
+        self.unique = unique
+        self.photos = [
+            [(synthetic_photo_jpeg(width, height, "front", seed), synthetic_photo_jpeg(width, height, "side", seed + 1000))
+             for seed in range(variants)]
+            for width, height in resolutions
+        ]
+        self.mean_photo_bytes = sum(
+            len(front) + len(side) for per_resolution in self.photos for front, side in per_resolution
+        ) / (2 * sum(len(per_resolution) for per_resolution in self.photos))
+
+    def body(self, endpoint, rng):
+        """Multipart body and content type of one request"""
+        front, side = rng.choice(rng.choice(self.photos))
+        if self.unique:
+            front += rng.randbytes(16)
+            side += rng.randbytes(16)
+        files = [("image", "front.jpg", front, "image/jpeg")]
+        fields = []
+        if endpoint == "predict-size":
+            files.append(("side_image", "side.jpg", side, "image/jpeg"))
+            fields.append(("height_cm", str(HEIGHT_CM)))
+        return encode_multipart(fields, files)
+
+
+class Result:
+    """Outcome of one request; times are perf_counter() values"""
+
+    __slots__ = ("endpoint", "scheduled", "sent", "finished", "error")
+
+    def __init__(self, endpoint, scheduled, sent, finished, error=None):
+        self.endpoint = endpoint
+        self.scheduled = scheduled
+        self.sent = sent
+        self.finished = finished
+        self.error = error
+
+
+class LoadGenerator:
+    """
+    Open-loop load generator sending requests from a pool of threads
+
+    A scheduler thread queues requests at their arrival times; every worker
+    thread keeps one HTTP connection and sends queued requests as soon as it's
+    free. Latency is measured from the scheduled arrival, so time a request
+    waited for a free worker counts (no coordinated omission); the client
+    queue delay is reported separately to show when the generator itself is
+    the bottleneck.
+
+    Args:
+        url: Base URL of the service
+        payloads: Payloads to send
+        rate: Target requests per second
+        duration: Seconds to send requests for
+        endpoint_weights: {endpoint name: weight} of the request mix
+        concurrency: Worker threads, i.e. most requests in flight
+        arrivals: "poisson" (exponential gaps) or "constant" (evenly spaced)
+        timeout: Request timeout in seconds
+        seed: Seed of the arrival times, request mix and photo choice
+    """
+
+    def __init__(self, url, payloads, rate, duration, endpoint_weights, concurrency=64, arrivals="poisson",
+                 timeout=60.0, seed=0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.base_path = parts.path.rstrip("/")
+        self.payloads = payloads
+        self.rate = rate
+        self.duration = duration
+        self.endpoint_weights = endpoint_weights
+        self.concurrency = concurrency
+        self.arrivals = arrivals
+        self.timeout = timeout
+        self.seed = seed
+
+        self._queue = queue.Queue()
+        self._results = []
+        self._results_lock = threading.Lock()
+
+    def run(self):
+        """Send the load and return the list of Results"""
+        workers = [
+            threading.Thread(target=self._worker, args=(random.Random(self.seed + 1 + i),), daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        self._schedule(random.Random(self.seed))
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+        return self._results
+
+    def _schedule(self, rng):
+        endpoints = list(self.endpoint_weights)
+        weights = [self.endpoint_weights[name] for name in endpoints]
+        start = time.perf_counter()
+        offset = 0.0
+        while True:
+            offset += rng.expovariate(self.rate) if self.arrivals == "poisson" else 1.0 / self.rate
+            if offset >= self.duration:
+                return
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._queue.put((rng.choices(endpoints, weights)[0], start + offset))
+
+    def _worker(self, rng):
+        connection = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            endpoint, scheduled = item
+            body, content_type = self.payloads.body(endpoint, rng)
+            sent = time.perf_counter()
+            error = None
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                connection.request("POST", self.base_path + ENDPOINTS[endpoint], body=body,
+                                   headers={"Content-Type": content_type})
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    error = f"HTTP {response.status}"
+                if response.getheader("connection", "").lower() == "close":
+                    connection.close()
+                    connection = None
+            except (OSError, http.client.HTTPException) as e:
+                error = "timeout" if isinstance(e, socket.timeout) else type(e).__name__
+                if connection is not None:
+                    connection.close()
+                connection = None
+            result = Result(endpoint, scheduled, sent, time.perf_counter(), error)
+            with self._results_lock:
+                self._results.append(result)
+        if connection is not None:
+            connection.close()
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+def summarize(results, duration):
+    """
+    Throughput, latency percentiles (in ms, successful requests) and errors of a set of results
+
+    Throughput is counted over the sending period, or until the last response if that came later.
+    """
+    ok = sorted((r.finished - r.scheduled) * 1000.0 for r in results if r.error is None)
+    queue_delay = sorted((r.sent - r.scheduled) * 1000.0 for r in results)
+    errors = {}
+    for r in results:
+        if r.error is not None:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    if results:
+        first = min(r.scheduled for r in results)
+        elapsed = max(duration, max(r.finished for r in results) - first)
+    else:
+        elapsed = duration
+
+    def ms(value):
+        return round(value, 1) if value is not None else None
+
+    return {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "error_rate": round((len(results) - len(ok)) / len(results), 4) if results else 0.0,
+        "errors": errors,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": ms(percentile(ok, 0.50)),
+            "p95": ms(percentile(ok, 0.95)),
+            "p99": ms(percentile(ok, 0.99)),
+            "max": ms(ok[-1] if ok else None),
+        },
+        "client_queue_delay_ms": {"p50": ms(percentile(queue_delay, 0.50)), "p99": ms(percentile(queue_delay, 0.99))},
+    }
+
+
+def print_report(report):
+    print(f"Target {report['target_rps']} req/s for {report['duration_s']} s, "
+          f"{report['concurrency']} connections, photos {report['resolutions']} "
+          f"(mean {report['mean_photo_kb']} kB)")
+    print(f"{'endpoint':<14} {'requests':>8} {'ok':>6} {'errors':>7} {'req/s':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, summary in report["endpoints"].items():
+        latency = summary["latency_ms"]
+        cells = [f"{latency[key]:>8.1f}" if latency[key] is not None else f"{'-':>8}" for key in ("p50", "p95", "p99", "max")]
+        print(f"{name:<14} {summary['requests']:>8} {summary['succeeded']:>6} {summary['error_rate']:>7.1%} "
+              f"{summary['throughput_rps']:>7.2f} {' '.join(cells)}")
+    for name, summary in report["endpoints"].items():
+        for error, count in sorted(summary["errors"].items(), key=lambda item: -item[1]):
+            print(f"  {name}: {count} x {error}")
+    delay = report["endpoints"]["all"]["client_queue_delay_ms"]
+    if delay["p99"] is not None and delay["p99"] > 100.0:
+        print(f"Requests waited up to {delay['p99']:.0f} ms (p99) for a free connection; "
+              f"raise --concurrency to keep the offered rate")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_service(env_overrides, startup_timeout=120.0):
+    """
+    Start the service with uvicorn on a free local port, with the synthetic pose backend by default
+
+    Returns:
+        (process, base URL) once /readyz reports ready
+    """
+    port = free_port()
+    env = dict(os.environ)
+    env.setdefault("POSE_BACKEND", "synthetic")
+    env.update(env_overrides)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Service exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", "/readyz")
+            status = connection.getresponse().status
+            connection.close()
+            if status == 200:
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Service didn't become ready in time")
+
+
+def parse_resolutions(value):
+    resolutions = []
+    for item in value.split(","):
+        width, _, height = item.strip().lower().partition("x")
+        resolutions.append((int(width), int(height)))
+    return resolutions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send sizing requests at a target rate and report latency")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the service")
+    parser.add_argument("--spawn", action="store_true",
+                        help="Start the service on a free port (synthetic pose backend unless POSE_BACKEND is set)")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Setting for the spawned service, e.g. SYNTHETIC_INFERENCE_MS=150 (repeatable)")
+    parser.add_argument("--rate", type=float, default=10.0, help="Target requests per second (default 10)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to send requests for (default 30)")
+    parser.add_argument("--endpoint", choices=[*ENDPOINTS, "both"], default="both", help="Endpoint(s) to load")
+    parser.add_argument("--predict-share", type=float, default=0.5,
+                        help="Share of /predict-size/ requests with --endpoint both (default 0.5)")
+    parser.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS,
+                        help=f"Comma-separated photo sizes, picked uniformly (default {DEFAULT_RESOLUTIONS})")
+    parser.add_argument("--concurrency", type=int, default=64, help="Most requests in flight (default 64)")
+    parser.add_argument("--arrivals", choices=["poisson", "constant"], default="poisson",
+                        help="Arrival process (default poisson)")
+    parser.add_argument("--repeat-images", action="store_true",
+                        help="Send identical photo bytes, so the service's pose cache can hit")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Request timeout in seconds (default 60)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of arrivals, mix and photos (default 0)")
+    parser.add_argument("--json", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.rate <= 0 or args.duration <= 0 or args.concurrency < 1:
+        parser.error("--rate and --duration must be positive and --concurrency at least 1")
+    if args.endpoint == "both":
+        endpoint_weights = {"detect-pose": 1.0 - args.predict_share, "predict-size": args.predict_share}
+    else:
+        endpoint_weights = {args.endpoint: 1.0}
+    resolutions = parse_resolutions(args.resolutions)
+
+    print("Encoding photos...")
+    payloads = Payloads(resolutions, unique=not args.repeat_images)
+
+    process = None
+    url = args.url
+    if args.spawn:
+        env_overrides = dict(item.split("=", 1) for item in args.env)
+        process, url = spawn_service(env_overrides)
+        print(f"Service started at {url}")
+    try:
+        print(f"Sending load to {url}...")
+        generator = LoadGenerator(url, payloads, args.rate, args.duration, endpoint_weights,
+                                  concurrency=args.concurrency, arrivals=args.arrivals,
+                                  timeout=args.timeout, seed=args.seed)
+        results = generator.run()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    results.sort(key=lambda r: r.endpoint)
+    endpoints = {"all": summarize(results, args.duration)}
+    for name, group in itertools.groupby(results, key=lambda r: r.endpoint):
+        endpoints[name] = summarize(list(group), args.duration)
+    report = {
+        "url": url,
+        "target_rps": args.rate,
+        "duration_s": args.duration,
+        "concurrency": args.concurrency,
+        "arrivals": args.arrivals,
+        "resolutions": args.resolutions,
+        "mean_photo_kb": round(payloads.mean_photo_bytes / 1024.0, 1),
+        "endpoints": endpoints,
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if endpoints["all"]["succeeded"] == 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Accuracy-vs-latency sweep over the OpenPose network stages
+
+Runs the model truncated after every stage (see OPENPOSE_STAGES) on a
+directory of photos and prints, per stage, the forward-pass latency and how
+far the required landmarks land from the reference: ground-truth labels if
+given, otherwise the full network's own detections. Errors are normalized
+by the torso length (shoulder midpoint to hip midpoint) of the reference, so
+photos of different sizes are comparable.
+
+Usage (from backend/):
+    python benchmarks/stage_sweep.py --images DIR [--labels LABELS.json] [--model coco]
+        [--input-height 368] [--runs 10] [--json REPORT.json]
+
+The labels file maps image file names to landmark coordinates in pixels,
+e.g. {"front.jpg": {"LEFT_SHOULDER": [412, 530], ...}}; landmarks it leaves
+out aren't scored.
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+import cv2  # noqa: E402
+
+from openpose_utils import OpenPoseDetector  # noqa: E402
+from pose_models import REQUIRED_LANDMARKS, candidate_profiles  # noqa: E402
+from synthetic_pose import SyntheticPoseNet  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Normalized error thresholds reported as PCK (percentage of correct keypoints)
+PCK_THRESHOLDS = (0.05, 0.1, 0.2)
+
+# Landmarks below this visibility were inferred or not found (see OpenPoseDetector._heatmaps_to_pose)
+MIN_VISIBILITY = 0.1
+
+
+def load_images(image_dir):
+    """Read every image of a directory, sorted by file name"""
+    images = {}
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            image = cv2.imread(os.path.join(image_dir, name))
+            if image is not None:
+                images[name] = image
+    return images
+
+
+def detected_points(landmarks):
+    """(x, y) of the required landmarks the network actually found"""
+    return {
+        name: (landmarks[name]["x"], landmarks[name]["y"])
+        for name in REQUIRED_LANDMARKS
+        if name in landmarks and landmarks[name]["visibility"] > MIN_VISIBILITY
+    }
+
+
+def torso_length(points):
+    """Shoulder midpoint to hip midpoint distance, or None if a landmark is missing"""
+    try:
+        shoulders = [(a + b) / 2.0 for a, b in zip(points["LEFT_SHOULDER"], points["RIGHT_SHOULDER"])]
+        hips = [(a + b) / 2.0 for a, b in zip(points["LEFT_HIP"], points["RIGHT_HIP"])]
+    except KeyError:
+        return None
+    length = math.dist(shoulders, hips)
+    return length if length > 0 else None
+
+
+def score(predictions, references):
+    """
+    Compare predicted landmarks with the reference landmarks of every image
+
+    Args:
+        predictions: Image name -> detected points (see detected_points)
+        references: Image name -> reference points
+
+    Returns:
+        Dictionary with the mean and p90 normalized error of the found landmarks,
+        the detection rate and the PCK at every threshold
+    """
+    errors = []
+    scored = 0
+    for name, reference in references.items():
+        torso = torso_length(reference)
+        if torso is None:
+            continue
+        predicted = predictions.get(name, {})
+        for landmark, point in reference.items():
+            if landmark not in REQUIRED_LANDMARKS:
+                continue
+            scored += 1
+            if landmark in predicted:
+                errors.append(math.dist(predicted[landmark], point) / torso)
+
+    if not scored:
+        return None
+    ordered = sorted(errors)
+    result = {
+        "keypoints": scored,
+        "detection_rate": round(len(errors) / scored, 4),
+        "mean_error": round(statistics.fmean(errors), 4) if errors else None,
+        "p90_error": round(ordered[max(0, math.ceil(0.9 * len(ordered)) - 1)], 4) if errors else None,
+    }
+    for threshold in PCK_THRESHOLDS:
+        result[f"pck@{threshold}"] = round(sum(error <= threshold for error in errors) / scored, 4)
+    return result
+
+
+def sweep(args):
+    """
+    Run the model at every stage count and score each against the reference
+
+    Returns:
+        (rows, reference_source) where rows has one dictionary per stage count
+    """
+    profile = candidate_profiles(args.model)[0]
+    images = load_images(args.images)
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    def make_detector(stages):
+        detector = OpenPoseDetector(
+            model_path=args.model_path, model_profile=profile.name,
+            input_heights=[args.input_height] if args.input_height else None, stages=stages,
+            read_net=SyntheticPoseNet if args.synthetic else None
+        )
+        if detector.demo_mode:
+            sys.exit("OpenPose model not found. Please run download_models.py first (or pass --synthetic).")
+        return detector
+
+    if args.labels:
+        with open(args.labels, "r") as f:
+            references = {
+                name: {landmark: tuple(point) for landmark, point in points.items()}
+                for name, points in json.load(f).items() if name in images
+            }
+        reference_source = os.path.basename(args.labels)
+    else:
+        full = make_detector(0)
+        references = {name: detected_points(full.detect_pose(image)["landmarks"]) for name, image in images.items()}
+        reference_source = "full network"
+
+    rows = []
+    # 0 is the unmodified network, which still computes the PAF branch of the final stage
+    for stages in [0] + list(range(1, profile.stages + 1)):
+        detector = make_detector(stages)
+        print(f"Stage {stages or 'all'}: {len(images)} image(s)...", flush=True)
+        timing = detector.benchmark(runs=args.runs)[-1]
+        predictions = {
+            name: detected_points(detector.detect_pose(image)["landmarks"]) for name, image in images.items()
+        }
+        rows.append({
+            "stages": stages or profile.stages,
+            "output": detector.output_layer or "full output (heatmaps and PAFs)",
+            "input": timing["input"],
+            "forward_ms": timing["mean_ms"],
+            "min_forward_ms": timing["min_ms"],
+            "accuracy": score(predictions, references),
+        })
+    return rows, reference_source
+
+
+def print_table(rows, reference_source):
+    columns = ["stages", "output", "forward ms", "vs full", "detected", "mean err", "p90 err"]
+    columns += [f"PCK@{threshold}" for threshold in PCK_THRESHOLDS]
+    full_ms = rows[0]["forward_ms"]
+    lines = []
+    for row in rows:
+        accuracy = row["accuracy"] or {}
+
+        def cell(key, percent=False):
+            value = accuracy.get(key)
+            if value is None:
+                return "-"
+            return f"{value * 100:.1f}%" if percent else f"{value:.3f}"
+
+        lines.append([
+            str(row["stages"]), row["output"], f"{row['forward_ms']:.1f}",
+            f"{row['forward_ms'] / full_ms:.2f}x" if full_ms else "-",
+            cell("detection_rate", True), cell("mean_error"), cell("p90_error"),
+        ] + [cell(f"pck@{threshold}", True) for threshold in PCK_THRESHOLDS])
+
+    widths = [max(len(column), *(len(line[i]) for line in lines)) for i, column in enumerate(columns)]
+    print(f"\nInput {rows[0]['input']}, errors relative to torso length, reference: {reference_source}")
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)).rstrip())
+    for line in lines:
+        print("  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy-vs-latency table of the OpenPose network stages")
+    parser.add_argument("--images", required=True, help="Directory of photos to run the network on")
+    parser.add_argument("--labels", help="JSON of ground-truth landmarks per image (default: the full network)")
+    parser.add_argument("--model", default="auto", help="Model profile: coco, mpi_faster or auto")
+    parser.add_argument("--model-path", default="models/openpose", help="Model directory relative to backend/")
+    parser.add_argument("--input-height", type=int, default=0, help="Network input height (default: native)")
+    parser.add_argument("--runs", type=int, default=10, help="Timed forward passes per stage")
+    parser.add_argument("--threads", type=int, default=0, help="OpenCV threads (default: all cores)")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Use the synthetic stand-in network (checks the tool, not the model)")
+    parser.add_argument("--json", help="Also write the table to this JSON file")
+    args = parser.parse_args()
+
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+    rows, reference_source = sweep(args)
+    print_table(rows, reference_source)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"reference": reference_source, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
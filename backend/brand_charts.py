@@ -0,0 +1,387 @@
+"""
+Size charts of many brands, sized in one vectorized pass per garment type
+
+Brand charts are kept as one JSON file per brand in a directory (same format
+as data/size_charts.json, the file name is the brand ID), or compiled into a
+single binary file that is memory-mapped on load, so opening it costs the
+same for ten brands or ten thousand.
+
+Per garment type, the charts of all brands are stacked into NaN-padded
+arrays (brand x size x weighted measurement) with sizes stably sorted by the
+primary measurement, so the best size for every requested brand is one
+argmin, using the same rules as SizeChartIndex for a single chart.
+
+Usage:
+    python brand_charts.py build SOURCE_DIR OUTPUT_FILE
+    python brand_charts.py info CHARTS_PATH [--brand BRAND ...]
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from size_prediction import DEFAULT_FIT, NEAREST_SIZE_FRACTION, SIZE_RANGE_FRACTIONS, size_label
+
+MAGIC = b"FFBRAND1"
+
+# Array offsets in the binary file are aligned for direct memory-mapped access
+ALIGNMENT = 64
+
+
+def _data_start(header_length):
+    """File offset of the first array: after magic, header length and header, aligned"""
+    return -(-(16 + header_length) // ALIGNMENT) * ALIGNMENT
+
+
+class BrandChartStore:
+    """
+    Size charts of many brands, indexed by brand and garment type
+
+    Use BrandChartStore.load (a directory of brand JSON files or a binary file
+    written by save) rather than the constructor.
+
+    Args:
+        measurements: Measurement names, in the order of the measurement vector
+        arrays: Dictionary of arrays ("brands", and "<garment>/<field>" per garment type)
+        source: Where the charts were loaded from
+    """
+
+    # Per-garment arrays (see _compile)
+    GARMENT_FIELDS = (
+        "values", "slot_measurement", "weights", "primary", "primary_measurement",
+        "labels", "eu", "uk", "brand_rows", "row_of_brand",
+    )
+
+    def __init__(self, measurements, arrays, source=None):
+        self.measurements = list(measurements)
+        self.source = source
+        self._brands = arrays["brands"]
+        self._garments = {}
+        for name in arrays:
+            garment, _, field = name.rpartition("/")
+            if garment:
+                self._garments.setdefault(garment, {})[field] = arrays[name]
+
+    @property
+    def garments(self):
+        return list(self._garments)
+
+    def __len__(self):
+        return len(self._brands)
+
+    def brands(self):
+        """All brand IDs, sorted"""
+        return [brand.decode("utf-8") for brand in self._brands]
+
+    @classmethod
+    def load(cls, path):
+        """Load brand charts from a directory of brand JSON files or a compiled binary file"""
+        if os.path.isdir(path):
+            return cls.from_directory(path)
+        return cls.open(path)
+
+    @classmethod
+    def from_directory(cls, path):
+        """Compile the brand charts of a directory (one <brand>.json size chart file per brand)"""
+        charts = {}
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith(".json"):
+                with open(os.path.join(path, filename), "r") as f:
+                    charts[filename[:-len(".json")]] = json.load(f)
+        measurements, arrays = cls._compile(charts)
+        return cls(measurements, arrays, source=path)
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a binary file written by save"""
+        with open(path, "rb") as f:
+            magic, header_length = struct.unpack("<8sQ", f.read(16))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a brand chart file")
+            header = json.loads(f.read(header_length).decode("utf-8"))
+
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        data_start = _data_start(header_length)
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            start = data_start + spec["offset"]
+            data = buffer[start:start + count * dtype.itemsize]
+            arrays[name] = data.view(dtype).reshape(spec["shape"])
+        return cls(header["measurements"], arrays, source=path)
+
+    def save(self, path):
+        """Write the charts as a binary file that open can memory-map"""
+        arrays = {"brands": self._brands}
+        for garment, fields in self._garments.items():
+            for field in self.GARMENT_FIELDS:
+                arrays[f"{garment}/{field}"] = np.ascontiguousarray(fields[field])
+
+        # Array offsets are relative to the (aligned) end of the header
+        specs, offset = {}, 0
+        for name, array in arrays.items():
+            specs[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        header_bytes = json.dumps({"measurements": self.measurements, "arrays": specs}).encode("utf-8")
+        data_start = _data_start(len(header_bytes))
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<8sQ", MAGIC, len(header_bytes)))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + specs[name]["offset"])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _compile(cls, charts):
+        """
+        Stack the charts of all brands into per-garment arrays
+
+        Args:
+            charts: {brand: size charts} in the data/size_charts.json format
+
+        Returns:
+            (measurements, arrays)
+        """
+        brands = sorted(charts)
+        brand_index = {brand: i for i, brand in enumerate(brands)}
+
+        # Garment charts per garment type: [(brand, size_mapping, fit)]
+        by_garment = {}
+        for brand in brands:
+            for garment, chart in charts[brand].items():
+                if not isinstance(chart, dict):
+                    continue
+                size_mapping = chart.get("size_mapping") or {}
+                fit = chart.get("fit") or DEFAULT_FIT.get(garment)
+                if size_mapping and fit:
+                    by_garment.setdefault(garment, []).append((brand, size_mapping, fit))
+
+        measurements = sorted({
+            name for entries in by_garment.values() for _, _, fit in entries
+            for name in [fit["primary"], *fit["weights"]]
+        })
+        measurement_index = {name: i for i, name in enumerate(measurements)}
+        # Unused slots point at an extra measurement that is always 0
+        padding = len(measurements)
+
+        encoded = [brand.encode("utf-8") for brand in brands]
+        arrays = {"brands": np.array(encoded, dtype=bytes) if encoded else np.zeros(0, dtype="S1")}
+        for garment, entries in by_garment.items():
+            num_brands = len(entries)
+            num_sizes = max(len(size_mapping) for _, size_mapping, _ in entries)
+            num_slots = max(len(fit["weights"]) for _, _, fit in entries)
+
+            values = np.full((num_brands, num_sizes, num_slots), np.nan)
+            slot_measurement = np.full((num_brands, num_slots), padding, dtype=np.int16)
+            weights = np.zeros((num_brands, num_slots))
+            primary = np.full((num_brands, num_sizes), np.nan)
+            primary_measurement = np.zeros(num_brands, dtype=np.int16)
+            labels, eu, uk = [], [], []
+            brand_rows = np.zeros(num_brands, dtype=np.int32)
+            row_of_brand = np.full(len(brands), -1, dtype=np.int32)
+
+            for row, (brand, size_mapping, fit) in enumerate(entries):
+                names = list(fit["weights"])
+                codes = list(size_mapping)
+                order = np.argsort([size_mapping[code][fit["primary"]] for code in codes], kind="stable")
+                codes = [codes[i] for i in order]
+
+                values[row, :len(codes), :len(names)] = [[size_mapping[code][name] for name in names] for code in codes]
+                values[row, :len(codes), len(names):] = 0.0
+                slot_measurement[row, :len(names)] = [measurement_index[name] for name in names]
+                weights[row, :len(names)] = [fit["weights"][name] for name in names]
+                primary[row, :len(codes)] = [size_mapping[code][fit["primary"]] for code in codes]
+                primary_measurement[row] = measurement_index[fit["primary"]]
+                padded = [""] * (num_sizes - len(codes))
+                labels.append([size_label(code) for code in codes] + padded)
+                eu.append([str(size_mapping[code].get("eu_size", "")) for code in codes] + padded)
+                uk.append([str(size_mapping[code].get("uk_size", "")) for code in codes] + padded)
+                brand_rows[row] = brand_index[brand]
+                row_of_brand[brand_index[brand]] = row
+
+            arrays[f"{garment}/values"] = values
+            arrays[f"{garment}/slot_measurement"] = slot_measurement
+            arrays[f"{garment}/weights"] = weights
+            arrays[f"{garment}/primary"] = primary
+            arrays[f"{garment}/primary_measurement"] = primary_measurement
+            arrays[f"{garment}/labels"] = cls._encode_strings(labels)
+            arrays[f"{garment}/eu"] = cls._encode_strings(eu)
+            arrays[f"{garment}/uk"] = cls._encode_strings(uk)
+            arrays[f"{garment}/brand_rows"] = brand_rows
+            arrays[f"{garment}/row_of_brand"] = row_of_brand
+        return measurements, arrays
+
+    @staticmethod
+    def _encode_strings(rows):
+        """Fixed-width byte strings, so they can be memory-mapped like the numbers"""
+        encoded = [[value.encode("utf-8") for value in row] for row in rows]
+        width = max([1] + [len(value) for row in encoded for value in row])
+        return np.array(encoded, dtype=f"S{width}")
+
+    def _rows(self, garment, brands):
+        """Rows of the requested brands in a garment's arrays (unknown brands and brands without the garment are skipped)"""
+        fields = self._garments[garment]
+        if brands is None:
+            return np.arange(len(fields["brand_rows"]))
+
+        width = self._brands.dtype.itemsize
+        keys = [brand.encode("utf-8") for brand in brands]
+        keys = np.array([key for key in keys if len(key) <= width], dtype=self._brands.dtype)
+        if len(keys) == 0 or len(self._brands) == 0:
+            return np.zeros(0, dtype=np.intp)
+        positions = np.minimum(np.searchsorted(self._brands, keys), len(self._brands) - 1)
+        rows = fields["row_of_brand"][positions[self._brands[positions] == keys]]
+        return rows[rows >= 0]
+
+    def best_sizes(self, garment, measurements, brands=None):
+        """
+        Best size of one garment type for many brands at once
+
+        Args:
+            garment: Garment type as named in the charts ("jeans", "dresses", ...)
+            measurements: Body measurements by name ("waist", "hip", "bust", ...)
+            brands: Brand IDs to size for (all brands with that garment if omitted)
+
+        Returns:
+            {brand: {"us", "eu", "uk"}}; between two sizes "us" is a range ("4-6")
+            and eu/uk are empty. Brands whose fit needs a measurement that is
+            missing or None are left out
+        """
+        if garment not in self._garments:
+            return {}
+        fields = self._garments[garment]
+        rows = self._rows(garment, brands)
+        if len(rows) == 0:
+            return {}
+
+        x = np.zeros(len(self.measurements) + 1)
+        given = np.ones(len(self.measurements) + 1, dtype=bool)
+        for i, name in enumerate(self.measurements):
+            if measurements.get(name) is not None:
+                x[i] = measurements[name]
+            else:
+                given[i] = False
+
+        # Brands whose fit needs a measurement that wasn't given are left out (as in SizeChartIndex)
+        rows = rows[given[fields["slot_measurement"][rows]].all(axis=1) & given[fields["primary_measurement"][rows]]]
+        if len(rows) == 0:
+            return {}
+
+        # Weighted distance of every size of every brand, summed slot by slot;
+        # padding sizes are NaN and never win
+        values = fields["values"][rows]
+        diff = np.abs(values - x[fields["slot_measurement"][rows]][:, None, :]) * fields["weights"][rows][:, None, :]
+        scores = diff[:, :, 0].copy()
+        for slot in range(1, diff.shape[2]):
+            scores += diff[:, :, slot]
+        scores[np.isnan(scores)] = np.inf
+        best = np.argmin(scores, axis=1)
+
+        # Between sizes: the first pair of neighbouring sizes enclosing the primary measurement
+        # where one of them is close enough to pick (same rules as SizeChartIndex)
+        primary = fields["primary"][rows]
+        xp = x[fields["primary_measurement"][rows]][:, None]
+        lower, upper = primary[:, :-1], primary[:, 1:]
+        lower_diff = np.abs(lower - xp)
+        upper_diff = np.abs(upper - xp)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lower_fraction = lower_diff / (upper - lower)
+            upper_fraction = upper_diff / (upper - lower)
+        candidate = (lower <= xp) & (xp <= upper) & (
+            (lower_fraction <= NEAREST_SIZE_FRACTION) | (upper_fraction <= NEAREST_SIZE_FRACTION)
+        )
+        between = candidate.any(axis=1)
+        first = candidate.argmax(axis=1)
+        k = np.arange(len(rows))
+        low, high = SIZE_RANGE_FRACTIONS
+        is_range = between & (low < lower_fraction[k, first]) & (lower_fraction[k, first] < high) \
+            & (low < upper_fraction[k, first]) & (upper_fraction[k, first] < high)
+        picked = np.where(between, np.where(upper_diff[k, first] < lower_diff[k, first], first + 1, first), best)
+
+        labels = fields["labels"][rows]
+        eu = fields["eu"][rows, picked]
+        uk = fields["uk"][rows, picked]
+        sizes = {}
+        for i, brand_row in enumerate(fields["brand_rows"][rows]):
+            brand = self._brands[brand_row].decode("utf-8")
+            if is_range[i]:
+                label = f"{labels[i, first[i]].decode('utf-8')}-{labels[i, first[i] + 1].decode('utf-8')}"
+                sizes[brand] = {"us": label, "eu": "", "uk": ""}
+            else:
+                sizes[brand] = {
+                    "us": labels[i, picked[i]].decode("utf-8"),
+                    "eu": eu[i].decode("utf-8"),
+                    "uk": uk[i].decode("utf-8")
+                }
+        return sizes
+
+    def predict(self, measurements, brands=None):
+        """
+        Best sizes of every garment type for many brands
+
+        Args:
+            measurements: Body measurements by name ("waist", "hip", "bust", ...)
+            brands: Brand IDs to size for (all brands if omitted)
+
+        Returns:
+            {garment: {brand: {"us", "eu", "uk"}}} (see best_sizes)
+        """
+        return {garment: self.best_sizes(garment, measurements, brands) for garment in self._garments}
+
+    def describe(self):
+        return {
+            "source": self.source,
+            "brands": len(self._brands),
+            "garments": {garment: int(len(fields["brand_rows"])) for garment, fields in self._garments.items()},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect multi-brand size chart files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Compile a directory of <brand>.json charts into a binary file")
+    build.add_argument("source", help="Directory with one size chart JSON file per brand")
+    build.add_argument("output", help="Binary chart file to write")
+    info = commands.add_parser("info", help="Show what a chart directory or file holds and how fast it loads")
+    info.add_argument("path", help="Chart directory or binary file")
+    info.add_argument("--brand", action="append", help="Brand to size a sample person for (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        store = BrandChartStore.from_directory(args.source)
+        store.save(args.output)
+        print(f"Compiled {len(store)} brands into {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB, "
+              f"{(time.perf_counter() - start):.1f} s)")
+        return
+
+    start = time.perf_counter()
+    try:
+        store = BrandChartStore.load(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Loaded in {(time.perf_counter() - start) * 1000.0:.1f} ms: {json.dumps(store.describe())}")
+
+    sample = {"waist": 74.0, "hip": 100.0, "bust": 90.0}
+    for garment in store.garments:
+        start = time.perf_counter()
+        sizes = store.best_sizes(garment, sample, args.brand)
+        print(f"{garment}: sized {len(sizes)} brands in {(time.perf_counter() - start) * 1000.0:.2f} ms")
+        for brand in (args.brand or []):
+            if brand in sizes:
+                print(f"  {brand}: {sizes[brand]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Offline bulk sizing over a manifest of front/side photo pairs
+
+Re-runs the sizing pipeline over archived photos, e.g. after a size chart or
+model change. Pairs are sized in chunks on process inference workers (one
+network per worker, every chunk a single batched forward pass), and results
+are streamed to a CSV file, or to Parquet files when pyarrow is installed.
+
+The manifest is a CSV file with a header, or a JSONL file, with the columns
+`front`, `side` and `height_cm` and an optional `id` (defaults to the row
+number). Relative paths are resolved against the manifest's directory.
+
+Progress is recorded in a checkpoint file next to the output, so an
+interrupted run picks up where it stopped when started again. Results are
+written before their pairs are checkpointed, so after a crash a few pairs may
+appear twice in the output, but none are lost.
+
+Usage:
+    python bulk_size.py MANIFEST OUTPUT [--workers N] [--batch-size N] [--charts PATH]
+                        [--checkpoint PATH] [--retry-failed] [--allow-demo]
+
+OUTPUT ending in .parquet is a directory of Parquet part files.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+MEASUREMENT_COLUMNS = ["waist_cm", "hip_cm", "inseam_cm", "bust_cm"]
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+
+def read_manifest(path):
+    """
+    Read the photo pairs of a CSV or JSONL manifest (see sizing_pipeline.parse_manifest)
+
+    Returns:
+        List of {"id", "front", "side", "height_cm"} dicts with absolute image paths
+    """
+    from sizing_pipeline import parse_manifest
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", newline="") as f:
+        pairs = parse_manifest(f, jsonl=path.lower().endswith((".jsonl", ".ndjson")))
+    for pair in pairs:
+        pair["front"] = os.path.join(base_dir, pair["front"])
+        pair["side"] = os.path.join(base_dir, pair["side"])
+    return pairs
+
+
+class Checkpoint:
+    """
+    Append-only record of the pairs that have been written to the output
+
+    Args:
+        path: Checkpoint file (JSONL, one {"id", "status"} line per pair)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.status = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    self.status[entry["id"]] = entry["status"]
+        self._file = open(path, "a")
+
+    def is_done(self, pair_id, retry_failed=False):
+        status = self.status.get(pair_id)
+        return status == "ok" or (status is not None and not retry_failed)
+
+    def record(self, rows):
+        for row in rows:
+            self.status[row["id"]] = row["status"]
+            self._file.write(json.dumps({"id": row["id"], "status": row["status"]}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class CsvResultWriter:
+    """Appends result rows to a CSV file; rows are on disk when write() returns"""
+
+    def __init__(self, path, columns):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns)
+        if new_file:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        """Write rows and return the rows that are now stored"""
+        self._writer.writerows(rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return rows
+
+    def close(self):
+        self._file.close()
+        return []
+
+
+class ParquetResultWriter:
+    """
+    Writes result rows as Parquet part files into a directory
+
+    Every part is a complete file, so rows are buffered until rows_per_file
+    of them are collected (or the writer is closed).
+    """
+
+    def __init__(self, path, columns, rows_per_file=1000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow), or use a .csv output")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.columns = columns
+        self.rows_per_file = rows_per_file
+        self._rows = []
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, rows):
+        """Buffer rows and return the rows that are now stored"""
+        self._rows.extend(rows)
+        if len(self._rows) < self.rows_per_file:
+            return []
+        return self._flush()
+
+    def close(self):
+        return self._flush() if self._rows else []
+
+    def _flush(self):
+        rows, self._rows = self._rows, []
+        table = self._pa.Table.from_pylist([{column: row.get(column) for column in self.columns} for row in rows])
+        part = os.path.join(self.path, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns()}.parquet")
+        self._pq.write_table(table, part + ".tmp")
+        os.replace(part + ".tmp", part)
+        return rows
+
+
+def result_row(pair, result, garment_names):
+    """Flatten the sizing result of a pair into an output row"""
+    row = {
+        "id": pair["id"],
+        "front": pair["front"],
+        "side": pair["side"],
+        "height_cm": pair["height_cm"],
+        "status": "error" if "error" in result else "ok",
+        "error": result.get("error", ""),
+    }
+    measurements = result.get("measurements", {})
+    for column in MEASUREMENT_COLUMNS:
+        row[column] = measurements.get(column[:-len("_cm")])
+    sizes = result.get("sizes", {})
+    for name in garment_names:
+        for system in ("us", "eu", "uk"):
+            row[f"{name}_{system}"] = sizes.get(name, {}).get(system, "")
+    return row
+
+
+async def run(args, pairs, writer, checkpoint, garment_names):
+    """Size all pairs on process inference workers, writing results as chunks finish"""
+    from inference import InferenceExecutor
+    from pose_detection import create_detector_pool
+    from sizing_pipeline import size_image_pairs
+
+    executor = InferenceExecutor(create_detector_pool, max_workers=args.workers, mode="process")
+    if executor.model_info["demo_mode"] and not args.allow_demo:
+        executor.shutdown()
+        raise RuntimeError("OpenPose model not loaded (synthetic poses); run download_models.py or pass --allow-demo")
+
+    pairs_per_chunk = max(1, args.batch_size // 2)
+    stats = {"done": 0, "failed": 0, "errors": Counter(), "decode_ms": 0.0, "inference_ms": 0.0, "measure_ms": 0.0}
+    # Keep every worker busy with one chunk queued behind it, without submitting the whole manifest at once
+    in_flight = asyncio.Semaphore(args.workers * 2)
+
+    async def size_chunk(chunk):
+        async with in_flight:
+            try:
+                return chunk, await executor.run(
+                    size_image_pairs,
+                    [(pair["front"], pair["side"], pair["height_cm"]) for pair in chunk],
+                    args.charts
+                )
+            except Exception as e:
+                return chunk, ([{"error": f"Inference worker failed: {str(e)}"}] * len(chunk), {})
+
+    # Pairs without a usable height are reported right away
+    invalid = [pair for pair in pairs if pair["height_cm"] is None or pair["height_cm"] <= 0]
+    valid = [pair for pair in pairs if pair["height_cm"] is not None and pair["height_cm"] > 0]
+    chunks = [valid[i:i + pairs_per_chunk] for i in range(0, len(valid), pairs_per_chunk)]
+
+    def store(rows):
+        checkpoint.record(writer.write(rows))
+        for row in rows:
+            stats["done"] += 1
+            if row["status"] != "ok":
+                stats["failed"] += 1
+                stats["errors"][row["error"]] += 1
+
+    start = time.perf_counter()
+    last_report = start
+    try:
+        if invalid:
+            store([result_row(pair, {"error": "Missing or invalid height_cm"}, garment_names) for pair in invalid])
+
+        for next_chunk in asyncio.as_completed([size_chunk(chunk) for chunk in chunks]):
+            chunk, (results, timings) = await next_chunk
+            store([result_row(pair, result, garment_names) for pair, result in zip(chunk, results)])
+            for stage, ms in timings.items():
+                stats[stage] += ms
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"{stats['done']}/{len(pairs)} pairs, {stats['done'] / (now - start):.1f} pairs/s, "
+                      f"{stats['failed']} failed", flush=True)
+    finally:
+        checkpoint.record(writer.close())
+        executor.shutdown()
+
+    stats["elapsed_s"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Size front/side photo pairs listed in a manifest")
+    parser.add_argument("manifest", help="CSV or JSONL manifest with front, side, height_cm (and optional id) columns")
+    parser.add_argument("output", help="Results file (.csv), or Parquet directory (.parquet)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Process inference workers (default: one per CPU core)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Images per forward pass, two per pair (default: INFERENCE_MAX_BATCH_SIZE)")
+    parser.add_argument("--charts", default=None, help="Size charts to size against (default: data/size_charts.json)")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: OUTPUT.checkpoint)")
+    parser.add_argument("--retry-failed", action="store_true", help="Size pairs that failed in an earlier run again")
+    parser.add_argument("--allow-demo", action="store_true", help="Run even if the OpenPose model is missing")
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+
+    # Workers are spawned and read their settings from the environment: split the cores
+    # between them, warm up the batch size used here and skip the startup benchmark
+    if args.batch_size is not None:
+        os.environ["INFERENCE_MAX_BATCH_SIZE"] = str(max(1, args.batch_size))
+    os.environ["INFERENCE_WORKERS"] = str(args.workers)
+    os.environ.setdefault("OPENPOSE_STARTUP_BENCHMARK_RUNS", "0")
+
+    from config import settings
+    from size_prediction import SizeChartIndex
+    from sizing_pipeline import DEFAULT_SIZE_CHARTS_PATH, load_size_charts, response_garments
+
+    args.batch_size = settings.inference_max_batch_size
+    args.charts = os.path.abspath(args.charts or DEFAULT_SIZE_CHARTS_PATH)
+    garment_names = [name for _, name in response_garments(SizeChartIndex(load_size_charts(args.charts)))]
+    columns = ["id", "front", "side", "height_cm", "status", "error", *MEASUREMENT_COLUMNS]
+    columns += [f"{name}_{system}" for name in garment_names for system in ("us", "eu", "uk")]
+
+    checkpoint = Checkpoint(args.checkpoint or args.output.rstrip("/\\") + ".checkpoint")
+    manifest = read_manifest(args.manifest)
+    pairs = [pair for pair in manifest if not checkpoint.is_done(pair["id"], args.retry_failed)]
+    print(f"{len(manifest)} pairs in manifest, {len(manifest) - len(pairs)} already done, {len(pairs)} to size "
+          f"({args.workers} workers, {args.batch_size} images per batch)")
+    if not pairs:
+        checkpoint.close()
+        return
+
+    try:
+        if args.output.lower().rstrip("/\\").endswith(".parquet"):
+            writer = ParquetResultWriter(args.output, columns)
+        else:
+            writer = CsvResultWriter(args.output, columns)
+        stats = asyncio.run(run(args, pairs, writer, checkpoint, garment_names))
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        checkpoint.close()
+
+    elapsed = stats["elapsed_s"]
+    print(f"Sized {stats['done']} pairs in {elapsed:.1f} s ({stats['done'] / elapsed:.2f} pairs/s), "
+          f"{stats['failed']} failed")
+    worker_ms = stats["decode_ms"] + stats["inference_ms"] + stats["measure_ms"]
+    if worker_ms > 0:
+        print("Worker time: " + ", ".join(
+            f"{stage[:-len('_ms')]} {100.0 * stats[stage] / worker_ms:.0f}%"
+            for stage in ("decode_ms", "inference_ms", "measure_ms")
+        ))
+    for error, count in stats["errors"].most_common(5):
+        print(f"  {count} x {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from brand_charts import BrandChartStore
+from size_prediction import SizeChartIndex
+from sizing_pipeline import DEFAULT_SIZE_CHARTS_PATH, load_size_charts
+
+
+class ChartSnapshot:
+    """
+    One immutable version of the size charts
+
+    A request takes the current snapshot once and uses it until it finishes,
+    so a reload never changes the charts underneath a running request.
+
+    Args:
+        version: Short content hash identifying the chart sources
+        size_index: Compiled SizeChartIndex of the size charts
+        brand_charts: BrandChartStore, or None when brand charts aren't configured
+    """
+
+    __slots__ = ("version", "size_index", "brand_charts", "loaded_at")
+
+    def __init__(self, version, size_index, brand_charts=None):
+        self.version = version
+        self.size_index = size_index
+        self.brand_charts = brand_charts
+        self.loaded_at = time.time()
+
+        # Compiled arrays are shared by all requests on this snapshot
+        for value in vars(size_index).values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+
+
+class ChartRegistry:
+    """
+    Holds the current size chart snapshot and replaces it when the chart sources change
+
+    A reload reads, validates and compiles the new charts off the request
+    path and then swaps the snapshot in one assignment. If the new charts
+    can't be loaded, the previous snapshot stays in place and the error is
+    reported by stats(). Sources are watched by polling their modification
+    times (see watch), and reload can also be triggered directly.
+
+    Args:
+        size_charts_path: Size charts JSON file
+        brand_charts_path: Brand charts directory or file (None disables brand charts)
+    """
+
+    def __init__(self, size_charts_path=DEFAULT_SIZE_CHARTS_PATH, brand_charts_path=None):
+        self.size_charts_path = size_charts_path
+        self.brand_charts_path = brand_charts_path or None
+
+        self._snapshot = ChartSnapshot("none", SizeChartIndex({}))
+        self._signature = None
+        self._reload_lock = threading.Lock()
+
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error = None
+
+    def current(self):
+        """The snapshot to use for a request"""
+        return self._snapshot
+
+    def reload(self, force=False):
+        """
+        Load the chart sources into a new snapshot if they changed
+
+        Args:
+            force: Reload even if the sources look unchanged
+
+        Returns:
+            True if a new snapshot was installed
+
+        Raises:
+            Exception: If the new charts can't be loaded (the current snapshot stays in use)
+        """
+        with self._reload_lock:
+            signature = self._source_signature()
+            if not force and signature == self._signature:
+                return False
+
+            try:
+                snapshot = self._load(signature)
+            except Exception as e:
+                self.failed_reloads += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                # Don't retry the same broken sources on every check
+                self._signature = signature
+                raise
+
+            self._signature = signature
+            self.last_error = None
+            if snapshot.version == self._snapshot.version:
+                return False
+            self._snapshot = snapshot
+            self.reloads += 1
+            print(f"Size charts loaded: version {snapshot.version}, garments {snapshot.size_index.garments}"
+                  + (f", {len(snapshot.brand_charts)} brands" if snapshot.brand_charts is not None else ""))
+            return True
+
+    async def watch(self, interval_seconds):
+        """Poll the chart sources and reload them when they change (runs until cancelled)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await loop.run_in_executor(None, self.reload)
+            except Exception as e:
+                print(f"Error reloading size charts, keeping version {self._snapshot.version}: {e}")
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "loaded_at": snapshot.loaded_at,
+            "garments": snapshot.size_index.garments,
+            "brand_charts": snapshot.brand_charts.describe() if snapshot.brand_charts is not None else None,
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_error": self.last_error,
+        }
+
+    def _load(self, signature):
+        """Read, validate and compile the chart sources into a snapshot"""
+        size_charts = load_size_charts(self.size_charts_path)
+        if not isinstance(size_charts, dict):
+            raise ValueError("Size charts must be a JSON object of garment charts")
+        size_index = SizeChartIndex(size_charts)
+        if not size_index.garments:
+            raise ValueError("Size charts contain no usable garment chart")
+        # Size a sample person once, so charts that compile but can't size are refused too
+        size_index.determine_sizes({name: 1.0 for name in size_index.measurements})
+
+        brand_charts = None
+        if self.brand_charts_path:
+            brand_charts = BrandChartStore.load(self.brand_charts_path)
+
+        with open(self.size_charts_path, "rb") as f:
+            digest = hashlib.sha256(f.read())
+        digest.update(repr(signature[1:]).encode("utf-8"))
+        return ChartSnapshot(digest.hexdigest()[:12], size_index, brand_charts)
+
+    def _source_signature(self):
+        """Modification time and size of every chart source"""
+        signature = [self._stat(self.size_charts_path)]
+        if self.brand_charts_path:
+            if os.path.isdir(self.brand_charts_path):
+                with os.scandir(self.brand_charts_path) as entries:
+                    signature += sorted(
+                        (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                        for entry in entries if entry.name.endswith(".json")
+                    )
+            else:
+                signature.append(self._stat(self.brand_charts_path))
+        return tuple(signature)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+            return (os.path.basename(path), stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return (os.path.basename(path), None, None)
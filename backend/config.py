@@ -0,0 +1,192 @@
+import os
+from dotenv import load_dotenv
+
+# Allow a local .env file next to the backend to override the defaults below
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+
+
+def _env_str(name, default):
+    value = os.environ.get(name)
+    return value.strip() if value is not None and value.strip() else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"WARNING: Invalid integer for {name}={value!r}, using default {default}")
+        return default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"WARNING: Invalid number for {name}={value!r}, using default {default}")
+        return default
+
+
+def _env_int_list(name, default):
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return list(default)
+    try:
+        return [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        print(f"WARNING: Invalid integer list for {name}={value!r}, using default {list(default)}")
+        return list(default)
+
+
+class Settings:
+    """
+    Runtime configuration for the backend, read from environment variables
+
+    Environment variables:
+        INFERENCE_EXECUTOR: "thread" or "process" - where OpenPose inference runs
+        INFERENCE_WORKERS: Number of inference workers, each with its own detector
+            (defaults to half the CPU cores)
+        INFERENCE_MAX_BATCH_SIZE: Maximum number of images per batched forward pass
+        INFERENCE_MAX_WAIT_MS: How long an image may wait for its batch to fill up
+        POSE_BACKEND: "openpose", or "synthetic" for the deterministic stand-in network of
+            synthetic_pose.py (load testing without the model)
+        SYNTHETIC_INFERENCE_MS: Simulated duration of a synthetic backend forward pass
+        SYNTHETIC_INFERENCE_PER_IMAGE_MS: Simulated duration added per image of the batch
+        OPENPOSE_MODEL: Model profile to run (see pose_models): "coco", "mpi_faster", or "auto"
+            for the first one whose files are available (COCO preferred)
+        OPENPOSE_STAGES: Network stages to run (0 runs all of them); the heatmaps of the last
+            stage run are used and the layers they don't depend on are pruned from the network
+        OPENPOSE_DNN_BACKEND: OpenCV DNN backend (default, opencv, openvino, cuda, vulkan, halide)
+        OPENPOSE_DNN_TARGET: OpenCV DNN target (cpu, cpu_fp16, opencl, opencl_fp16, cuda, cuda_fp16, ...)
+        OPENPOSE_NUM_THREADS: OpenCV intra-op threads per process
+            (defaults to the CPU cores divided among the inference workers)
+        WARMUP_PASSES: Warm-up forward passes per input shape and batch size at startup (0 disables)
+        OPENPOSE_STARTUP_BENCHMARK_RUNS: Forward passes timed at startup (0 disables the benchmark)
+        MODEL_CACHE_ENABLED: Load OpenPose from a prepared fast-loading copy (prepared on first start)
+        MODEL_CACHE_DIR: Directory holding the prepared models
+        MODEL_CACHE_FP16: Store the prepared weights in half precision
+        OPENPOSE_INPUT_HEIGHTS: Comma-separated network input heights (e.g. 256, 368, 512);
+            several values run every image at each scale and average the heatmaps
+            (defaults to the model's native input height)
+        OPENPOSE_INPUT_ASPECT: Network input width divided by height (e.g. 0.75 for portrait photos)
+        OPENPOSE_RESIZE_MODE: "letterbox" (keep the aspect ratio, pad the rest) or "stretch"
+        PERSON_CROP_ENABLED: Two-pass detection: locate the person in a coarse pass, then run the
+            input heights on a crop around them (for photos where the person fills part of the frame)
+        PERSON_CROP_INPUT_HEIGHT: Network input height of the coarse pass (0: half the model's native height)
+        PERSON_CROP_MARGIN: Margin around the located keypoints, relative to the person's size
+        PERSON_CROP_MIN_GAIN: Minimum magnification of the person a crop must give; below it the
+            full frame is used and the coarse pass is fused in as an extra scale
+        MAX_UPLOAD_MB: Largest accepted image upload; larger request bodies are refused while streaming
+        MAX_IMAGE_MEGAPIXELS: Largest accepted image size, checked before decoding
+        DECODE_MAX_SIDE: Longest side larger uploads are decoded at (JPEG draft scaling / integer
+            reduction, then resized to exactly this size whatever the format; 0 decodes at full resolution)
+        SIDE_VIEW_WORKING_WIDTH: Image width the side view silhouette is segmented at
+        PEAK_EXTRACTION_MODE: "lowres" (vectorized, sub-pixel) or "reference" (full-size upsampling)
+        POSE_CACHE_MAX_ENTRIES: Maximum number of cached pose results (0 disables the cache)
+        POSE_CACHE_MAX_MB: Memory cap for cached pose results
+        POSE_CACHE_TTL_SECONDS: How long a cached pose result stays valid
+        DEBUG_ARTIFACT_SAMPLE_RATE: Fraction of /predict-size/ requests that render debug images
+            without asking for them (the "debug" form field always does)
+        DEBUG_ARTIFACT_MAX_SIDE: Longest side of rendered debug images
+        DEBUG_ARTIFACT_MAX_ENTRIES: Maximum number of stored debug artifacts (0 disables them)
+        DEBUG_ARTIFACT_MAX_MB: Memory cap for stored debug artifacts
+        DEBUG_ARTIFACT_TTL_SECONDS: How long a debug artifact can be fetched
+        BATCH_MAX_SUBJECTS: Most photo pairs accepted by one /predict-size/batch request
+        BATCH_MAX_UPLOAD_MB: Largest accepted /predict-size/batch request body
+        BATCH_CONCURRENCY: Photo pairs of a batch request sized at the same time
+        BRAND_CHARTS_PATH: Brand size charts, a directory of <brand>.json files or a file built
+            with brand_charts.py (unset disables brand sizing)
+        CHART_RELOAD_INTERVAL_SECONDS: How often the chart sources are checked for changes
+            (0 disables the watcher; POST /admin/reload-charts still works)
+        ADMIN_TOKEN: Token expected in the X-Admin-Token header of /admin endpoints
+            (unset disables them)
+        METRICS_ENABLED: Record per-stage latency metrics and serve them at /metrics
+        TRACING_ENABLED: Trace /detect-pose/ and /predict-size/ requests and return their stage
+            durations in a Server-Timing header
+        TRACE_FILE: File the traces are appended to in the Chrome trace event format (unset disables it)
+        PROFILE_SAMPLE_INTERVAL_MS: Sampling interval of requests profiled with profile=sample
+    """
+
+    def __init__(self):
+        self.inference_executor = _env_str("INFERENCE_EXECUTOR", "thread").lower()
+        self.inference_workers = max(1, _env_int("INFERENCE_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+        self.inference_max_batch_size = max(1, _env_int("INFERENCE_MAX_BATCH_SIZE", 4))
+        self.inference_max_wait_ms = max(0, _env_int("INFERENCE_MAX_WAIT_MS", 10))
+
+        self.pose_backend = _env_str("POSE_BACKEND", "openpose").lower()
+        self.synthetic_inference_ms = max(0.0, _env_float("SYNTHETIC_INFERENCE_MS", 0.0))
+        self.synthetic_inference_per_image_ms = max(0.0, _env_float("SYNTHETIC_INFERENCE_PER_IMAGE_MS", 0.0))
+
+        self.openpose_model = _env_str("OPENPOSE_MODEL", "auto").lower()
+        self.openpose_stages = max(0, _env_int("OPENPOSE_STAGES", 0))
+
+        self.dnn_backend = _env_str("OPENPOSE_DNN_BACKEND", "default").lower()
+        self.dnn_target = _env_str("OPENPOSE_DNN_TARGET", "cpu").lower()
+        cpu_count = os.cpu_count() or 1
+        threads_per_worker = max(1, cpu_count // self.inference_workers)
+        self.dnn_num_threads = max(1, _env_int("OPENPOSE_NUM_THREADS", threads_per_worker))
+        self.warmup_passes = max(0, _env_int("WARMUP_PASSES", 1))
+        self.startup_benchmark_runs = max(0, _env_int("OPENPOSE_STARTUP_BENCHMARK_RUNS", 3))
+
+        self.model_cache_enabled = _env_bool("MODEL_CACHE_ENABLED", True)
+        self.model_cache_dir = _env_str(
+            "MODEL_CACHE_DIR",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "cache")
+        )
+        self.model_cache_fp16 = _env_bool("MODEL_CACHE_FP16", True)
+
+        self.input_heights = [h for h in _env_int_list("OPENPOSE_INPUT_HEIGHTS", []) if h > 0]
+        self.input_aspect = _env_float("OPENPOSE_INPUT_ASPECT", 1.0)
+        if self.input_aspect <= 0:
+            self.input_aspect = 1.0
+        self.resize_mode = _env_str("OPENPOSE_RESIZE_MODE", "letterbox").lower()
+        self.person_crop_enabled = _env_bool("PERSON_CROP_ENABLED", False)
+        self.person_crop_input_height = max(0, _env_int("PERSON_CROP_INPUT_HEIGHT", 0))
+        self.person_crop_margin = max(0.0, _env_float("PERSON_CROP_MARGIN", 0.15))
+        self.person_crop_min_gain = max(1.0, _env_float("PERSON_CROP_MIN_GAIN", 1.25))
+        self.max_upload_bytes = max(0, _env_int("MAX_UPLOAD_MB", 20)) * 1024 * 1024
+        self.max_image_pixels = int(max(0.0, _env_float("MAX_IMAGE_MEGAPIXELS", 50.0)) * 1_000_000)
+        self.decode_max_side = max(0, _env_int("DECODE_MAX_SIDE", 1024))
+
+        self.side_view_working_width = max(64, _env_int("SIDE_VIEW_WORKING_WIDTH", 480))
+
+        self.peak_extraction_mode = _env_str("PEAK_EXTRACTION_MODE", "lowres").lower()
+
+        self.pose_cache_max_entries = max(0, _env_int("POSE_CACHE_MAX_ENTRIES", 256))
+        self.pose_cache_max_mb = max(0, _env_int("POSE_CACHE_MAX_MB", 16))
+        self.pose_cache_ttl_seconds = max(0, _env_int("POSE_CACHE_TTL_SECONDS", 600))
+
+        self.debug_artifact_sample_rate = min(1.0, max(0.0, _env_float("DEBUG_ARTIFACT_SAMPLE_RATE", 0.0)))
+        self.debug_artifact_max_side = max(64, _env_int("DEBUG_ARTIFACT_MAX_SIDE", 640))
+        self.debug_artifact_max_entries = max(0, _env_int("DEBUG_ARTIFACT_MAX_ENTRIES", 64))
+        self.debug_artifact_max_mb = max(0, _env_int("DEBUG_ARTIFACT_MAX_MB", 32))
+        self.debug_artifact_ttl_seconds = max(0, _env_int("DEBUG_ARTIFACT_TTL_SECONDS", 900))
+
+        self.batch_max_subjects = max(1, _env_int("BATCH_MAX_SUBJECTS", 100))
+        self.batch_max_upload_bytes = max(0, _env_int("BATCH_MAX_UPLOAD_MB", 200)) * 1024 * 1024
+        self.batch_concurrency = max(1, _env_int("BATCH_CONCURRENCY", 8))
+
+        self.brand_charts_path = _env_str("BRAND_CHARTS_PATH", "")
+        self.chart_reload_interval_seconds = max(0.0, _env_float("CHART_RELOAD_INTERVAL_SECONDS", 10.0))
+
+        self.admin_token = _env_str("ADMIN_TOKEN", "")
+
+        self.metrics_enabled = _env_bool("METRICS_ENABLED", True)
+        self.tracing_enabled = _env_bool("TRACING_ENABLED", True)
+        self.trace_file = _env_str("TRACE_FILE", "")
+        self.profile_sample_interval_ms = max(1.0, _env_float("PROFILE_SAMPLE_INTERVAL_MS", 5.0))
+
+
+settings = Settings()
@@ -0,0 +1,133 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class DebugArtifactStore:
+    """
+    Bounded in-memory store for debug artifacts (rendered images, profiles, ...)
+
+    Artifacts are produced after the response has been sent, so a request
+    first reserves an ID that it can hand to the client and the artifact is
+    filled in later. Entries are evicted in LRU order when either the entry
+    limit or the memory cap is exceeded, and expire after `ttl_seconds`.
+
+    Artifacts are written from worker threads and read from the event loop,
+    so all access goes through a lock.
+
+    Args:
+        max_entries: Maximum number of stored artifacts (0 disables the store)
+        max_bytes: Memory cap for stored artifacts
+        ttl_seconds: Time-to-live of an artifact (0 means no expiry)
+    """
+
+    def __init__(self, max_entries=64, max_bytes=32 * 1024 * 1024, ttl_seconds=900):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        # artifact_id -> (expires_at, data or None while pending, media_type)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.stored = 0
+        self.evicted = 0
+        self.served = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def reserve(self):
+        """
+        Reserve an ID for an artifact that will be stored later
+
+        Returns:
+            The artifact ID, or None when the store is disabled
+        """
+        if not self.enabled:
+            return None
+        artifact_id = secrets.token_urlsafe(16)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            self._entries[artifact_id] = (expires_at, None, None)
+            self._evict()
+        return artifact_id
+
+    def put(self, artifact_id, data, media_type):
+        """
+        Store the artifact for a reserved ID
+
+        Artifacts larger than the memory cap, or whose reservation was already
+        evicted, are dropped.
+        """
+        with self._lock:
+            entry = self._entries.get(artifact_id)
+            if entry is None or len(data) > self.max_bytes:
+                self._entries.pop(artifact_id, None)
+                return
+            self._entries[artifact_id] = (entry[0], data, media_type)
+            self._entries.move_to_end(artifact_id)
+            self._bytes += len(data)
+            self.stored += 1
+            self._evict()
+
+    def discard(self, artifact_id):
+        """Drop a reservation whose artifact could not be produced"""
+        with self._lock:
+            self._remove(artifact_id)
+
+    def get(self, artifact_id):
+        """
+        Look up an artifact
+
+        Returns:
+            (data, media_type) tuple, "pending" while the artifact is still
+            being produced, or None if it is unknown or expired
+        """
+        with self._lock:
+            entry = self._entries.get(artifact_id)
+            if entry is None:
+                return None
+
+            expires_at, data, media_type = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                self._remove(artifact_id)
+                return None
+            if data is None:
+                return "pending"
+
+            self._entries.move_to_end(artifact_id)
+            self.served += 1
+            return data, media_type
+
+    def seconds_to_live(self, artifact_id):
+        """Remaining lifetime of an artifact in seconds (None when artifacts don't expire)"""
+        with self._lock:
+            entry = self._entries.get(artifact_id)
+        if entry is None or entry[0] is None:
+            return None
+        return max(0, int(entry[0] - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "stored": self.stored,
+                "evicted": self.evicted,
+                "served": self.served,
+            }
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            artifact_id = next(iter(self._entries))
+            self._remove(artifact_id)
+            self.evicted += 1
+
+    def _remove(self, artifact_id):
+        entry = self._entries.pop(artifact_id, None)
+        if entry is not None and entry[1] is not None:
+            self._bytes -= len(entry[1])
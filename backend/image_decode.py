@@ -0,0 +1,199 @@
+import io
+import threading
+import time
+
+import numpy as np
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from PIL import Image, ImageOps
+
+from metrics import record_stage
+
+# EXIF tag holding the camera orientation
+EXIF_ORIENTATION = 0x0112
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an uploaded image exceeds the configured byte or pixel limits"""
+
+
+async def read_upload(upload, max_bytes, chunk_size=1024 * 1024):
+    """
+    Read an uploaded file, giving up as soon as it exceeds max_bytes
+
+    Args:
+        upload: FastAPI UploadFile
+        max_bytes: Largest accepted file size in bytes (0 disables the limit)
+        chunk_size: Bytes read per chunk when the file size is not known up front
+
+    Returns:
+        The file contents
+
+    Raises:
+        ImageTooLargeError: If the file is larger than max_bytes
+    """
+    size = getattr(upload, "size", None)
+    if not max_bytes or (size is not None and size <= max_bytes):
+        return await upload.read()
+    if size is not None:
+        raise ImageTooLargeError(f"{upload.filename or 'Upload'} is larger than {max_bytes / (1024 * 1024):g} MB")
+
+    contents = bytearray()
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        if len(contents) + len(chunk) > max_bytes:
+            raise ImageTooLargeError(f"{upload.filename or 'Upload'} is larger than {max_bytes / (1024 * 1024):g} MB")
+        contents += chunk
+    return bytes(contents)
+
+
+class ImageDecoder:
+    """
+    Decodes uploaded images straight to an RGB array at the resolution the pipeline needs
+
+    The pose network sees at most a few hundred pixels and the side view
+    measurements only look at thin bands of the photo, so multi-megapixel
+    uploads are decoded at reduced size: JPEGs with the decoder's DCT scaling
+    (draft mode, 1/2, 1/4 or 1/8 scale), other formats with an integer box
+    reduction. Both stop at or above max_side pixels along the longest side,
+    and the result is then resized to exactly max_side. The decoded size
+    therefore depends only on the source size, not on its format, so a JPEG
+    front view and a PNG side view of the same size come out at the same
+    scale and pixel measurements between the two views stay comparable.
+
+    EXIF orientation is applied so landmark coordinates match the photo as
+    browsers display it. The result is RGB, which is what the pose network
+    and the side view processing consume, so no colour conversion is needed.
+
+    Args:
+        max_side: Longest image side the pipeline works with (0 decodes at full resolution)
+        max_pixels: Largest accepted image in pixels, checked before decoding (0 disables the check)
+    """
+
+    def __init__(self, max_side=1024, max_pixels=50_000_000):
+        self.max_side = max(0, int(max_side))
+        self.max_pixels = max(0, int(max_pixels))
+
+        self._lock = threading.Lock()
+        self.decodes = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.source_pixels = 0
+        self.decoded_pixels = 0
+
+    def fingerprint(self):
+        """Describe the decode settings that influence landmark coordinates (used to key cached pose results)"""
+        return f"decode={self.max_side}:exact"
+
+    def decode(self, contents):
+        """
+        Decode uploaded image bytes
+
+        Args:
+            contents: Raw bytes of the uploaded file
+
+        Returns:
+            RGB numpy array (read-only)
+
+        Raises:
+            ImageTooLargeError: If the image has more than max_pixels pixels
+        """
+        start = time.perf_counter()
+        img = Image.open(io.BytesIO(contents))
+        width, height = img.size
+        if self.max_pixels and width * height > self.max_pixels:
+            raise ImageTooLargeError(
+                f"Image is {width}x{height}, larger than {self.max_pixels / 1e6:.0f} megapixels"
+            )
+
+        longest = max(width, height)
+        if self.max_side and longest > self.max_side:
+            scale = self.max_side / longest
+            target_size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+            if img.format == "JPEG":
+                # Let libjpeg decode at the smallest DCT scale that keeps max_side
+                img.draft("RGB", target_size)
+            elif longest // self.max_side >= 2:
+                img = img.reduce(longest // self.max_side)
+            # The cheap reductions overshoot by a format-dependent amount; finish at the exact size
+            if img.size != target_size:
+                img = img.resize(target_size, Image.BILINEAR)
+
+        if img.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img_rgb = np.asarray(img)
+
+        record_stage("decode", start)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        with self._lock:
+            self.decodes += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self.source_pixels += width * height
+            self.decoded_pixels += img_rgb.shape[0] * img_rgb.shape[1]
+        return img_rgb
+
+    def stats(self):
+        """Decode counters for /inference-stats"""
+        with self._lock:
+            decodes = self.decodes
+            return {
+                "max_side": self.max_side,
+                "max_pixels": self.max_pixels,
+                "decodes": decodes,
+                "mean_ms": round(self.total_ms / decodes, 2) if decodes else None,
+                "max_ms": round(self.max_ms, 2) if decodes else None,
+                "mean_source_megapixels": round(self.source_pixels / decodes / 1e6, 2) if decodes else None,
+                "mean_decoded_megapixels": round(self.decoded_pixels / decodes / 1e6, 2) if decodes else None,
+            }
+
+
+class RequestSizeLimitMiddleware:
+    """
+    ASGI middleware rejecting request bodies larger than max_body_bytes with 413
+
+    Requests announcing a larger Content-Length are refused before any of the
+    body is read; chunked bodies are counted while they stream in, and
+    parsing stops as soon as the limit is crossed, so an oversized upload is
+    never buffered in full.
+
+    Args:
+        app: The wrapped ASGI application
+        max_body_bytes: Largest accepted request body in bytes (0 disables the limit)
+        path_limits: Optional {path: max_body_bytes} for endpoints with their own limit
+    """
+
+    def __init__(self, app, max_body_bytes, path_limits=None):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.path_limits = dict(path_limits or {})
+
+    async def __call__(self, scope, receive, send):
+        max_body_bytes = self.path_limits.get(scope.get("path"), self.max_body_bytes) if scope["type"] == "http" else 0
+        if not max_body_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body is larger than {max_body_bytes / (1024 * 1024):g} MB"
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > max_body_bytes:
+            response = JSONResponse(status_code=413, content={"detail": detail})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
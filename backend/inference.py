@@ -0,0 +1,302 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from metrics import metrics
+from tracing import collect_spans, current_trace
+
+EXECUTOR_MODES = ("thread", "process")
+
+# Detector pool owned by a process inference worker. In thread mode the
+# executor's own pool is passed to every task instead.
+_process_pool = None
+
+
+def _init_process_worker(pool_factory):
+    global _process_pool
+    _process_pool = pool_factory(1)
+
+
+def worker_detector_pool():
+    """
+    Detector pool of the current process inference worker
+
+    Lets functions submitted through InferenceExecutor.run run whole pipelines
+    on the worker (see sizing_pipeline.size_image_pairs).
+    """
+    if _process_pool is None:
+        raise RuntimeError("Not running on a process inference worker")
+    return _process_pool
+
+
+def _run_on_detector(pool, method_name, *args):
+    """
+    Run a detector method on an inference worker
+
+    Returns:
+        (result, spans, recorded) - the method's result, the pipeline stages it
+        ran as trace spans, and on process workers the metrics recorded during
+        the call (None in thread mode, where they are recorded in place)
+    """
+    if pool is None and _process_pool is None:
+        raise RuntimeError("Inference worker has no detector pool")
+    with collect_spans() as spans:
+        with (pool if pool is not None else _process_pool).checkout() as detector:
+            result = getattr(detector, method_name)(*args)
+    return result, spans, metrics.drain() if pool is None else None
+
+
+def _describe_pool(pool):
+    pool = pool if pool is not None else _process_pool
+    return pool.describe()
+
+
+class InferenceExecutor:
+    """
+    Runs OpenPose inference outside the asyncio event loop
+
+    The executor owns the pose detectors, so endpoints only ever await results
+    and never touch a network directly. In thread mode one DetectorPool with a
+    detector per worker thread is shared by all threads, and every inference
+    checks out its own instance. In process mode every worker process creates
+    a single-detector pool of its own.
+
+    Args:
+        pool_factory: Picklable callable taking a size and returning a DetectorPool
+        max_workers: Number of inference workers
+        mode: "thread" or "process"
+    """
+
+    def __init__(self, pool_factory, max_workers=1, mode="thread"):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown inference executor mode '{mode}', expected one of {EXECUTOR_MODES}")
+
+        self.mode = mode
+        self.max_workers = max(1, int(max_workers))
+
+        if mode == "process":
+            self.detector_pool = None
+            # Use spawn so workers don't inherit OpenCV/uvicorn threads from a fork
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+                initargs=(pool_factory,),
+            )
+        else:
+            self.detector_pool = pool_factory(self.max_workers)
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="openpose",
+            )
+
+        # Start every worker eagerly, so model loading and warm-up happen now rather than
+        # on the first requests (process workers are spawned on demand, one per pending task)
+        startup_tasks = [
+            self._pool.submit(_describe_pool, self.detector_pool)
+            for _ in range(self.max_workers if mode == "process" else 1)
+        ]
+        self.model_info = [task.result() for task in startup_tasks][0]
+        print(f"Inference executor started: {self.max_workers} {mode} worker(s), "
+              f"demo_mode={self.model_info['demo_mode']}")
+
+    async def run(self, func, *args):
+        """Run `func(*args)` on an inference worker and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, func, *args)
+
+    async def detect_pose(self, image):
+        """
+        Detect pose keypoints in an image on an inference worker
+
+        Args:
+            image: numpy array of the image (RGB format for detectors from create_detector_pool)
+
+        Returns:
+            Dictionary containing landmarks and connections (see OpenPoseDetector.detect_pose)
+        """
+        return (await self._run_on_detector("detect_pose", image))[0]
+
+    async def detect_pose_batch(self, images):
+        """
+        Detect pose keypoints in several images with one forward pass on an inference worker
+
+        Args:
+            images: List of numpy arrays (RGB format for detectors from create_detector_pool)
+
+        Returns:
+            List of pose results, one per image
+        """
+        return (await self._run_on_detector("detect_pose_batch", images))[0]
+
+    async def detect_pose_batch_traced(self, images):
+        """
+        Like detect_pose_batch, also returning the pipeline stages run on the worker
+
+        Returns:
+            (results, spans) - one pose result per image, and the stages as
+            (name, start, end, pid, thread id) trace spans
+        """
+        return await self._run_on_detector("detect_pose_batch", images)
+
+    async def _run_on_detector(self, method_name, *args):
+        result, spans, recorded = await self.run(_run_on_detector, self.detector_pool, method_name, *args)
+        metrics.merge(recorded)
+        return result, spans
+
+    def scale_latency(self):
+        """
+        Forward-pass latency per network input shape observed so far
+
+        Returns:
+            List of per-shape statistics (see DetectorPool.scale_latency), or None
+            in process mode, where every worker keeps its statistics to itself
+        """
+        if self.detector_pool is None:
+            return None
+        return self.detector_pool.scale_latency()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching in front of an InferenceExecutor
+
+    Images submitted by concurrent requests are collected until either
+    `max_batch_size` images are pending or the oldest one has waited
+    `max_wait_ms`, and then run through the network as one batch. The
+    per-image results are handed back to each waiting request.
+
+    The scheduler is only used from the asyncio event loop, so it needs no locking.
+
+    Args:
+        executor: InferenceExecutor that runs the batches
+        max_batch_size: Maximum number of images per forward pass
+        max_wait_ms: Maximum time an image waits for a batch to fill up
+    """
+
+    def __init__(self, executor, max_batch_size=4, max_wait_ms=10):
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+
+        # (image, future, enqueued_at, trace) tuples waiting for a batch
+        self._pending = []
+        self._flush_handle = None
+
+        # batch size -> number of batches of that size
+        self.batch_size_histogram = {size: 0 for size in range(1, self.max_batch_size + 1)}
+        self.batches = 0
+        self.images = 0
+        self.total_wait_ms = 0.0
+        self.max_observed_wait_ms = 0.0
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    async def detect_pose(self, image):
+        """
+        Detect pose keypoints in an image as part of the next batch
+
+        Args:
+            image: numpy array of the image (RGB format for detectors from create_detector_pool)
+
+        Returns:
+            Dictionary containing landmarks and connections
+        """
+        return (await self.detect_pose_many([image]))[0]
+
+    async def detect_pose_many(self, images):
+        """
+        Submit several images at once; they are queued together so that they
+        share a batch whenever it has room for them
+
+        Args:
+            images: List of numpy arrays (RGB format for detectors from create_detector_pool)
+
+        Returns:
+            List of pose results, one per image
+        """
+        loop = asyncio.get_running_loop()
+        now = time.perf_counter()
+        trace = current_trace()
+        futures = []
+        for image in images:
+            future = loop.create_future()
+            self._pending.append((image, future, now, trace))
+            futures.append(future)
+
+        if len(self._pending) >= self.max_batch_size or self.max_wait_ms == 0:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000.0, self._flush)
+
+        return await asyncio.gather(*futures)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "images": self.images,
+            "mean_batch_size": self.images / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(self.batch_size_histogram),
+            "mean_wait_ms": self.total_wait_ms / self.images if self.images else 0.0,
+            "max_wait_observed_ms": self.max_observed_wait_ms,
+        }
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        # Dispatch every full batch plus the remainder; anything queued later starts a new window
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            self._record_batch(batch)
+            asyncio.ensure_future(self._run_batch(batch))
+
+    def _record_batch(self, batch):
+        now = time.perf_counter()
+        self.batches += 1
+        self.images += len(batch)
+        self.batch_size_histogram[len(batch)] += 1
+        metrics.observe("inference_batch_size", len(batch))
+        for _, _, enqueued_at, _ in batch:
+            metrics.observe("inference_queue_wait_seconds", now - enqueued_at)
+            wait_ms = (now - enqueued_at) * 1000.0
+            self.total_wait_ms += wait_ms
+            self.max_observed_wait_ms = max(self.max_observed_wait_ms, wait_ms)
+
+    async def _run_batch(self, batch):
+        images = [image for image, _, _, _ in batch]
+        start = time.perf_counter()
+        try:
+            results, spans = await self.executor.detect_pose_batch_traced(images)
+        except Exception as e:
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        end = time.perf_counter()
+
+        # Every traced request in the batch gets its queue wait and the batch's worker stages
+        traced = {}
+        for _, _, enqueued_at, trace in batch:
+            if trace is not None:
+                traced[id(trace)] = (trace, min(enqueued_at, traced.get(id(trace), (None, enqueued_at))[1]))
+        for trace, enqueued_at in traced.values():
+            trace.add_span("queue_wait", enqueued_at, start)
+            trace.add_span("inference", start, end)
+            trace.spans.extend(spans)
+
+        for (_, future, _, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
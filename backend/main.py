@@ -1,36 +1,136 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import numpy as np
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 import cv2
-from PIL import Image
-import io
 import json
-import os
-import base64
+import asyncio
+import functools
+import random
+import secrets
 import traceback
-from typing import Optional, List, Dict, Any, Union
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, List
 from pydantic import BaseModel
 
 # Import from our modules
-from pose_detection import initialize_pose_detector, detect_pose_in_image
-from body_measurements import calculate_body_measurements
-from side_view_processing import process_side_view
-from size_prediction import determine_jeans_size, determine_dress_size, determine_skirt_size, get_size_details
+from config import settings
+from batch_archive import PhotoArchive
+from chart_registry import ChartRegistry
+from debug_artifacts import DebugArtifactStore
+from image_decode import ImageDecoder, ImageTooLargeError, RequestSizeLimitMiddleware, read_upload
+from inference import InferenceExecutor, BatchScheduler
+from metrics import RequestMetricsMiddleware, metrics, stage_timer
+from pose_cache import PoseResultCache
+from pose_detection import create_detector_pool
+from pose_models import REQUIRED_LANDMARKS
+from side_view_processing import prepare_side_view, render_side_view_markers
+from sizing_pipeline import GARMENT_RESPONSE_NAMES, measure_and_size
+from tracing import TraceFileWriter, TracingMiddleware, run_in_threadpool
 
 # Initialize global variables
-pose_detector = None
+inference_executor = None
+batch_scheduler = None
 
-# Load size charts
+# Pose results keyed by upload content, shared by /detect-pose/ and /predict-size/
+pose_cache = PoseResultCache(
+    max_entries=settings.pose_cache_max_entries,
+    max_bytes=settings.pose_cache_max_mb * 1024 * 1024,
+    ttl_seconds=settings.pose_cache_ttl_seconds
+)
+
+# Decodes uploads at the resolution the pipeline needs (see image_decode.py)
+image_decoder = ImageDecoder(max_side=settings.decode_max_side, max_pixels=settings.max_image_pixels)
+
+# Debug images rendered on request, served by /debug-artifacts/{artifact_id}
+debug_artifacts = DebugArtifactStore(
+    max_entries=settings.debug_artifact_max_entries,
+    max_bytes=settings.debug_artifact_max_mb * 1024 * 1024,
+    ttl_seconds=settings.debug_artifact_ttl_seconds
+)
+
+# Request profiles of admins, kept apart from the debug images and served by the admin-only
+# /admin/profiles/{artifact_id}
+profile_artifacts = DebugArtifactStore(
+    max_entries=settings.debug_artifact_max_entries,
+    max_bytes=settings.debug_artifact_max_mb * 1024 * 1024,
+    ttl_seconds=settings.debug_artifact_ttl_seconds
+)
+
+# Size charts (and optional brand charts) as immutable snapshots: a request uses the
+# snapshot current when it started, and changed chart sources are loaded in the background
+chart_registry = ChartRegistry(brand_charts_path=settings.brand_charts_path)
 try:
-    with open(os.path.join(os.path.dirname(__file__), '..', 'data', 'size_charts.json'), 'r') as f:
-        SIZE_CHARTS = json.load(f)
+    chart_registry.reload(force=True)
 except Exception as e:
     print(f"Error loading size charts: {e}")
-    SIZE_CHARTS = {}
+
+# Values counted elsewhere, read when /metrics is scraped
+metrics.counter("pose_cache_hits_total", "Pose results served from the pose cache", func=lambda: pose_cache.hits)
+metrics.counter("pose_cache_misses_total", "Pose results that had to be computed", func=lambda: pose_cache.misses)
+metrics.gauge(
+    "inference_queue_depth", "Images waiting for an inference batch",
+    lambda: batch_scheduler.queue_depth if batch_scheduler is not None else None
+)
+
+# Startup progress of the inference executor, reported by /readyz
+startup_state = {
+    "status": "starting",
+    "error": None,
+    "startup_ms": None
+}
+
+async def start_inference_in_background():
+    """Load the model and warm up the networks without blocking the event loop"""
+    start = time.perf_counter()
+    executor = await run_in_threadpool(initialize_inference_executor)
+    startup_state["startup_ms"] = round((time.perf_counter() - start) * 1000.0, 1)
+    if executor is None:
+        startup_state["status"] = "failed"
+        startup_state["error"] = "Could not initialize OpenPose detector. Please check server logs."
+    else:
+        startup_state["status"] = "ready"
+        print(f"Inference ready after {startup_state['startup_ms']:.0f} ms")
+
+@asynccontextmanager
+async def lifespan(app):
+    startup_task = asyncio.create_task(start_inference_in_background())
+    chart_watcher = None
+    if settings.chart_reload_interval_seconds > 0:
+        chart_watcher = asyncio.create_task(chart_registry.watch(settings.chart_reload_interval_seconds))
+    yield
+    if not startup_task.done():
+        startup_task.cancel()
+    if chart_watcher is not None:
+        chart_watcher.cancel()
+    if inference_executor is not None:
+        inference_executor.shutdown(wait=False)
 
 # Create FastAPI app
-app = FastAPI(title="Size Prediction API")
+app = FastAPI(title="Size Prediction API", lifespan=lifespan)
+
+# Refuse oversized uploads while they stream in (two images plus form fields per request;
+# batch requests carry many photo pairs and have a limit of their own)
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    max_body_bytes=2 * settings.max_upload_bytes + 1024 * 1024,
+    path_limits={"/predict-size/batch": settings.batch_max_upload_bytes}
+)
+
+# Trace the sizing requests: Server-Timing headers, the optional trace file and admin-only profiling
+if settings.tracing_enabled:
+    app.add_middleware(
+        TracingMiddleware,
+        paths=["/detect-pose/", "/predict-size/"],
+        trace_writer=TraceFileWriter(settings.trace_file) if settings.trace_file else None,
+        artifact_store=profile_artifacts,
+        artifact_path="/admin/profiles/",
+        admin_token=settings.admin_token,
+        sample_interval_seconds=settings.profile_sample_interval_ms / 1000.0
+    )
+
+# Time every request by endpoint (added last, so it also sees requests refused by the middlewares above)
+app.add_middleware(RequestMetricsMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -39,16 +139,262 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile-Artifact"],
 )
 
 class FixedPoseModeResponse(BaseModel):
     enabled: bool
     message: str
 
+def initialize_inference_executor():
+    """Start the inference executor that owns the OpenPose detector(s) and its batch scheduler"""
+    global inference_executor, batch_scheduler
+    try:
+        inference_executor = InferenceExecutor(
+            create_detector_pool,
+            max_workers=settings.inference_workers,
+            mode=settings.inference_executor
+        )
+        batch_scheduler = BatchScheduler(
+            inference_executor,
+            max_batch_size=settings.inference_max_batch_size,
+            max_wait_ms=settings.inference_max_wait_ms
+        )
+    except Exception as e:
+        print(f"Error starting inference executor: {e}")
+        inference_executor = None
+        batch_scheduler = None
+    return inference_executor
+
+def decode_image(contents):
+    """
+    Decode uploaded image bytes
+
+    Args:
+        contents: Raw bytes of the uploaded file
+
+    Returns:
+        RGB numpy array, reduced to the resolution the pipeline needs (see ImageDecoder)
+    """
+    return image_decoder.decode(contents)
+
+async def read_image_upload(upload):
+    """Read an uploaded image, rejecting it with 413 as soon as it exceeds MAX_UPLOAD_MB"""
+    try:
+        with stage_timer("upload_read"):
+            return await read_upload(upload, settings.max_upload_bytes)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+async def detect_pose_cached(contents, label="image"):
+    """
+    Detect the pose in uploaded image bytes, reusing cached results for identical uploads
+    
+    Args:
+        contents: Raw bytes of the uploaded image
+        label: Name of the image used in error messages
+        
+    Returns:
+        Pose results for the image
+    """
+    return (await detect_poses_cached([(contents, label, None)]))[0]
+
+async def detect_poses_cached(uploads, return_exceptions=False):
+    """
+    Detect poses in several uploads, reusing cached results for identical uploads
+    
+    Uploads that miss the cache are decoded concurrently and sent to the
+    network together, so they share one inference batch.
+    
+    Args:
+        uploads: List of (contents, label, decoded) tuples; `decoded` is an optional
+            awaitable yielding the already decoded RGB image for that upload
+        return_exceptions: Return per-upload failures in place instead of raising
+        
+    Returns:
+        List of pose results, one per upload
+    """
+    async def decode(contents, label, decoded):
+        try:
+            if decoded is not None:
+                return await decoded
+            return await run_in_threadpool(decode_image, contents)
+        except ImageTooLargeError as img_error:
+            return HTTPException(status_code=413, detail=f"Failed to process {label}: {str(img_error)}")
+        except Exception as img_error:
+            return HTTPException(
+                status_code=400,
+                detail=f"Failed to process {label}: {str(img_error)}"
+            )
+    
+    async def compute_many(indices):
+        images = await asyncio.gather(*[decode(*uploads[i]) for i in indices])
+        results = list(images)
+        valid = [k for k, img in enumerate(images) if not isinstance(img, Exception)]
+        if valid:
+            poses = await batch_scheduler.detect_pose_many([images[k] for k in valid])
+            for k, pose in zip(valid, poses):
+                results[k] = pose
+        return results
+    
+    fingerprint = f'{inference_executor.model_info["config_fingerprint"]};{image_decoder.fingerprint()}'
+    keys = [pose_cache.make_key(contents, fingerprint) for contents, _, _ in uploads]
+    return await pose_cache.get_or_compute_many(keys, compute_many, return_exceptions=return_exceptions)
+
+def render_side_view_artifact(artifact_id, side_img_np, markers, band):
+    """Render the side view depth markers into the debug artifact store (runs as a background task)"""
+    try:
+        with stage_timer("debug_image"):
+            marked = render_side_view_markers(side_img_np, markers, band, max_side=settings.debug_artifact_max_side)
+            _, buffer = cv2.imencode('.jpg', marked, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        debug_artifacts.put(artifact_id, buffer.tobytes(), "image/jpeg")
+    except Exception as e:
+        print(f"Error rendering side view debug image: {e}")
+        debug_artifacts.discard(artifact_id)
+
+def require_inference_ready():
+    """Reject requests with 503 until the model is loaded and warmed up"""
+    if startup_state["status"] != "ready" or inference_executor is None:
+        raise HTTPException(
+            status_code=503,
+            detail=startup_state["error"] or "OpenPose model is still loading. Please retry shortly."
+        )
+
+def require_admin(request):
+    """Allow /admin endpoints only with the configured X-Admin-Token (they don't exist without ADMIN_TOKEN)"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(request.headers.get("x-admin-token", ""), settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
 @app.get("/")
 async def root():
     return {"message": "Size Prediction API is running"}
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness probe: the model is loaded and every network has been warmed up
+    
+    Returns:
+        200 with model details when ready, 503 while starting or after a failed startup
+    """
+    if startup_state["status"] != "ready":
+        return JSONResponse(status_code=503, content=startup_state)
+    return {
+        **startup_state,
+        "demo_mode": inference_executor.model_info["demo_mode"],
+        "model_type": inference_executor.model_info["model_type"]
+    }
+
+@app.get("/inference-stats")
+async def get_inference_stats():
+    """
+    Report batching and pose cache statistics for tuning throughput against latency
+    
+    Returns:
+        JSON with the batch size histogram, queue wait times, per-scale forward
+        latency, decode times and cache counters
+    """
+    return {
+        "executor": {
+            "mode": inference_executor.mode,
+            "workers": inference_executor.max_workers,
+            "model": inference_executor.model_info,
+            "scale_latency": inference_executor.scale_latency()
+        } if inference_executor is not None else None,
+        "batching": batch_scheduler.stats() if batch_scheduler is not None else None,
+        "decode": image_decoder.stats(),
+        "pose_cache": pose_cache.stats(),
+        "debug_artifacts": debug_artifacts.stats(),
+        "profile_artifacts": profile_artifacts.stats(),
+        "charts": chart_registry.stats()
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Per-stage latency histograms and counters in the Prometheus text format
+    
+    Stages cover the whole /predict-size/ path: upload read, decode, blob
+    preparation, forward pass, heatmap post-processing (with keypoint
+    inference as its own stage), body measurements, side view preparation and
+    processing, sizing and debug image rendering.
+    """
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/admin/reload-charts")
+async def reload_charts(request: Request):
+    """
+    Load the size charts now instead of waiting for the watcher
+    
+    The new charts are validated and compiled off the event loop and replace
+    the current ones only if they load; requests already running keep the
+    charts they started with.
+    
+    Returns:
+        JSON with whether the charts changed and the chart version now in use
+    """
+    require_admin(request)
+    try:
+        reloaded = await run_in_threadpool(chart_registry.reload, True)
+    except Exception as e:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Size charts not reloaded, keeping version {chart_registry.current().version}: {str(e)}"
+        )
+    return {"reloaded": reloaded, "chart_version": chart_registry.current().version}
+
+async def serve_artifact(store, artifact_id, request):
+    """
+    Serve an artifact of a DebugArtifactStore referenced by an earlier response
+    
+    Artifacts are stored after that response was sent, so a request for one
+    that is still being produced waits briefly for it.
+    
+    Returns:
+        The artifact with caching headers, 304 if the client already has it,
+        or 404 if it is unknown or expired
+    """
+    artifact = store.get(artifact_id)
+    for _ in range(50):
+        if artifact != "pending":
+            break
+        await asyncio.sleep(0.1)
+        artifact = store.get(artifact_id)
+    if artifact is None or artifact == "pending":
+        raise HTTPException(status_code=404, detail="Debug artifact not found or expired")
+    
+    # Artifacts never change once stored, so they can be cached for as long as they live
+    etag = f'"{artifact_id}"'
+    max_age = store.seconds_to_live(artifact_id)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={max_age}, immutable" if max_age is not None else "private, immutable"
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    data, media_type = artifact
+    return Response(content=data, media_type=media_type, headers=headers)
+
+@app.get("/debug-artifacts/{artifact_id}")
+async def get_debug_artifact(artifact_id: str, request: Request):
+    """Serve a debug image referenced by an earlier /predict-size/ response"""
+    return await serve_artifact(debug_artifacts, artifact_id, request)
+
+@app.get("/admin/profiles/{artifact_id}")
+async def get_profile_artifact(artifact_id: str, request: Request):
+    """Serve a request profile (see TracingMiddleware); admin only, like producing one"""
+    require_admin(request)
+    return await serve_artifact(profile_artifacts, artifact_id, request)
+
 @app.post("/detect-pose/")
 async def detect_pose(image: UploadFile = File(...)):
     """
@@ -57,7 +403,10 @@ async def detect_pose(image: UploadFile = File(...)):
     Returns:
         JSON with landmarks and connections or error details
     """
-    global pose_detector
+    require_inference_ready()
+    
+    # Read the upload before anything else, so an oversized one is refused with 413
+    contents = await read_image_upload(image)
     
     try:
         # Validate input file
@@ -66,41 +415,22 @@ async def detect_pose(image: UploadFile = File(...)):
                 status_code=400,
                 detail="File must be an image (JPEG, PNG, etc.)"
             )
-            
-        # If detector is not initialized, try to initialize it
-        if pose_detector is None:
-            if not initialize_pose_detector():
-                raise HTTPException(
-                    status_code=503,
-                    detail="Could not initialize OpenPose detector. Please ensure model weights are downloaded."
-                )
 
-        # Verify detector is properly initialized
-        if not hasattr(pose_detector, 'net') or pose_detector.net is None:
+        # Verify the detector is properly initialized
+        if not inference_executor.model_info["model_loaded"]:
             raise HTTPException(
                 status_code=503,
                 detail="OpenPose model not loaded. Check model files in backend/models/openpose/"
             )
             
-        # Read and process the image
-        contents = await image.read()
-        img = Image.open(io.BytesIO(contents))
-        img_rgb = img.convert('RGB')
-        img_np = np.array(img_rgb)
-        
-        # Convert from RGB to BGR (OpenCV format)
-        img_bgr = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-        
-        # Process the image with OpenPose
-        results = detect_pose_in_image(pose_detector, img_bgr)
+        # Decode the image and run OpenPose off the event loop
+        # (identical uploads are served from the pose cache)
+        results = await detect_pose_cached(contents)
         
         # Validate required landmarks
-        required_landmarks = ["LEFT_SHOULDER", "RIGHT_SHOULDER",
-                           "LEFT_HIP", "RIGHT_HIP",
-                           "LEFT_KNEE", "LEFT_ANKLE"]
         missing_landmarks = []
         
-        for lm in required_landmarks:
+        for lm in REQUIRED_LANDMARKS:
             if lm not in results["landmarks"] or results["landmarks"][lm]["visibility"] < 0.3:
                 missing_landmarks.append(lm)
         
@@ -112,11 +442,13 @@ async def detect_pose(image: UploadFile = File(...)):
             )
         
         # If we're in demo mode, add a warning to the response
-        if hasattr(pose_detector, 'demo_mode') and pose_detector.demo_mode:
+        if inference_executor.model_info["demo_mode"]:
             results["warning"] = "Using synthetic pose data - model files not found"
             
         return results
         
+    except HTTPException:
+        raise
     except Exception as e:
         error_details = traceback.format_exc()
         print(f"ERROR in detect_pose: {str(e)}\n{error_details}")
@@ -130,31 +462,21 @@ async def get_fixed_pose_mode_status():
     Returns:
         JSONResponse with status and message
     """
-    global pose_detector
-    
     try:
-        # Initialize detector if needed
-        if pose_detector is None:
-            print("Initializing OpenPose detector...")
-            if not initialize_pose_detector():
-                return JSONResponse(
-                    status_code=503,
-                    content={
-                        "error": "OpenPose detector not initialized",
-                        "message": "Please check server logs and model files"
-                    }
-                )
+        # The detector is loaded in the background at startup
+        if startup_state["status"] != "ready" or inference_executor is None:
+            return JSONResponse(
+                status_code=503,
+                content={
+                    "error": "OpenPose detector not initialized",
+                    "message": startup_state["error"] or "The model is still loading, please retry shortly"
+                }
+            )
         
-        # Check for required attributes
-        if not hasattr(pose_detector, 'fixed_pose_mode'):
-            pose_detector.fixed_pose_mode = False
-            
-        if not hasattr(pose_detector, 'reference_landmarks'):
-            pose_detector.reference_landmarks = None
-            
         # Get current status
-        has_reference = pose_detector.reference_landmarks is not None
-        is_enabled = pose_detector.fixed_pose_mode
+        model_info = inference_executor.model_info
+        has_reference = model_info["has_reference_pose"]
+        is_enabled = model_info["fixed_pose_mode"]
         
         return JSONResponse({
             "fixed_pose_mode": is_enabled,
@@ -164,7 +486,7 @@ async def get_fixed_pose_mode_status():
                 "Fixed pose mode is disabled" if not is_enabled else
                 "Fixed pose mode is enabled but no reference pose has been set"
             ),
-            "demo_mode": getattr(pose_detector, 'demo_mode', False)
+            "demo_mode": model_info["demo_mode"]
         })
         
     except Exception as e:
@@ -179,189 +501,322 @@ async def get_fixed_pose_mode_status():
             }
         )
 
-@app.post("/predict-size/")
-async def predict_size(
-    image: UploadFile = File(...),
-    height_cm: float = Form(...),  # Making height mandatory
-    side_image: UploadFile = File(...)  # Side view image is now required
-):
-    global pose_detector
+async def size_photo_pair(contents, side_contents, height_cm, charts):
+    """
+    Detect the poses of a front/side photo pair and size the person
     
-    try:
-        # If detector is not initialized, try to initialize it
-        if pose_detector is None:
-            if not initialize_pose_detector():
-                raise HTTPException(status_code=500, detail="Could not initialize OpenPose detector. Please check server logs.")
-            
-        # Read and process the front view image
-        contents = await image.read()
-        try:
-            img = Image.open(io.BytesIO(contents))
-            img_rgb = img.convert('RGB')
-            img_np = np.array(img_rgb)
-            
-            # Convert from RGB to BGR (OpenCV format)
-            img_bgr = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-        except Exception as img_error:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Failed to process front view image: {str(img_error)}"
-            )
+    Args:
+        contents: Raw bytes of the front view image
+        side_contents: Raw bytes of the side view image
+        height_cm: Height of the person in centimeters
+        charts: ChartSnapshot to size against
+        
+    Returns:
+        (sizing, side_img_np) - the measure_and_size results and the decoded side view
         
-        # Process the front view image with OpenPose
+    Raises:
+        HTTPException: If an image can't be used (too large, unreadable, nobody detected)
+    """
+    # The side view pixels are needed for the depth measurements in any case, so decode
+    # them right away and run the landmark-independent side view preparation while
+    # pose detection is in progress
+    side_decode = asyncio.ensure_future(run_in_threadpool(decode_image, side_contents))
+
+    async def prepare_side():
+        side_img_np = await side_decode
+        return side_img_np, await run_in_threadpool(
+            prepare_side_view, side_img_np, settings.side_view_working_width
+        )
+
+    side_prepare = asyncio.ensure_future(prepare_side())
+    try:
+        # Detect both poses; cache misses are decoded concurrently and run as one 2-image batch
+        # (the front view is usually a cache hit, since the client already sent it to /detect-pose/)
+        front_outcome, side_outcome = await detect_poses_cached(
+            [(contents, "front view image", None), (side_contents, "side view image", side_decode)],
+            return_exceptions=True
+        )
+
+        # An image over the size limits is rejected as such, whichever view it is
+        for outcome in (front_outcome, side_outcome):
+            if isinstance(outcome, HTTPException) and outcome.status_code == 413:
+                raise outcome
+
+        # Errors the detection already reported as HTTP errors (unreadable image) are passed on as they are
+        if isinstance(front_outcome, HTTPException):
+            raise front_outcome
+        if isinstance(side_outcome, HTTPException):
+            raise side_outcome
+
+        # Process front view results
         try:
-            front_results = detect_pose_in_image(pose_detector, img_bgr)
-            
+            if isinstance(front_outcome, Exception):
+                raise front_outcome
+            front_results = front_outcome
+
             if not front_results["landmarks"] or len(front_results["landmarks"]) == 0:
                 raise HTTPException(
                     status_code=400,
                     detail="No person detected in the front view image. Try a clearer photo with full body visible."
                 )
+        except HTTPException:
+            raise
         except Exception as pose_error:
             raise HTTPException(
                 status_code=500,
-                detail=f"Front view pose detection failed: {str(pose_error)}"
+                detail=f"Front view pose detection failed: {getattr(pose_error, 'detail', str(pose_error))}"
             )
-        
-        # Process side view image (now required)
+
+        # Process side view results (now required)
         side_results = None
         side_img_np = None
-        side_img_with_markers = None  # Will store the image with depth markers
-        side_contents = await side_image.read()
         try:
-            side_img = Image.open(io.BytesIO(side_contents))
-            side_img_rgb = side_img.convert('RGB')
-            side_img_np = np.array(side_img_rgb)
-            
-            # Convert from RGB to BGR (OpenCV format)
-            side_img_bgr = cv2.cvtColor(side_img_np, cv2.COLOR_RGB2BGR)
-            
-            # Process the side view image with OpenPose
-            side_results = detect_pose_in_image(pose_detector, side_img_bgr)
-            
+            if isinstance(side_outcome, Exception):
+                raise side_outcome
+            side_results = side_outcome
+
             if not side_results["landmarks"] or len(side_results["landmarks"]) == 0:
                 raise HTTPException(
                     status_code=400,
                     detail="No person detected in the side view image. Try a clearer side view photo."
                 )
+
+            side_img_np, side_prepared = await side_prepare
+        except HTTPException:
+            raise
         except Exception as side_img_error:
             raise HTTPException(
                 status_code=400,
-                detail=f"Failed to process side view image: {str(side_img_error)}"
+                detail=f"Failed to process side view image: {getattr(side_img_error, 'detail', str(side_img_error))}"
             )
-        
-        # If we're in demo mode, log a warning
-        if hasattr(pose_detector, 'demo_mode') and pose_detector.demo_mode:
-            print("WARNING: Using synthetic pose data for size prediction")
-        
-        # Calculate body measurements from front view
-        measurements = calculate_body_measurements(
-            front_results["landmarks"], 
-            img_np.shape, 
-            height_cm
+    finally:
+        # On an early exit nobody awaits the side view work: stop what hasn't run yet and
+        # retrieve the exceptions of what failed, so they aren't logged as never retrieved
+        for task in (side_prepare, side_decode):
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+    # If we're in demo mode, log a warning
+    if inference_executor.model_info["demo_mode"]:
+        print("WARNING: Using synthetic pose data for size prediction")
+
+    # Calculate body measurements and sizes from both views
+    sizing = await run_in_threadpool(
+        measure_and_size,
+        front_results,
+        side_results,
+        side_img_np,
+        height_cm,
+        charts.size_index,
+        side_prepared
+    )
+    
+    return sizing, side_img_np
+
+def sizing_http_exception(e, context="predict_size"):
+    """Turn an unexpected error while sizing into the HTTPException reported to the client"""
+    error_details = traceback.format_exc()
+    print(f"ERROR in {context}: {str(e)}\n{error_details}")
+    
+    # Check if error is related to model loading
+    if "OpenPose model not loaded" in str(e):
+        return HTTPException(
+            status_code=503,
+            detail="OpenPose model not loaded. Please ensure model weights are downloaded and placed in the correct directory."
         )
-        
-        # Process side view to get depth measurements
-        side_view_results = process_side_view(
-            side_results["landmarks"],
-            side_img_np,
-            measurements["waist_y_offset"]
+    elif "No person detected" in str(e):
+        return HTTPException(
+            status_code=400,
+            detail="No person detected in the image. Please try with a clearer image."
         )
+    else:
+        return HTTPException(
+            status_code=500,
+            detail=f"Error processing image: {str(e)}"
+        )
+
+@app.post("/predict-size/")
+async def predict_size(
+    background_tasks: BackgroundTasks,
+    image: UploadFile = File(...),
+    height_cm: float = Form(...),  # Making height mandatory
+    side_image: UploadFile = File(...),  # Side view image is now required
+    debug: bool = Form(False),  # Render the side view depth markers as a debug artifact
+    brands: Optional[str] = Form(None)  # Comma-separated brand IDs to also size for (see BRAND_CHARTS_PATH)
+):
+    require_inference_ready()
+    
+    # Size against the charts current at the start of the request, even if they are reloaded meanwhile
+    charts = chart_registry.current()
+    
+    # Read both uploads concurrently, refusing oversized ones with 413
+    contents, side_contents = await asyncio.gather(read_image_upload(image), read_image_upload(side_image))
+    
+    try:
+        sizing, side_img_np = await size_photo_pair(contents, side_contents, height_cm, charts)
+        side_view_results = sizing["side_view"]
         
-        # Update measurements with side view data
-        measurements.update(side_view_results["measurements"])
-        side_img_with_markers = side_view_results["marked_image"]
-        
-        # Calculate circumferences using ellipse approximation
-        ellipse_perimeter = side_view_results["ellipse_perimeter_func"]
-        
-        hip_circumference_cm = ellipse_perimeter(measurements["hip_width_px"], measurements["hip_depth_px"]) * measurements["scaling_factor"]
-        waist_circumference_cm = ellipse_perimeter(measurements["waist_width_px"], measurements["waist_depth_px"]) * measurements["scaling_factor"]
-        bust_circumference_cm = ellipse_perimeter(measurements["bust_width_px"], measurements["bust_depth_px"]) * measurements["scaling_factor"]
-        inseam_cm = measurements["inseam_cm"]
-        
-        # Determine sizes based on measurements
-        jeans_size = determine_jeans_size(waist_circumference_cm, hip_circumference_cm, SIZE_CHARTS)
-        dress_size = determine_dress_size(bust_circumference_cm, waist_circumference_cm, hip_circumference_cm, SIZE_CHARTS)
-        skirt_size = determine_skirt_size(waist_circumference_cm, hip_circumference_cm, SIZE_CHARTS)
+        # Only render the depth markers when asked to (or sampled); it happens after the
+        # response is sent and the client fetches the image from the artifact store
+        debug_images = {}
+        if debug or random.random() < settings.debug_artifact_sample_rate:
+            artifact_id = debug_artifacts.reserve()
+            if artifact_id is not None:
+                background_tasks.add_task(
+                    render_side_view_artifact, artifact_id, side_img_np,
+                    side_view_results["markers"], side_view_results["band"]
+                )
+                debug_images["side_view_with_markers"] = f"/debug-artifacts/{artifact_id}"
         
-        # Get detailed size information including EU and UK sizes
-        jeans_details = get_size_details("jeans", jeans_size, SIZE_CHARTS)
-        dress_details = get_size_details("dresses", dress_size, SIZE_CHARTS)
-        skirt_details = get_size_details("skirts", skirt_size, SIZE_CHARTS)
+        response = {
+            "measurements": sizing["measurements"],
+            "sizes": sizing["sizes"],
+            "debug_images": debug_images,
+            "chart_version": charts.version
+        }
         
-        # Convert the marked image to base64 for returning to the client
-        marked_image_base64 = None
-        if side_img_with_markers is not None:
-            # Add a title and explanation to the image
-            cv2.putText(side_img_with_markers, "Improved Depth Measurement", (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            cv2.putText(side_img_with_markers, "Red: Front point, Blue: Back point", (10, 60),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 1)
-            cv2.putText(side_img_with_markers, "Green boxes: Analysis regions", (10, 90),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 1)
-            
-            # Convert to base64 for sending to frontend
-            _, buffer = cv2.imencode('.jpg', side_img_with_markers)
-            marked_image_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            # Save the marked image to a file for debugging
-            debug_img_path = os.path.join(os.path.dirname(__file__), 'debug_side_view.jpg')
-            cv2.imwrite(debug_img_path, side_img_with_markers)
-            print(f"DEBUG - Saved marked side view image to: {debug_img_path}")
+        # Sizes at the requested brands, all brands in one vectorized pass per garment type
+        if brands and charts.brand_charts is not None:
+            brand_ids = [brand.strip() for brand in brands.split(",") if brand.strip()]
+            response["brand_sizes"] = {
+                GARMENT_RESPONSE_NAMES.get(garment, garment): sizes
+                for garment, sizes in charts.brand_charts.predict(sizing["circumferences"], brand_ids).items()
+            }
         
-        return {
-            "measurements": {
-                "waist": round(waist_circumference_cm, 1),
-                "hip": round(hip_circumference_cm, 1),
-                "inseam": round(inseam_cm, 1),
-                "bust": round(bust_circumference_cm, 1)
-            },
-            "sizes": {
-                "jeans": {
-                    "us": jeans_size,
-                    "eu": jeans_details.get("eu_size", ""),
-                    "uk": jeans_details.get("uk_size", "")
-                },
-                "dress": {
-                    "us": dress_size,
-                    "eu": dress_details.get("eu_size", ""),
-                    "uk": dress_details.get("uk_size", "")
-                },
-                "skirt": {
-                    "us": skirt_size,
-                    "eu": skirt_details.get("eu_size", ""),
-                    "uk": skirt_details.get("uk_size", "")
-                }
-            },
-            "debug_images": {
-                "side_view_with_markers": marked_image_base64
-            } if marked_image_base64 else {}
-        }
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
-        error_details = traceback.format_exc()
-        print(f"ERROR in predict_size: {str(e)}\n{error_details}")
+        raise sizing_http_exception(e)
+
+@app.post("/predict-size/batch")
+async def predict_size_batch(
+    front: List[UploadFile] = File(None),  # Front view per subject
+    side: List[UploadFile] = File(None),  # Side view per subject, in the same order
+    height_cm: List[str] = Form(None),  # Height per subject, in the same order
+    subject_id: List[str] = Form(None),  # Optional ID per subject (defaults to its position)
+    archive: UploadFile = File(None)  # Or: zip/tar archive with the photos and a manifest
+):
+    """
+    Size many subjects in one request and stream the results as NDJSON
+    
+    Subjects are sent either as repeated `front`, `side` and `height_cm`
+    fields, or as a zip/tar `archive` holding the photos and a manifest.csv /
+    manifest.jsonl (columns front, side, height_cm and optional id). They are
+    sized concurrently through the same batched, cached inference as
+    /predict-size/, and every subject's result is sent as one JSON line as soon
+    as it is ready (in completion order, carrying its `index` and `id`). A
+    subject that fails gets an error line with the status /predict-size/
+    would have returned; the other subjects are not affected. A final
+    {"done": true, ...} line closes the stream.
+    """
+    require_inference_ready()
+    
+    # The whole batch is sized against one chart snapshot
+    charts = chart_registry.current()
+    
+    photo_archive = None
+    if archive is not None:
+        try:
+            photo_archive = await run_in_threadpool(PhotoArchive, archive.file, settings.max_upload_bytes)
+            manifest = await run_in_threadpool(photo_archive.read_manifest)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to read archive: {str(e)}")
         
-        # Check if error is related to model loading
-        if "OpenPose model not loaded" in str(e):
-            raise HTTPException(
-                status_code=503,
-                detail="OpenPose model not loaded. Please ensure model weights are downloaded and placed in the correct directory."
-            )
-        elif "No person detected" in str(e):
+        async def read_archive_photos(pair):
+            try:
+                return tuple([
+                    await run_in_threadpool(photo_archive.read_photo, pair[view]) for view in ("front", "side")
+                ])
+            except ImageTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            except FileNotFoundError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
+        subjects = [
+            {"id": pair["id"], "height_cm": pair["height_cm"], "read": functools.partial(read_archive_photos, pair)}
+            for pair in manifest
+        ]
+    else:
+        front, side, height_cm = front or [], side or [], height_cm or []
+        if not front or not (len(front) == len(side) == len(height_cm)):
             raise HTTPException(
                 status_code=400,
-                detail="No person detected in the image. Please try with a clearer image."
-            )
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error processing image: {str(e)}"
+                detail="Send an archive, or one front, side and height_cm field per subject"
             )
-
-# Initialize the pose detector on startup
-pose_detector = initialize_pose_detector()
+        if subject_id and len(subject_id) != len(front):
+            raise HTTPException(status_code=400, detail="Send one subject_id per subject, or none")
+        
+        async def read_uploaded_photos(front_upload, side_upload):
+            return tuple(await asyncio.gather(read_image_upload(front_upload), read_image_upload(side_upload)))
+        
+        subjects = []
+        for i, (front_upload, side_upload, height) in enumerate(zip(front, side, height_cm)):
+            try:
+                height = float(height)
+            except ValueError:
+                height = None
+            subjects.append({
+                "id": subject_id[i] if subject_id else str(i + 1),
+                "height_cm": height,
+                "read": functools.partial(read_uploaded_photos, front_upload, side_upload)
+            })
+    
+    if not subjects or len(subjects) > settings.batch_max_subjects:
+        if photo_archive is not None:
+            photo_archive.close()
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch holds between 1 and {settings.batch_max_subjects} subjects, got {len(subjects)}"
+        )
+    
+    async def size_subject(index, subject, in_flight):
+        async with in_flight:
+            try:
+                if subject["height_cm"] is None or subject["height_cm"] <= 0:
+                    raise HTTPException(status_code=400, detail="Missing or invalid height_cm")
+                contents, side_contents = await subject["read"]()
+                sizing, _ = await size_photo_pair(contents, side_contents, subject["height_cm"], charts)
+                return {
+                    "index": index,
+                    "id": subject["id"],
+                    "status": 200,
+                    "measurements": sizing["measurements"],
+                    "sizes": sizing["sizes"],
+                    "chart_version": charts.version
+                }
+            except Exception as e:
+                error = e if isinstance(e, HTTPException) else sizing_http_exception(e, "predict_size_batch")
+                return {"index": index, "id": subject["id"], "status": error.status_code, "error": error.detail}
+    
+    async def stream_results():
+        start = time.perf_counter()
+        in_flight = asyncio.Semaphore(settings.batch_concurrency)
+        tasks = [asyncio.ensure_future(size_subject(i, subject, in_flight)) for i, subject in enumerate(subjects)]
+        failed = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                failed += result["status"] != 200
+                yield json.dumps(result) + "\n"
+            yield json.dumps({
+                "done": True,
+                "subjects": len(subjects),
+                "failed": failed,
+                "chart_version": charts.version,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000.0, 1)
+            }) + "\n"
+        finally:
+            # The client may have gone away: stop the subjects that are still waiting
+            for task in tasks:
+                task.cancel()
+            if photo_archive is not None:
+                photo_archive.close()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
     import uvicorn
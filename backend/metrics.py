@@ -0,0 +1,307 @@
+"""
+Latency and throughput metrics, exported in the Prometheus text format
+
+Every thread records into a shard of its own, so recording an observation is
+a dict lookup and two list updates without any lock. A scrape sums the shards
+of all threads. Process inference workers record into their own shard and
+send it back with every result (see inference._run_on_detector), where it is
+merged into the shard of the receiving thread.
+
+Metrics are declared below; values that other components already count (pose
+cache hits, the batch queue) are read when the metrics are scraped. Pipeline
+stages are also recorded as spans of the request's trace (see tracing.py).
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from config import settings
+from tracing import add_span
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# Name of the per-stage latency histogram; its label value is the stage
+STAGE_DURATION = "stage_duration_seconds"
+
+
+class _Shard:
+    """Values recorded by one thread: (name, label value) -> [bucket counts..., sum] or [count]"""
+
+    __slots__ = ("thread", "values")
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.values = {}
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms recorded per thread and summed when scraped
+
+    Args:
+        prefix: Prefix of all exported metric names
+        enabled: Record observations (a disabled registry still renders its callbacks)
+    """
+
+    def __init__(self, prefix="fitframe", enabled=True):
+        self.prefix = prefix
+        self.enabled = enabled
+
+        # name -> (type, help, label name, buckets or None, callback or None), in declaration order
+        self._families = {}
+
+        self._local = threading.local()
+        self._shards = []
+        # Values of threads that have exited, folded together so the shard list stays short
+        self._retired = _Shard(None)
+        self._shards_lock = threading.Lock()
+
+    def counter(self, name, help_text, label=None, func=None):
+        """Declare a counter; with `func` its value is read from func() when scraped"""
+        self._families[name] = ("counter", help_text, label, None, func)
+
+    def gauge(self, name, help_text, func):
+        """Declare a gauge whose value is read from func() when scraped"""
+        self._families[name] = ("gauge", help_text, None, None, func)
+
+    def histogram(self, name, help_text, label=None, buckets=LATENCY_BUCKETS):
+        """Declare a histogram with the given bucket upper bounds"""
+        self._families[name] = ("histogram", help_text, label, tuple(buckets), None)
+
+    def observe(self, name, value, label_value=None):
+        """Add an observation to a histogram"""
+        if not self.enabled:
+            return
+        buckets = self._families[name][3]
+        values = self._shard().values
+        key = (name, label_value)
+        entry = values.get(key)
+        if entry is None:
+            entry = values[key] = [0] * (len(buckets) + 1) + [0.0]
+        entry[bisect.bisect_left(buckets, value)] += 1
+        entry[-1] += value
+
+    def inc(self, name, amount=1, label_value=None):
+        """Increase a counter"""
+        if not self.enabled:
+            return
+        values = self._shard().values
+        key = (name, label_value)
+        entry = values.get(key)
+        if entry is None:
+            values[key] = [amount]
+        else:
+            entry[0] += amount
+
+    @contextmanager
+    def timer(self, name, label_value=None):
+        """Observe the duration of the with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, label_value)
+
+    def drain(self):
+        """
+        Remove and return everything the calling thread has recorded
+
+        Used by process inference workers, which send their values back to the
+        API process with every result instead of being scraped.
+        """
+        shard = self._shard()
+        values, shard.values = shard.values, {}
+        return values
+
+    def merge(self, values):
+        """Add values returned by drain() (in another process) to the calling thread's shard"""
+        if not values:
+            return
+        own = self._shard().values
+        for key, entry in values.items():
+            current = own.get(key)
+            if current is None:
+                own[key] = list(entry)
+            else:
+                for i, value in enumerate(entry):
+                    current[i] += value
+
+    def collect(self):
+        """Sum the values of all threads: (name, label value) -> [bucket counts..., sum] or [count]"""
+        # Copying a shard is atomic under the GIL, so its thread can keep recording meanwhile; the
+        # lock only keeps shards of exited threads from being folded into the retired one halfway
+        with self._shards_lock:
+            snapshots = [
+                [(key, list(entry)) for key, entry in dict(shard.values).items()]
+                for shard in (self._retired, *self._shards)
+            ]
+        totals = {}
+        for snapshot in snapshots:
+            for key, entry in snapshot:
+                current = totals.get(key)
+                if current is None:
+                    totals[key] = entry
+                else:
+                    for i, value in enumerate(entry):
+                        current[i] += value
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        totals = self.collect()
+        by_family = {}
+        for (name, label_value), entry in sorted(totals.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            by_family.setdefault(name, []).append((label_value, entry))
+
+        lines = []
+        for name, (metric_type, help_text, label, buckets, func) in self._families.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            if func is not None:
+                try:
+                    value = func()
+                except Exception:
+                    value = None
+                if value is not None:
+                    lines.append(f"{full_name} {_format_value(value)}")
+                continue
+
+            for label_value, entry in by_family.get(name, []):
+                labels = [f'{label}="{_escape(label_value)}"'] if label is not None and label_value is not None else []
+                if metric_type == "counter":
+                    lines.append(f"{full_name}{_labels(labels)} {_format_value(entry[0])}")
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, "+Inf"), entry[:-1]):
+                    cumulative += count
+                    le = 'le="%s"' % (bound if bound == "+Inf" else _format_value(bound))
+                    lines.append(f"{full_name}_bucket{_labels([*labels, le])} {cumulative}")
+                lines.append(f"{full_name}_sum{_labels(labels)} {_format_value(entry[-1])}")
+                lines.append(f"{full_name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            pass
+        shard = self._local.shard = _Shard(threading.current_thread())
+        with self._shards_lock:
+            # Threads of the thread pools come and go; keep what exited threads recorded
+            alive = []
+            for other in self._shards:
+                if other.thread.is_alive():
+                    alive.append(other)
+                else:
+                    for key, entry in other.values.items():
+                        current = self._retired.values.get(key)
+                        if current is None:
+                            self._retired.values[key] = entry
+                        else:
+                            for i, value in enumerate(entry):
+                                current[i] += value
+            alive.append(shard)
+            self._shards = alive
+        return shard
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request by endpoint and counting responses by status
+
+    Requests are labelled with the name of the endpoint function that handled
+    them (not the path, which carries IDs), so the number of series stays fixed.
+
+    Args:
+        app: The wrapped ASGI application
+        registry: MetricsRegistry to record into
+    """
+
+    def __init__(self, app, registry=None):
+        self.app = app
+        self.registry = registry if registry is not None else metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the endpoint in the (shared) scope
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            self.registry.observe("request_duration_seconds", time.perf_counter() - start, endpoint)
+            self.registry.inc("responses_total", 1, str(status))
+
+
+def _labels(labels):
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value == value else "NaN"
+    return str(value)
+
+
+metrics = MetricsRegistry(enabled=settings.metrics_enabled)
+
+metrics.histogram("request_duration_seconds", "HTTP request duration by endpoint, streaming included",
+                  label="endpoint")
+metrics.counter("responses_total", "HTTP responses by status code", label="status")
+metrics.histogram(STAGE_DURATION, "Time spent in each stage of the sizing pipeline", label="stage")
+metrics.histogram("inference_batch_size", "Images per batched forward pass", buckets=BATCH_SIZE_BUCKETS)
+metrics.histogram("inference_queue_wait_seconds", "Time an image waited for its inference batch")
+metrics.counter("demo_poses_total", "Poses synthesized because the OpenPose model isn't loaded")
+metrics.counter("low_confidence_keypoints_total",
+                "Keypoints below the detection threshold, and required keypoints below 0.3 confidence",
+                label="keypoint")
+metrics.counter("person_crop_total",
+                "Two-pass detections by whether the fine pass ran on a person crop or the full frame",
+                label="region")
+
+
+def record_stage(stage, start, end=None):
+    """
+    Record a pipeline stage in the stage histogram and as a span of the running request's trace
+
+    Args:
+        stage: Stage name
+        start: time.perf_counter() when the stage started
+        end: time.perf_counter() when it ended (defaults to now)
+    """
+    if end is None:
+        end = time.perf_counter()
+    metrics.observe(STAGE_DURATION, end - start, stage)
+    add_span(stage, start, end)
+
+
+@contextmanager
+def stage_timer(stage):
+    """Context manager recording the with-block as a pipeline stage (see record_stage)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, start)
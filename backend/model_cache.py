@@ -0,0 +1,276 @@
+"""
+Model preparation cache for faster OpenPose cold starts
+
+Converts the Caffe weights once into a smaller FP16 copy (weights are stored
+in half precision and expanded to FP32 when the network is loaded, so
+inference itself is unchanged) and keeps it in a local cache directory keyed
+by the checksum of the source files. Detectors load the prepared copy when it
+exists, which roughly halves the bytes parsed at every process start.
+
+Usage:
+    python model_cache.py [--cache-dir DIR] [--no-fp16]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+import cv2
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "cache")
+
+# Sidecar file remembering source checksums so they aren't recomputed on every start
+CHECKSUM_INDEX = "checksums.json"
+
+# Start of a top-level layer definition in a prototxt
+_LAYER_START = re.compile(r"^\s*layer\s*\{", re.MULTILINE)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_checksum(path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    SHA-256 of a file, memoized in the cache directory by path, size and mtime
+
+    Args:
+        path: File to checksum
+        cache_dir: Directory holding the checksum index
+
+    Returns:
+        Hex digest of the file contents
+    """
+    stat = os.stat(path)
+    stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+    index_path = os.path.join(cache_dir, CHECKSUM_INDEX)
+    index = _read_json(index_path)
+
+    entry = index.get(os.path.abspath(path))
+    if entry and entry.get("stamp") == stamp:
+        return entry["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            digest.update(chunk)
+    checksum = digest.hexdigest()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    index = _read_json(index_path)
+    index[os.path.abspath(path)] = {"stamp": stamp, "sha256": checksum}
+    _write_json(index_path, index)
+    return checksum
+
+
+def cached_model_dir(prototxt, weights, cache_dir=DEFAULT_CACHE_DIR, fp16=True):
+    """Cache directory for a prototxt/weights pair (depends on both files' checksums)"""
+    key = hashlib.sha256(
+        f"{file_checksum(prototxt, cache_dir)}:{file_checksum(weights, cache_dir)}".encode("utf-8")
+    ).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{key}-{'fp16' if fp16 else 'fp32'}")
+
+
+def find_prepared_model(prototxt, weights, cache_dir=DEFAULT_CACHE_DIR, fp16=True):
+    """
+    Look up an already prepared copy of a model
+
+    Returns:
+        (prototxt_path, weights_path) of the prepared copy, or None if it hasn't been prepared
+    """
+    target_dir = cached_model_dir(prototxt, weights, cache_dir, fp16)
+    manifest = _read_json(os.path.join(target_dir, "manifest.json"))
+    if not manifest:
+        return None
+
+    cached_prototxt = os.path.join(target_dir, manifest["prototxt"])
+    cached_weights = os.path.join(target_dir, manifest["weights"])
+    if os.path.exists(cached_prototxt) and os.path.exists(cached_weights):
+        return cached_prototxt, cached_weights
+    return None
+
+
+def prepare_model(prototxt, weights, cache_dir=DEFAULT_CACHE_DIR, fp16=True):
+    """
+    Convert a Caffe model into its fast-loading form (if not done yet)
+
+    Args:
+        prototxt: Path to the source prototxt
+        weights: Path to the source caffemodel
+        cache_dir: Root of the model cache
+        fp16: Store the weights in half precision
+
+    Returns:
+        (prototxt_path, weights_path) of the prepared copy
+    """
+    prepared = find_prepared_model(prototxt, weights, cache_dir, fp16)
+    if prepared is not None:
+        return prepared
+
+    target_dir = cached_model_dir(prototxt, weights, cache_dir, fp16)
+    os.makedirs(target_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    cached_prototxt = os.path.join(target_dir, os.path.basename(prototxt))
+    cached_weights = os.path.join(target_dir, os.path.basename(weights))
+    tmp_weights = f"{cached_weights}.tmp{os.getpid()}"
+    if fp16:
+        cv2.dnn.shrinkCaffeModel(weights, tmp_weights)
+    else:
+        shutil.copyfile(weights, tmp_weights)
+    os.replace(tmp_weights, cached_weights)
+    shutil.copyfile(prototxt, cached_prototxt)
+
+    # The manifest is written last, so a half-prepared directory is never used
+    _write_json(os.path.join(target_dir, "manifest.json"), {
+        "source_prototxt": os.path.abspath(prototxt),
+        "source_weights": os.path.abspath(weights),
+        "prototxt": os.path.basename(cached_prototxt),
+        "weights": os.path.basename(cached_weights),
+        "fp16": fp16,
+        "source_bytes": os.path.getsize(weights),
+        "prepared_bytes": os.path.getsize(cached_weights),
+    })
+
+    print(f"Prepared model cache in {target_dir} ({(time.perf_counter() - start):.1f} s, "
+          f"{os.path.getsize(weights) / 1e6:.0f} MB -> {os.path.getsize(cached_weights) / 1e6:.0f} MB)")
+    return cached_prototxt, cached_weights
+
+
+def _layer_blocks(text):
+    """
+    Split a prototxt into its top-level `layer { ... }` blocks
+
+    Returns:
+        (header, blocks) where header is the text before the first layer and
+        blocks is a list of (text, name, bottoms, tops) per layer, in order
+    """
+    blocks = []
+    header_end = None
+    i = 0
+    while True:
+        match = _LAYER_START.search(text, i)
+        if match is None:
+            break
+        if header_end is None:
+            header_end = match.start()
+        # Find the matching closing brace, skipping quoted strings and comments
+        depth = 0
+        j = match.end() - 1
+        while j < len(text):
+            char = text[j]
+            if char == '"':
+                j = text.index('"', j + 1)
+            elif char == "#":
+                j = text.find("\n", j)
+                if j < 0:
+                    j = len(text)
+                    break
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    break
+            j += 1
+        block = text[match.start():j + 1]
+
+        # Top-level fields only (nested parameter blocks may have a name of their own)
+        body = block[block.index("{") + 1:-1]
+        while True:
+            flattened = re.sub(r"\{[^{}]*\}", "", body)
+            if flattened == body:
+                break
+            body = flattened
+        name = re.search(r'\bname\s*:\s*"([^"]*)"', body)
+        blocks.append((
+            block,
+            name.group(1) if name else None,
+            re.findall(r'\bbottom\s*:\s*"([^"]*)"', body),
+            re.findall(r'\btop\s*:\s*"([^"]*)"', body),
+        ))
+        i = j + 1
+    return text[:header_end if header_end is not None else len(text)], blocks
+
+
+def truncate_prototxt(prototxt, output_layer):
+    """
+    Cut a Caffe network definition down to the layers an output layer depends on
+
+    Everything after the output layer is dropped, and so is every earlier
+    layer it doesn't depend on (such as the PAF branch of an OpenPose stage
+    when only its heatmaps are read), so the network only computes what the
+    output needs. The weights of the dropped layers are ignored when the
+    truncated definition is loaded with the original caffemodel.
+
+    Args:
+        prototxt: Network definition as bytes or text
+        output_layer: Name of the layer whose output the network should produce
+
+    Returns:
+        Truncated network definition as bytes
+
+    Raises:
+        ValueError: If the network has no layer of that name
+    """
+    text = prototxt.decode("utf-8") if isinstance(prototxt, bytes) else prototxt
+    header, blocks = _layer_blocks(text)
+    target = next((i for i, (_, name, _, _) in enumerate(blocks) if name == output_layer), None)
+    if target is None:
+        raise ValueError(f"The network has no layer named '{output_layer}'")
+
+    needed = set(blocks[target][3])
+    keep = []
+    for i in range(target, -1, -1):
+        block, _, bottoms, tops = blocks[i]
+        if i == target or needed.intersection(tops):
+            keep.append(block)
+            needed.update(bottoms)
+    return (header + "\n".join(reversed(keep)) + "\n").encode("utf-8")
+
+
+def main():
+    from openpose_utils import OpenPoseDetector
+    from pose_models import PROFILES
+
+    parser = argparse.ArgumentParser(description="Prepare fast-loading copies of the OpenPose models")
+    parser.add_argument("--model-path", default="models/openpose", help="Model directory relative to backend/")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Model cache directory")
+    parser.add_argument("--no-fp16", action="store_true", help="Keep the weights in single precision")
+    args = parser.parse_args()
+
+    model_dir = OpenPoseDetector.resolve_model_path(args.model_path)
+    prepared_any = False
+    for model_type, profile in PROFILES.items():
+        prototxt = os.path.join(model_dir, profile.prototxt)
+        weights = os.path.join(model_dir, profile.weights)
+        if not (os.path.exists(prototxt) and os.path.exists(weights)):
+            print(f"Skipping {model_type}: model files not found")
+            continue
+        print(f"Preparing {model_type} model...")
+        prepare_model(prototxt, weights, args.cache_dir, fp16=not args.no_fp16)
+        prepared_any = True
+
+    if not prepared_any:
+        print("No models found. Please run download_models.py first.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,38 @@
 import os
+import time
 import numpy as np
 import cv2
 
+import model_cache
+import pose_models
+import synthetic_pose
+from metrics import metrics, record_stage, stage_timer
+
+# DNN backends and targets selectable by name (only those this OpenCV build knows about)
+DNN_BACKENDS = {
+    name: getattr(cv2.dnn, const) for name, const in [
+        ("default", "DNN_BACKEND_DEFAULT"),
+        ("opencv", "DNN_BACKEND_OPENCV"),
+        ("openvino", "DNN_BACKEND_INFERENCE_ENGINE"),
+        ("cuda", "DNN_BACKEND_CUDA"),
+        ("vulkan", "DNN_BACKEND_VKCOM"),
+        ("halide", "DNN_BACKEND_HALIDE"),
+    ] if hasattr(cv2.dnn, const)
+}
+
+DNN_TARGETS = {
+    name: getattr(cv2.dnn, const) for name, const in [
+        ("cpu", "DNN_TARGET_CPU"),
+        ("cpu_fp16", "DNN_TARGET_CPU_FP16"),
+        ("opencl", "DNN_TARGET_OPENCL"),
+        ("opencl_fp16", "DNN_TARGET_OPENCL_FP16"),
+        ("cuda", "DNN_TARGET_CUDA"),
+        ("cuda_fp16", "DNN_TARGET_CUDA_FP16"),
+        ("myriad", "DNN_TARGET_MYRIAD"),
+        ("vulkan", "DNN_TARGET_VULKAN"),
+    ] if hasattr(cv2.dnn, const)
+}
+
 class OpenPoseDetector:
     """
     Utility class for OpenPose-based pose detection using OpenCV DNN
@@ -9,97 +40,278 @@ class OpenPoseDetector:
     Supports two modes:
     1. Normal mode: Uses OpenPose to detect pose keypoints in each image
     2. Demo mode: Uses synthetic pose data when model files aren't available
+    
+    The network output is read according to the detector's model profile
+    (see pose_models), so COCO and MPI models report the same landmark names.
     """
-    # COCO Output Format
-    COCO_BODY_PARTS = {
-        0: "Nose", 1: "Neck",
-        2: "Right_Shoulder", 3: "Right_Elbow", 4: "Right_Wrist",
-        5: "Left_Shoulder", 6: "Left_Elbow", 7: "Left_Wrist",
-        8: "Right_Hip", 9: "Right_Knee", 10: "Right_Ankle",
-        11: "Left_Hip", 12: "Left_Knee", 13: "Left_Ankle",
-        14: "Right_Eye", 15: "Left_Eye", 16: "Right_Ear", 17: "Left_Ear"
-    }
-    
-    # Define the body part connections for visualization
-    POSE_PAIRS = [
-        # Torso
-        (1, 0), (1, 2), (1, 5), (2, 5), (1, 8), (1, 11), (8, 11),
-        # Right arm
-        (2, 3), (3, 4),
-        # Left arm
-        (5, 6), (6, 7),
-        # Right leg
-        (8, 9), (9, 10),
-        # Left leg
-        (11, 12), (12, 13),
-        # Face
-        (0, 14), (0, 15), (14, 16), (15, 17)
-    ]
-    
-    # Maps OpenPose COCO keypoints to MediaPipe-like naming for compatibility
-    KEYPOINT_MAPPING = {
-        0: "NOSE", 
-        1: "NECK",
-        2: "RIGHT_SHOULDER", 
-        3: "RIGHT_ELBOW", 
-        4: "RIGHT_WRIST",
-        5: "LEFT_SHOULDER", 
-        6: "LEFT_ELBOW", 
-        7: "LEFT_WRIST",
-        8: "RIGHT_HIP", 
-        9: "RIGHT_KNEE", 
-        10: "RIGHT_ANKLE",
-        11: "LEFT_HIP", 
-        12: "LEFT_KNEE", 
-        13: "LEFT_ANKLE",
-        14: "RIGHT_EYE", 
-        15: "LEFT_EYE", 
-        16: "RIGHT_EAR", 
-        17: "LEFT_EAR"
-    }
-    
-    def __init__(self, model_path="models/openpose"):
-        # Get the base directory
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        self.model_path = os.path.join(base_dir, model_path)
+    # Ways to locate keypoints in the heatmaps (see _extract_peaks)
+    PEAK_MODES = ("lowres", "reference")
+    
+    # How images are fitted into the network input
+    RESIZE_MODES = ("letterbox", "stretch")
+    
+    # Channel orders accepted by detect_pose (the network itself expects RGB)
+    COLOR_ORDERS = ("bgr", "rgb")
+    
+    def __init__(self, model_path="models/openpose", peak_mode="lowres", model_buffers=None,
+                 dnn_backend="default", dnn_target="cpu", model_cache_dir=None, fp16_weights=True,
+                 input_heights=None, input_aspect=1.0, resize_mode="letterbox", color_order="bgr",
+                 read_net=None, model_profile="auto", stages=0, person_crop=False, crop_input_height=None,
+                 crop_margin=0.15, crop_min_gain=1.25):
+        """
+        Args:
+            model_path: Model directory, relative to the backend directory
+            peak_mode: How keypoints are located in the heatmaps (see PEAK_MODES)
+            model_buffers: Optional model files already read into memory
+                (see read_model_buffers), so several detectors can be built
+                without re-reading the weights from disk
+            dnn_backend: Preferable OpenCV DNN backend name (see DNN_BACKENDS)
+            dnn_target: Preferable OpenCV DNN target name (see DNN_TARGETS)
+            model_cache_dir: Directory of prepared fast-loading models (None loads the source files)
+            fp16_weights: Use FP16 weights when preparing/loading from the model cache
+            input_heights: Network input heights; several heights run every image at
+                each scale and average the heatmaps (None: the model's native input height)
+            input_aspect: Network input width divided by height
+            resize_mode: How images are fitted into the network input (see RESIZE_MODES)
+            color_order: Channel order of the images passed to detect_pose (see COLOR_ORDERS);
+                "rgb" skips the channel swap when building the network input
+            read_net: Optional callable returning a network to use instead of the model
+                files (e.g. synthetic_pose.SyntheticPoseNet)
+            model_profile: Name of the model profile (see pose_models.PROFILES), or "auto"
+                for the first model whose files are available
+            stages: Number of network stages to run, reading the heatmaps of the last
+                one (0 runs the full network). All of the model's stages still skip the
+                unused PAF branch of the final stage; fewer are faster but less accurate
+            person_crop: Locate the person in a coarse pass first and run the input
+                heights on a crop around them (see _detect_pose_two_pass)
+            crop_input_height: Network input height of the coarse pass
+                (None: half the model's native input height)
+            crop_margin: Margin added around the located keypoints, relative to the person's size
+            crop_min_gain: Minimum magnification of the person a crop must give over
+                the full frame; below it the full frame is used
+        """
+        self.model_path = self.resolve_model_path(model_path)
+        
+        # The model profile decides how the network output is read
+        if model_buffers is not None:
+            self.profile = pose_models.get_profile(model_buffers["model_type"])
+        else:
+            found = self.find_model_files(self.model_path, model_profile) if read_net is None else None
+            self.profile = (pose_models.get_profile(found[0]) if found is not None
+                            else pose_models.candidate_profiles(model_profile)[0])
         
         # Set demo_mode to False by default
         self.demo_mode = False
+        self.model_type = None
+        self.model_cache_dir = model_cache_dir
+        self.fp16_weights = fp16_weights
+        self.weights_format = None
+        self.load_time_ms = None
+        
+        # Truncated networks end at the heatmap output of their last stage
+        self.stages = int(stages or 0)
+        self.output_layer = self.profile.stage_output_layer(self.stages) if self.stages else None
+        
+        # Network input shapes, rounded to the network stride of 8 pixels. The
+        # largest shape is the primary one whose heatmaps the other scales are
+        # resampled onto in multi-scale mode.
+        if resize_mode not in self.RESIZE_MODES:
+            raise ValueError(f"Unknown resize mode '{resize_mode}', expected one of {self.RESIZE_MODES}")
+        self.resize_mode = resize_mode
+        if color_order not in self.COLOR_ORDERS:
+            raise ValueError(f"Unknown color order '{color_order}', expected one of {self.COLOR_ORDERS}")
+        self.color_order = color_order
+        self.input_aspect = float(input_aspect)
+        input_heights = input_heights or (self.profile.input_size[1],)
+        self._input_shapes = sorted({
+            (self._round_to_stride(height * self.input_aspect), self._round_to_stride(height))
+            for height in input_heights
+        }, key=lambda shape: shape[1])
+        self.input_width, self.input_height = self._input_shapes[-1]
         
-        # Initialize reference landmarks for fixed pose mode
-        self.fixed_pose_mode = False
-        self.reference_landmarks = None
+        # Two-pass mode: a coarse pass on the full frame locates the person for the crop pass
+        self.person_crop = bool(person_crop)
+        self.coarse_shape = None
+        if self.person_crop:
+            crop_input_height = crop_input_height or self.profile.input_size[1] // 2
+            self.coarse_shape = (self._round_to_stride(crop_input_height * self.input_aspect),
+                                 self._round_to_stride(crop_input_height))
+            if self.coarse_shape[1] >= self._input_shapes[0][1]:
+                raise ValueError(f"The coarse pass input height ({self.coarse_shape[1]}) must be below "
+                                 f"the input heights ({self._input_shapes[0][1]})")
+        self.crop_margin = float(crop_margin)
+        self.crop_min_gain = float(crop_min_gain)
+        
+        # Forward-pass latency per input shape: shape -> [passes, total_ms, max_ms]
+        self.scale_latency = {shape: [0, 0.0, 0.0] for shape in self._network_shapes()}
+        
+        if peak_mode not in self.PEAK_MODES:
+            raise ValueError(f"Unknown peak mode '{peak_mode}', expected one of {self.PEAK_MODES}")
+        self.peak_mode = peak_mode
+        
+        if dnn_backend not in DNN_BACKENDS:
+            raise ValueError(f"Unknown DNN backend '{dnn_backend}', expected one of {sorted(DNN_BACKENDS)}")
+        if dnn_target not in DNN_TARGETS:
+            raise ValueError(f"Unknown DNN target '{dnn_target}', expected one of {sorted(DNN_TARGETS)}")
+        self.dnn_backend = dnn_backend
+        self.dnn_target = dnn_target
         
         # Try to load the network, fall back to demo mode if it fails
         try:
-            self.load_model()
+            self.load_model(model_buffers, read_net)
         except Exception as e:
             print(f"Error loading OpenPose model: {e}")
             print("Falling back to DEMO mode with synthetic poses")
             self.demo_mode = True
             self.net = None
+            self.nets = {}
         
-    def load_model(self):
-        """Load the OpenPose model from the specified path"""
-        try:
-            # Try to load COCO model (18 keypoints)
-            prototxt = os.path.join(self.model_path, "pose/coco/pose_deploy_linevec.prototxt")
-            weights = os.path.join(self.model_path, "pose/coco/pose_iter_440000.caffemodel")
+    @staticmethod
+    def _round_to_stride(size, stride=8):
+        """Round an input dimension to a positive multiple of the network stride"""
+        return max(stride, int(round(size / stride)) * stride)
+        
+    @staticmethod
+    def resolve_model_path(model_path):
+        """Resolve a model directory relative to the backend directory"""
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(base_dir, model_path)
+    
+    @classmethod
+    def find_model_files(cls, model_path, model_profile="auto"):
+        """
+        Find the preferred available model
+        
+        Args:
+            model_path: Absolute model directory
+            model_profile: Name of the model profile to look for, or "auto" for any
+                (in the order of pose_models.PROFILES)
             
+        Returns:
+            (model_type, prototxt_path, weights_path) tuple, or None if no model is available
+        """
+        for profile in pose_models.candidate_profiles(model_profile):
+            prototxt = os.path.join(model_path, profile.prototxt)
+            weights = os.path.join(model_path, profile.weights)
             if os.path.exists(prototxt) and os.path.exists(weights):
-                self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
-                self.model_type = "COCO"
-                print("Loaded OpenPose COCO model")
+                return profile.name, prototxt, weights
+        return None
+    
+    @classmethod
+    def locate_model(cls, model_path, model_cache_dir=None, fp16_weights=True, model_profile="auto"):
+        """
+        Find the preferred available model, preferring its prepared copy in the model cache
+        
+        The copy is prepared on first use (see model_cache.prepare_model); if that
+        fails the source files are used.
+        
+        Args:
+            model_path: Absolute model directory
+            model_cache_dir: Model cache directory (None uses the source files)
+            fp16_weights: Whether the cached copy stores FP16 weights
+            model_profile: Name of the model profile to look for, or "auto" for any
+            
+        Returns:
+            (model_type, prototxt_path, weights_path, weights_format) tuple, or None if no model is available
+        """
+        found = cls.find_model_files(model_path, model_profile)
+        if found is None:
+            return None
+        
+        model_type, prototxt, weights = found
+        if model_cache_dir:
+            try:
+                prototxt, weights = model_cache.prepare_model(prototxt, weights, model_cache_dir, fp16_weights)
+                return model_type, prototxt, weights, "fp16" if fp16_weights else "fp32"
+            except Exception as e:
+                print(f"WARNING: Could not use the model cache ({e}), loading the source model")
+        return model_type, prototxt, weights, "fp32"
+    
+    @classmethod
+    def read_model_buffers(cls, model_path="models/openpose", model_cache_dir=None, fp16_weights=True,
+                           model_profile="auto"):
+        """
+        Read the preferred model files into memory once
+        
+        Args:
+            model_path: Model directory, relative to the backend directory
+            model_cache_dir: Model cache directory (None reads the source files)
+            fp16_weights: Whether the cached copy stores FP16 weights
+            model_profile: Name of the model profile to look for, or "auto" for any
+            
+        Returns:
+            Dictionary with model_type, weights_format, prototxt and weights bytes,
+            or None if no model is available
+        """
+        found = cls.locate_model(cls.resolve_model_path(model_path), model_cache_dir, fp16_weights, model_profile)
+        if found is None:
+            return None
+        
+        model_type, prototxt, weights, weights_format = found
+        start = time.perf_counter()
+        with open(prototxt, "rb") as f:
+            prototxt_bytes = f.read()
+        with open(weights, "rb") as f:
+            weights_bytes = f.read()
+        return {
+            "model_type": model_type,
+            "weights_format": weights_format,
+            "prototxt": prototxt_bytes,
+            "weights": weights_bytes,
+            "read_ms": (time.perf_counter() - start) * 1000.0,
+        }
+    
+    def load_model(self, model_buffers=None, read_net=None):
+        """
+        Load the OpenPose model from the specified path
+        
+        Args:
+            model_buffers: Optional model files already read into memory (see read_model_buffers)
+            read_net: Optional callable returning a network to use instead of the model files
+        """
+        try:
+            start = time.perf_counter()
+            if read_net is not None:
+                self._create_nets(read_net)
+                net_model_type = getattr(self.net, "model_type", self.profile.name)
+                if net_model_type != self.profile.name:
+                    raise ValueError(f"Network is a {net_model_type} model, expected {self.profile.name}")
+                self.model_type = self.profile.name
+                self.weights_format = getattr(self.net, "weights_format", "custom")
+                self.load_time_ms = (time.perf_counter() - start) * 1000.0
                 return
             
-            # Try to load MPI model (15 keypoints) as fallback
-            prototxt = os.path.join(self.model_path, "pose/mpi/pose_deploy_linevec.prototxt")
-            weights = os.path.join(self.model_path, "pose/mpi/pose_iter_160000.caffemodel")
+            if model_buffers is not None:
+                prototxt = self._network_definition(model_buffers["prototxt"])
+                self._create_nets(lambda: cv2.dnn.readNetFromCaffe(
+                    np.frombuffer(prototxt, dtype=np.uint8),
+                    np.frombuffer(model_buffers["weights"], dtype=np.uint8)
+                ))
+                self.model_type = model_buffers["model_type"]
+                self.weights_format = model_buffers["weights_format"]
+                self.load_time_ms = (time.perf_counter() - start) * 1000.0
+                print(f"Loaded OpenPose {self.model_type} model ({self.weights_format} weights) "
+                      f"in {self.load_time_ms:.0f} ms")
+                return
             
-            if os.path.exists(prototxt) and os.path.exists(weights):
-                self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
-                self.model_type = "MPI"
-                print("Loaded OpenPose MPI model")
+            found = self.locate_model(self.model_path, self.model_cache_dir, self.fp16_weights, self.profile.name)
+            if found is not None:
+                model_type, prototxt, weights, weights_format = found
+                if self.output_layer is not None:
+                    with open(prototxt, "rb") as f:
+                        prototxt_bytes = self._network_definition(f.read())
+                    with open(weights, "rb") as f:
+                        weights_bytes = f.read()
+                    self._create_nets(lambda: cv2.dnn.readNetFromCaffe(
+                        np.frombuffer(prototxt_bytes, dtype=np.uint8),
+                        np.frombuffer(weights_bytes, dtype=np.uint8)
+                    ))
+                else:
+                    self._create_nets(lambda: cv2.dnn.readNetFromCaffe(prototxt, weights))
+                self.model_type = model_type
+                self.weights_format = weights_format
+                self.load_time_ms = (time.perf_counter() - start) * 1000.0
+                print(f"Loaded OpenPose {model_type} model ({weights_format} weights) in {self.load_time_ms:.0f} ms")
                 return
                 
             # If neither model is available, fail with clear instructions
@@ -115,13 +327,151 @@ class OpenPoseDetector:
             print(f"Error loading OpenPose model: {e}")
             raise
     
+    def _network_definition(self, prototxt):
+        """
+        Network definition to build the networks from
+        
+        A truncated network is cut down to the layers its output layer depends
+        on (see model_cache.truncate_prototxt): OpenCV would otherwise still
+        compute every earlier layer, including the PAF branch of the last stage.
+        """
+        if self.output_layer is None:
+            return prototxt
+        return model_cache.truncate_prototxt(prototxt, self.output_layer)
+    
+    def _forward(self, net):
+        """Run a forward pass, up to the output layer of the last stage if the network is truncated"""
+        if self.output_layer is None:
+            return net.forward()
+        return net.forward(self.output_layer)
+    
+    def _create_nets(self, read_net):
+        """
+        Build one network per input shape
+        
+        A cv2.dnn.Net re-allocates its buffers whenever the input shape
+        changes, so every shape gets its own network that keeps its
+        allocation between requests.
+        
+        Args:
+            read_net: Callable returning a freshly parsed cv2.dnn.Net
+        """
+        self.nets = {}
+        for shape in self._network_shapes():
+            net = read_net()
+            self._configure_net(net)
+            self.nets[shape] = net
+        self.net = self.nets[(self.input_width, self.input_height)]
+    
+    def _configure_net(self, net):
+        """Apply the preferable backend and target to a loaded network"""
+        net.setPreferableBackend(DNN_BACKENDS[self.dnn_backend])
+        net.setPreferableTarget(DNN_TARGETS[self.dnn_target])
+    
+    def input_shapes(self):
+        """List of (width, height) network input shapes this detector runs, smallest first"""
+        return list(self._input_shapes)
+    
+    def _network_shapes(self):
+        """Input shapes that get a network: the input shapes and the coarse pass shape, if any"""
+        if self.coarse_shape is None:
+            return list(self._input_shapes)
+        return [self.coarse_shape] + list(self._input_shapes)
+    
+    def warm_up(self, batch_sizes=(1,), passes=1):
+        """
+        Run forward passes on dummy input so memory allocation and kernel setup
+        happen before the first real request
+        
+        Args:
+            batch_sizes: Batch sizes to warm up for every input shape
+            passes: Forward passes per shape and batch size
+            
+        Returns:
+            Total warm-up time in milliseconds (0 in demo mode)
+        """
+        if self.demo_mode or getattr(self, 'net', None) is None:
+            return 0.0
+        
+        start = time.perf_counter()
+        for input_width, input_height in self._network_shapes():
+            for batch_size in batch_sizes:
+                blob = np.zeros((batch_size, 3, input_height, input_width), dtype=np.float32)
+                net = self.nets[(input_width, input_height)]
+                for _ in range(max(1, passes)):
+                    net.setInput(blob)
+                    self._forward(net)
+        return (time.perf_counter() - start) * 1000.0
+    
+    def benchmark(self, runs=3, batch_size=1):
+        """
+        Measure forward-pass latency for the configured backend, target and input sizes
+        
+        The first pass (which allocates memory and sets up kernels) is reported
+        separately from the steady-state passes.
+        
+        Args:
+            runs: Number of timed steady-state forward passes per input shape
+            batch_size: Number of images per forward pass
+            
+        Returns:
+            List with one dictionary of configuration and latency statistics in
+            milliseconds per input shape, or None in demo mode
+        """
+        if self.demo_mode or getattr(self, 'net', None) is None:
+            return None
+        
+        rng = np.random.default_rng(0)
+        results = []
+        for input_width, input_height in self._network_shapes():
+            net = self.nets[(input_width, input_height)]
+            blob = rng.random((batch_size, 3, input_height, input_width), dtype=np.float32)
+            
+            def timed_forward():
+                start = time.perf_counter()
+                net.setInput(blob)
+                self._forward(net)
+                return (time.perf_counter() - start) * 1000.0
+            
+            first_ms = timed_forward()
+            timings = [timed_forward() for _ in range(max(1, runs))]
+            results.append({
+                "backend": self.dnn_backend,
+                "target": self.dnn_target,
+                "threads": cv2.getNumThreads(),
+                "stages": self.stages or self.profile.stages,
+                "input": f"{input_width}x{input_height}",
+                "batch_size": batch_size,
+                "first_ms": round(first_ms, 2),
+                "mean_ms": round(float(np.mean(timings)), 2),
+                "min_ms": round(float(np.min(timings)), 2),
+                "max_ms": round(float(np.max(timings)), 2),
+                "runs": len(timings),
+            })
+        return results
+    
+    def config_fingerprint(self):
+        """
+        Describe everything that influences detect_pose output for a given image
+        
+        Returns:
+            String that changes whenever the model or input configuration changes
+            (used to key cached pose results)
+        """
+        inputs = ",".join(f"{width}x{height}" for width, height in self.input_shapes())
+        if self.person_crop:
+            inputs += (f";crop={self.coarse_shape[0]}x{self.coarse_shape[1]}/"
+                       f"{self.crop_margin:g}/{self.crop_min_gain:g}")
+        return (f"model={self.model_type};stages={self.stages or 'all'};demo={int(self.demo_mode)};"
+                f"input={inputs};resize={self.resize_mode};peaks={self.peak_mode};"
+                f"dnn={self.dnn_backend}/{self.dnn_target};weights={self.weights_format}")
     
     def detect_pose(self, image):
         """
         Detect pose keypoints in the given image
         
         Args:
-            image: numpy array of the image (BGR format)
+            image: numpy array of the image (BGR format, or RGB with color_order="rgb")
             
         Returns:
             Dictionary containing landmarks and connections
@@ -129,122 +479,487 @@ class OpenPoseDetector:
         Raises:
             RuntimeError: If model weights are not loaded and demo mode is disabled
         """
-        # Get image dimensions
-        image_height, image_width, _ = image.shape
+        return self.detect_pose_batch([image])[0]
+    
+    def detect_pose_batch(self, images):
+        """
+        Detect pose keypoints in several images with a single forward pass per input shape
+        
+        All images are fitted into the network input (see _prepare_blob),
+        stacked into one blob and run through the network together; the
+        heatmaps are then split back per image. With several input shapes the
+        batch is run once per shape and the heatmaps are averaged.
         
+        Args:
+            images: List of numpy arrays (BGR format, or RGB with color_order="rgb"), may differ in size
+            
+        Returns:
+            List of dictionaries containing landmarks and connections, one per image
+            
+        Raises:
+            RuntimeError: If model weights are not loaded and demo mode is disabled
+        """
         # Check if we're in demo mode
         if self.demo_mode:
-            return self._generate_demo_pose(image_width, image_height)
+            metrics.inc("demo_poses_total", len(images))
+            return [self._generate_demo_pose(image.shape[1], image.shape[0]) for image in images]
         
         if not hasattr(self, 'net') or self.net is None:
             raise RuntimeError("OpenPose model not loaded. Please download model weights first.")
         
         try:
-            # Prepare the image for the network
-            # OpenPose requires a fixed size input - we'll use 368x368
-            input_width, input_height = 368, 368
+            if self.person_crop:
+                return self._detect_pose_two_pass(images)
+            scales = self._forward_scales(images, self.input_shapes())
+            return [
+                self._pose_from_scales(scales, i, image.shape[1], image.shape[0]) for i, image in enumerate(images)
+            ]
+        except Exception as e:
+            print(f"Error in OpenPose detection: {e}")
+            raise RuntimeError(f"Pose detection failed: {str(e)}")
+    
+    def _forward_scales(self, images, input_shapes):
+        """
+        Run a batch of images through the network at several input shapes
+        
+        Args:
+            images: List of numpy arrays (in the detector's color order)
+            input_shapes: (width, height) network input shapes, smallest first
             
-            # Create a blob from the image
-            input_blob = cv2.dnn.blobFromImage(
-                image, 1.0 / 255, (input_width, input_height), (0, 0, 0), swapRB=True, crop=False
-            )
+        Returns:
+            List of (input_shape, keypoint heatmaps [N, keypoints, H, W], content_sizes) per shape
+        """
+        num_keypoints = self.profile.num_keypoints
+        expected_channels = (self.profile.output_channels if self.output_layer is None
+                             else self.profile.heatmap_channels)
+        
+        # One forward pass per input shape, each on the network allocated for it
+        scales = []
+        for input_shape in input_shapes:
+            start = time.perf_counter()
+            input_blob, content_sizes = self._prepare_blob(images, *input_shape)
+            net = self.nets[input_shape]
+            net.setInput(input_blob)
+            forward_start = time.perf_counter()
             
-            # Set the input
-            self.net.setInput(input_blob)
+            # Output dimensions: [N, keypoints + background + PAFs, H, W] (see pose_models),
+            # or [N, keypoints + background, H, W] for a truncated network
+            output = self._forward(net)
+            end = time.perf_counter()
+            if output.shape[1] != expected_channels:
+                raise ValueError(f"Network has {output.shape[1]} output channels, the {self.profile.name} "
+                                 f"profile expects {expected_channels} (check OPENPOSE_MODEL)")
+            self._record_latency(input_shape, (end - start) * 1000.0)
+            record_stage("blob", start, forward_start)
+            record_stage("forward", forward_start, end)
+            scales.append((input_shape, output[:, :num_keypoints], content_sizes))
+        return scales
+    
+    def _pose_from_scales(self, scales, i, image_width, image_height):
+        """Fuse the heatmaps of the i-th image of a batch across scales and turn them into a pose"""
+        start = time.perf_counter()
+        heatmaps, input_shape, content_size = self._fuse_scales(
+            [(output[i], input_shape, content_sizes[i]) for input_shape, output, content_sizes in scales]
+        )
+        pose = self._heatmaps_to_pose(heatmaps, image_width, image_height, input_shape, content_size)
+        record_stage("heatmaps", start)
+        return pose
+    
+    def _detect_pose_two_pass(self, images):
+        """
+        Coarse-to-fine detection for photos where the person fills only part of the frame
+        
+        A pass at the coarse input shape locates the person on the full frame
+        (see _person_crop). The input shapes then run on a crop around the
+        person, keeping its aspect ratio, so more of the network input covers
+        the body rather than the background. When the crop would hardly
+        magnify the person, the input shapes run on the full frame instead and
+        the coarse pass is reused as an extra scale of the heatmap fusion.
+        
+        Args:
+            images: List of numpy arrays (in the detector's color order)
             
-            # Forward pass through the network
-            output = self.net.forward()
+        Returns:
+            List of dictionaries containing landmarks and connections, in full frame coordinates
+        """
+        coarse_shape, coarse_output, coarse_sizes = self._forward_scales(images, [self.coarse_shape])[0]
+        crops = []
+        for i, image in enumerate(images):
+            with stage_timer("person_crop"):
+                crops.append(self._person_crop(
+                    coarse_output[i], coarse_shape, coarse_sizes[i], image.shape[1], image.shape[0]
+                ))
+        
+        results = [None] * len(images)
+        full_frame = [i for i, crop in enumerate(crops) if crop is None]
+        if full_frame:
+            scales = [(coarse_shape, coarse_output[full_frame], [coarse_sizes[i] for i in full_frame])]
+            scales += self._forward_scales([images[i] for i in full_frame], self.input_shapes())
+            for j, i in enumerate(full_frame):
+                results[i] = self._pose_from_scales(scales, j, images[i].shape[1], images[i].shape[0])
+            metrics.inc("person_crop_total", len(full_frame), "full_frame")
+        
+        cropped = [i for i, crop in enumerate(crops) if crop is not None]
+        if cropped:
+            crop_images = []
+            for i in cropped:
+                x0, y0, x1, y1 = crops[i]
+                crop_images.append(images[i][y0:y1, x0:x1])
+            scales = self._forward_scales(crop_images, self.input_shapes())
+            for j, i in enumerate(cropped):
+                x0, y0, x1, y1 = crops[i]
+                pose = self._pose_from_scales(scales, j, x1 - x0, y1 - y0)
+                for landmark in pose["landmarks"].values():
+                    if landmark["visibility"] > 0:
+                        landmark["x"] += x0
+                        landmark["y"] += y0
+                pose["image_width"] = images[i].shape[1]
+                pose["image_height"] = images[i].shape[0]
+                results[i] = pose
+            metrics.inc("person_crop_total", len(cropped), "crop")
+        return results
+    
+    def _person_crop(self, heatmaps, input_shape, content_size, image_width, image_height):
+        """
+        Region of an image to run the fine pass on, from the heatmaps of the coarse pass
+        
+        The box around the found keypoints is grown by the crop margin (the
+        keypoints stop short of the top of the head and the soles) and then to
+        the aspect ratio of the network input, so the crop fills the input
+        without padding.
+        
+        Args:
+            heatmaps: Keypoint heatmaps of the coarse pass for one image
+            input_shape: (width, height) of the coarse network input
+            content_size: (width, height) of the image inside the coarse input
+            image_width: Width of the image
+            image_height: Height of the image
             
-            # Extract keypoints
-            keypoints = []
-            landmark_dict = {}
+        Returns:
+            (x0, y0, x1, y1) pixel box, or None if no person was found or the crop
+            wouldn't magnify them by at least crop_min_gain
+        """
+        xs, ys, probs = self._extract_peaks(heatmaps, image_width, image_height, input_shape, content_size)
+        found = np.asarray(probs) > 0.1
+        if found.sum() < 2:
+            return None
+        xs = np.asarray(xs)[found]
+        ys = np.asarray(ys)[found]
+        
+        margin = self.crop_margin * max(xs.max() - xs.min(), ys.max() - ys.min())
+        width = xs.max() - xs.min() + 2 * margin
+        height = ys.max() - ys.min() + 2 * margin
+        aspect = self.input_width / self.input_height
+        width, height = max(width, height * aspect), max(height, width / aspect)
+        width, height = min(width, image_width), min(height, image_height)
+        
+        # Center the box on the person, shifted inside the image where it would stick out
+        center_x = (xs.max() + xs.min()) / 2.0
+        center_y = (ys.max() + ys.min()) / 2.0
+        x0 = int(min(max(0.0, center_x - width / 2.0), image_width - width))
+        y0 = int(min(max(0.0, center_y - height / 2.0), image_height - height))
+        x1 = min(image_width, x0 + int(np.ceil(width)))
+        y1 = min(image_height, y0 + int(np.ceil(height)))
+        
+        # Magnification of the person in the network input, compared to the full frame
+        gain = (min(self.input_width / (x1 - x0), self.input_height / (y1 - y0))
+                / min(self.input_width / image_width, self.input_height / image_height))
+        if gain < self.crop_min_gain:
+            return None
+        return x0, y0, x1, y1
+    
+    def _record_latency(self, input_shape, elapsed_ms):
+        """Add one forward pass to the latency statistics of its input shape"""
+        stats = self.scale_latency[input_shape]
+        stats[0] += 1
+        stats[1] += elapsed_ms
+        stats[2] = max(stats[2], elapsed_ms)
+    
+    def _content_size(self, image_width, image_height, input_width, input_height):
+        """
+        Size an image is resized to inside the network input
+        
+        In letterbox mode the aspect ratio is kept and the image is anchored at
+        the top-left corner of the input, so network coordinates map back to
+        the image with a plain per-axis scale.
+        """
+        if self.resize_mode == "stretch":
+            return input_width, input_height
+        scale = min(input_width / image_width, input_height / image_height)
+        return (min(input_width, max(1, int(round(image_width * scale)))),
+                min(input_height, max(1, int(round(image_height * scale)))))
+    
+    def _prepare_blob(self, images, input_width, input_height):
+        """
+        Build the network input blob for a batch of images at one input shape
+        
+        Args:
+            images: List of numpy arrays (in the detector's color order)
+            input_width: Network input width
+            input_height: Network input height
+            
+        Returns:
+            (blob, content_sizes) where content_sizes holds the (width, height)
+            every image occupies inside the input
+        """
+        swap_rb = self.color_order == "bgr"
+        content_sizes = [
+            self._content_size(image.shape[1], image.shape[0], input_width, input_height) for image in images
+        ]
+        if self.resize_mode == "stretch":
+            blob = cv2.dnn.blobFromImages(
+                images, 1.0 / 255, (input_width, input_height), (0, 0, 0), swapRB=swap_rb, crop=False
+            )
+            return blob, content_sizes
+        
+        # Letterbox: resize keeping the aspect ratio and zero-pad the right/bottom
+        canvas = np.zeros((len(images), input_height, input_width, 3), dtype=np.uint8)
+        for padded, image, (content_width, content_height) in zip(canvas, images, content_sizes):
+            padded[:content_height, :content_width] = cv2.resize(image, (content_width, content_height))
+        blob = cv2.dnn.blobFromImages(
+            list(canvas), 1.0 / 255, (input_width, input_height), (0, 0, 0), swapRB=swap_rb, crop=False
+        )
+        return blob, content_sizes
+    
+    @staticmethod
+    def _fuse_scales(scales):
+        """
+        Average the keypoint heatmaps of one image across input scales
+        
+        Every scale is resampled onto the heatmap grid of the largest one. As
+        images are anchored at the top-left corner of the input, this is a pure
+        per-axis scale by the ratio of the content sizes in heatmap cells.
+        
+        Args:
+            scales: List of (heatmaps, input_shape, content_size) per scale,
+                ordered from the smallest to the largest input
+            
+        Returns:
+            (heatmaps, input_shape, content_size) of the largest scale, with
+            averaged heatmaps
+        """
+        if len(scales) == 1:
+            return scales[0]
+        
+        heatmaps, input_shape, content_size = scales[-1]
+        num_keypoints, map_height, map_width = heatmaps.shape
+        ref_cells_x = content_size[0] * map_width / input_shape[0]
+        ref_cells_y = content_size[1] * map_height / input_shape[1]
+        
+        fused = heatmaps.transpose(1, 2, 0).astype(np.float32)
+        for scale_heatmaps, scale_input, scale_content in scales[:-1]:
+            _, scale_map_height, scale_map_width = scale_heatmaps.shape
+            fx = ref_cells_x / (scale_content[0] * scale_map_width / scale_input[0])
+            fy = ref_cells_y / (scale_content[1] * scale_map_height / scale_input[1])
+            resampled = cv2.resize(np.ascontiguousarray(scale_heatmaps.transpose(1, 2, 0)), None, fx=fx, fy=fy)
+            resampled = resampled.reshape(resampled.shape[0], resampled.shape[1], num_keypoints)
+            height = min(map_height, resampled.shape[0])
+            width = min(map_width, resampled.shape[1])
+            fused[:height, :width] += resampled[:height, :width]
+        fused /= len(scales)
+        return fused.transpose(2, 0, 1), input_shape, content_size
+    
+    def _heatmaps_to_pose(self, heatmaps, image_width, image_height, input_shape=None, content_size=None):
+        """
+        Turn the network output for one image into landmarks and connections
+        
+        Args:
+            heatmaps: Network output for a single image, shape [channels, H, W]
+            image_width: Width of the original image
+            image_height: Height of the original image
+            input_shape: (width, height) of the network input (None: the heatmaps cover the whole image)
+            content_size: (width, height) of the image inside the network input
+            
+        Returns:
+            Dictionary containing landmarks and connections
+        """
+        # Extract keypoints
+        keypoints = []
+        landmark_dict = {}
+        
+        # Locate the maximum of every keypoint heatmap
+        xs, ys, probs = self._extract_peaks(
+            heatmaps[:self.profile.num_keypoints], image_width, image_height, input_shape, content_size
+        )
+        
+        for i, landmark_name in enumerate(self.profile.landmarks):
+            x = xs[i]
+            y = ys[i]
+            prob = probs[i]
             
-            # Output dimensions: [1, 19 (number of keypoints + background), H, W]
-            # For each keypoint, we get a heatmap
-            for i in range(len(self.KEYPOINT_MAPPING)):
-                # Get the probability map for this keypoint
-                prob_map = output[0, i, :, :]
-                prob_map = cv2.resize(prob_map, (image_width, image_height))
+            # Add the keypoint if the probability is greater than a threshold
+            if prob > 0.1:
+                keypoints.append((i, x, y, prob))
                 
-                # Find global maxima of the probability map
-                _, prob, _, point = cv2.minMaxLoc(prob_map)
+                # Add to landmark dictionary with MediaPipe-compatible naming
+                landmark_dict[landmark_name] = {
+                    "x": float(x),
+                    "y": float(y),
+                    "z": 0.0,  # OpenPose doesn't provide z-coordinate
+                    "visibility": float(prob)
+                }
                 
-                x = point[0]
-                y = point[1]
+                # Validate required keypoints
+                if landmark_name in self.profile.required_landmarks and prob < 0.3:
+                    print(f"Warning: Low confidence ({prob:.2f}) for required keypoint {landmark_name}")
+                    metrics.inc("low_confidence_keypoints_total", 1, landmark_name)
+            else:
+                # Add with zero visibility if below threshold
+                metrics.inc("low_confidence_keypoints_total", 1, landmark_name)
                 
-                # Add the keypoint if the probability is greater than a threshold
-                if prob > 0.1:
-                    keypoints.append((i, x, y, prob))
-                    
-                    # Add to landmark dictionary with MediaPipe-compatible naming
-                    landmark_name = self.KEYPOINT_MAPPING[i]
-                    landmark_dict[landmark_name] = {
-                        "x": float(x),
-                        "y": float(y),
-                        "z": 0.0,  # OpenPose doesn't provide z-coordinate
-                        "visibility": float(prob)
-                    }
-                    
-                    # Validate required keypoints
-                    required_keypoints = ["LEFT_SHOULDER", "RIGHT_SHOULDER",
-                                        "LEFT_HIP", "RIGHT_HIP",
-                                        "LEFT_KNEE", "LEFT_ANKLE"]
-                    if landmark_name in required_keypoints and prob < 0.3:
-                        print(f"Warning: Low confidence ({prob:.2f}) for required keypoint {landmark_name}")
-                else:
-                    # Add with zero visibility if below threshold
-                    landmark_name = self.KEYPOINT_MAPPING[i]
-                    
-                    # Attempt to infer position using anatomical constraints if key points are missing
-                    inferred_position = self._infer_missing_keypoint(i, landmark_dict)
-                    
-                    landmark_dict[landmark_name] = {
-                        "x": float(inferred_position[0] if inferred_position else 0),
-                        "y": float(inferred_position[1] if inferred_position else 0),
-                        "z": 0.0,
-                        "visibility": 0.05 if inferred_position else 0.0  # Lower visibility for inferred points
-                    }
-        except Exception as e:
-            print(f"Error in OpenPose detection: {e}")
-            raise RuntimeError(f"Pose detection failed: {str(e)}")
-        
-        # Create connections list for visualization
-        connections = []
-        for pair in self.POSE_PAIRS:
-            from_idx, to_idx = pair
-            
-            if from_idx in self.KEYPOINT_MAPPING and to_idx in self.KEYPOINT_MAPPING:
-                from_name = self.KEYPOINT_MAPPING[from_idx]
-                to_name = self.KEYPOINT_MAPPING[to_idx]
+                # Attempt to infer position using anatomical constraints if key points are missing
+                with stage_timer("infer_missing_keypoint"):
+                    inferred_position = self._infer_missing_keypoint(landmark_name, landmark_dict)
                 
-                connections.append({
-                    "from": from_name,
-                    "to": to_name
-                })
+                landmark_dict[landmark_name] = {
+                    "x": float(inferred_position[0] if inferred_position else 0),
+                    "y": float(inferred_position[1] if inferred_position else 0),
+                    "z": 0.0,
+                    "visibility": 0.05 if inferred_position else 0.0  # Lower visibility for inferred points
+                }
+        
+        return {
+            "landmarks": landmark_dict,
+            "connections": self._connections(),
+            "image_width": image_width,
+            "image_height": image_height
+        }
+    
+    def _connections(self):
+        """Connections list for visualization"""
+        return [{"from": from_name, "to": to_name} for from_name, to_name in self.profile.pairs]
+    
+    def _generate_demo_pose(self, image_width, image_height):
+        """
+        Synthetic pose used in demo mode, when the model isn't loaded
         
+        The person of synthetic_pose standing in the middle of the image, with
+        the same keypoints and confidences the synthetic pose backend reports
+        for the detector's model profile.
+        
+        Args:
+            image_width: Width of the image
+            image_height: Height of the image
+            
+        Returns:
+            Dictionary containing landmarks and connections
+        """
+        landmark_dict = {}
+        for landmark_name in self.profile.landmarks:
+            fx, fy = synthetic_pose.SKELETON[landmark_name]
+            landmark_dict[landmark_name] = {
+                "x": float(fx * image_width),
+                "y": float(fy * image_height),
+                "z": 0.0,
+                "visibility": float(synthetic_pose.peak_confidence(landmark_name))
+            }
         return {
             "landmarks": landmark_dict,
-            "connections": connections,
+            "connections": self._connections(),
             "image_width": image_width,
             "image_height": image_height
         }
         
     
-    def _infer_missing_keypoint(self, keypoint_idx, existing_landmarks):
+    def _extract_peaks(self, heatmaps, image_width, image_height, input_shape=None, content_size=None):
+        """
+        Find the global maximum of each keypoint heatmap in image coordinates
+        
+        Args:
+            heatmaps: Keypoint heatmaps for one image, shape [K, H, W]
+            image_width: Width of the original image
+            image_height: Height of the original image
+            input_shape: (width, height) of the network input (None: the heatmaps cover the whole image)
+            content_size: (width, height) of the image inside the network input
+            
+        Returns:
+            Tuple of (x, y, probability) arrays with one entry per keypoint
+        """
+        if input_shape is None:
+            map_height, map_width = heatmaps.shape[1:]
+            input_shape = content_size = (map_width, map_height)
+        if self.peak_mode == "reference":
+            return self._extract_peaks_reference(heatmaps, image_width, image_height, input_shape, content_size)
+        return self._extract_peaks_lowres(heatmaps, image_width, image_height, input_shape, content_size)
+    
+    @staticmethod
+    def _extract_peaks_lowres(heatmaps, image_width, image_height, input_shape, content_size):
+        """
+        Vectorized peak extraction on the native network output resolution
+        
+        Takes the argmax of all heatmaps at once (restricted to the cells the
+        image covers, so letterbox padding is never picked), refines it to
+        sub-pixel precision with a quadratic fit through the neighbouring
+        values along each axis, and maps the result to image space using the
+        same pixel-center convention as cv2.resize.
+        """
+        _, map_height, map_width = heatmaps.shape
+        
+        # Heatmap cells per image pixel along each axis
+        cells_x = content_size[0] * map_width / input_shape[0] / image_width
+        cells_y = content_size[1] * map_height / input_shape[1] / image_height
+        heatmaps = heatmaps[:, :min(map_height, int(np.ceil(cells_y * image_height))),
+                            :min(map_width, int(np.ceil(cells_x * image_width)))]
+        num_keypoints, map_height, map_width = heatmaps.shape
+        flat = heatmaps.reshape(num_keypoints, -1)
+        keypoint_idx = np.arange(num_keypoints)
+        
+        peak_idx = flat.argmax(axis=1)
+        probs = flat[keypoint_idx, peak_idx]
+        peak_y, peak_x = np.divmod(peak_idx, map_width)
+        
+        def refine(before, after, inside):
+            # Vertex of the parabola through (-1, before), (0, peak), (1, after)
+            curvature = before - 2 * probs + after
+            with np.errstate(divide="ignore", invalid="ignore"):
+                offset = np.where(inside & (curvature < 0), 0.5 * (before - after) / curvature, 0.0)
+            return np.clip(offset, -0.5, 0.5)
+        
+        dx = refine(heatmaps[keypoint_idx, peak_y, np.maximum(peak_x - 1, 0)],
+                    heatmaps[keypoint_idx, peak_y, np.minimum(peak_x + 1, map_width - 1)],
+                    (peak_x > 0) & (peak_x < map_width - 1))
+        dy = refine(heatmaps[keypoint_idx, np.maximum(peak_y - 1, 0), peak_x],
+                    heatmaps[keypoint_idx, np.minimum(peak_y + 1, map_height - 1), peak_x],
+                    (peak_y > 0) & (peak_y < map_height - 1))
+        
+        xs = (peak_x + dx + 0.5) / cells_x - 0.5
+        ys = (peak_y + dy + 0.5) / cells_y - 0.5
+        xs = np.clip(xs, 0, image_width - 1)
+        ys = np.clip(ys, 0, image_height - 1)
+        return xs, ys, probs
+    
+    @staticmethod
+    def _extract_peaks_reference(heatmaps, image_width, image_height, input_shape, content_size):
+        """
+        Reference peak extraction: upsample every heatmap to the full image
+        size and take its maximum (slow for large images, kept to compare accuracy)
+        """
+        xs, ys, probs = [], [], []
+        for prob_map in heatmaps:
+            if tuple(content_size) != tuple(input_shape):
+                # Upsample to the network input and cut away the letterbox padding first
+                prob_map = cv2.resize(prob_map, tuple(input_shape))[:content_size[1], :content_size[0]]
+            prob_map = cv2.resize(prob_map, (image_width, image_height))
+            
+            # Find global maxima of the probability map
+            _, prob, _, point = cv2.minMaxLoc(prob_map)
+            xs.append(point[0])
+            ys.append(point[1])
+            probs.append(prob)
+        return np.array(xs), np.array(ys), np.array(probs)
+    
+    def _infer_missing_keypoint(self, keypoint_name, existing_landmarks):
         """
         Attempts to infer missing keypoint positions based on anatomical constraints
         and relationships between body parts
         
         Args:
-            keypoint_idx: Index of the missing keypoint
+            keypoint_name: Landmark name of the missing keypoint (see pose_models)
             existing_landmarks: Dictionary of already detected landmarks
             
         Returns:
             (x, y) tuple of inferred position, or None if inference not possible
         """
-        # Map keypoint index to name
-        keypoint_name = self.KEYPOINT_MAPPING[keypoint_idx]
-        
         # Define helper function to check if a landmark exists and is visible
         def is_valid(lm_name):
             return (lm_name in existing_landmarks and
@@ -258,8 +973,7 @@ class OpenPoseDetector:
         
         # Infer different keypoints based on their anatomical relationships
         
-        # Nose (0)
-        if keypoint_idx == 0:
+        if keypoint_name == "NOSE":
             # If both eyes are visible, nose is between them but slightly lower
             if is_valid("LEFT_EYE") and is_valid("RIGHT_EYE"):
                 left_eye = pos("LEFT_EYE")
@@ -267,8 +981,7 @@ class OpenPoseDetector:
                 return ((left_eye[0] + right_eye[0]) / 2,
                         (left_eye[1] + right_eye[1]) / 2 + 10)  # Slightly below eyes
         
-        # Neck (1)
-        elif keypoint_idx == 1:
+        elif keypoint_name == "NECK":
             # If shoulders are visible, neck is between them but slightly higher
             if is_valid("LEFT_SHOULDER") and is_valid("RIGHT_SHOULDER"):
                 left_shoulder = pos("LEFT_SHOULDER")
@@ -276,8 +989,7 @@ class OpenPoseDetector:
                 return ((left_shoulder[0] + right_shoulder[0]) / 2,
                         (left_shoulder[1] + right_shoulder[1]) / 2 - 15)  # Above shoulders
         
-        # Right Shoulder (2)
-        elif keypoint_idx == 2:
+        elif keypoint_name == "RIGHT_SHOULDER":
             # If neck and right elbow are visible
             if is_valid("NECK") and is_valid("RIGHT_ELBOW"):
                 neck = pos("NECK")
@@ -286,8 +998,7 @@ class OpenPoseDetector:
                 return (neck[0] + (right_elbow[0] - neck[0]) * 0.25,
                         neck[1] + (right_elbow[1] - neck[1]) * 0.25)
         
-        # Left Shoulder (5)
-        elif keypoint_idx == 5:
+        elif keypoint_name == "LEFT_SHOULDER":
             # If neck and left elbow are visible
             if is_valid("NECK") and is_valid("LEFT_ELBOW"):
                 neck = pos("NECK")
@@ -296,8 +1007,7 @@ class OpenPoseDetector:
                 return (neck[0] + (left_elbow[0] - neck[0]) * 0.25,
                         neck[1] + (left_elbow[1] - neck[1]) * 0.25)
         
-        # Right Hip (8)
-        elif keypoint_idx == 8:
+        elif keypoint_name == "RIGHT_HIP":
             # If right knee and right shoulder are visible
             if is_valid("RIGHT_KNEE") and is_valid("RIGHT_SHOULDER"):
                 right_knee = pos("RIGHT_KNEE")
@@ -306,8 +1016,7 @@ class OpenPoseDetector:
                 return (right_shoulder[0] + (right_knee[0] - right_shoulder[0]) * 0.33,
                         right_shoulder[1] + (right_knee[1] - right_shoulder[1]) * 0.33)
         
-        # Left Hip (11)
-        elif keypoint_idx == 11:
+        elif keypoint_name == "LEFT_HIP":
             # If left knee and left shoulder are visible
             if is_valid("LEFT_KNEE") and is_valid("LEFT_SHOULDER"):
                 left_knee = pos("LEFT_KNEE")
@@ -316,29 +1025,28 @@ class OpenPoseDetector:
                 return (left_shoulder[0] + (left_knee[0] - left_shoulder[0]) * 0.33,
                         left_shoulder[1] + (left_knee[1] - left_shoulder[1]) * 0.33)
         
-        # If we can't infer the position using anatomical constraints, we'll look at symmetry
+        elif keypoint_name == "CHEST":
+            # If the neck and both hips are visible, the chest (MPI) is halfway down the torso
+            if is_valid("NECK") and is_valid("LEFT_HIP") and is_valid("RIGHT_HIP"):
+                neck = pos("NECK")
+                hip_center = ((pos("LEFT_HIP")[0] + pos("RIGHT_HIP")[0]) / 2,
+                              (pos("LEFT_HIP")[1] + pos("RIGHT_HIP")[1]) / 2)
+                return (neck[0] + (hip_center[0] - neck[0]) * 0.5,
+                        neck[1] + (hip_center[1] - neck[1]) * 0.5)
         
-        # Check if we can infer based on symmetry (right/left counterparts)
-        symmetric_pairs = {
-            2: 5,  # Right/Left Shoulder
-            3: 6,  # Right/Left Elbow
-            4: 7,  # Right/Left Wrist
-            8: 11, # Right/Left Hip
-            9: 12, # Right/Left Knee
-            10: 13, # Right/Left Ankle
-            14: 15, # Right/Left Eye
-            16: 17  # Right/Left Ear
-        }
+        elif keypoint_name == "HEAD":
+            # If neck and chest are visible, the head top (MPI) continues the torso line upwards
+            if is_valid("NECK") and is_valid("CHEST"):
+                neck = pos("NECK")
+                chest = pos("CHEST")
+                return (neck[0] + (neck[0] - chest[0]) * 0.8,
+                        neck[1] + (neck[1] - chest[1]) * 0.8)
         
-        # Create a reverse mapping as well
-        reverse_pairs = {v: k for k, v in symmetric_pairs.items()}
-        symmetric_pairs.update(reverse_pairs)
+        # If we can't infer the position using anatomical constraints, we'll look at symmetry
         
-        # Check if we can use symmetry
-        if keypoint_idx in symmetric_pairs:
-            symmetric_idx = symmetric_pairs[keypoint_idx]
-            symmetric_name = self.KEYPOINT_MAPPING[symmetric_idx]
-            
+        # Check if we can infer based on symmetry (right/left counterparts)
+        symmetric_name = self.profile.symmetric.get(keypoint_name)
+        if symmetric_name is not None:
             # If the symmetric keypoint exists and is visible
             if is_valid(symmetric_name):
                 symmetric_pos = pos(symmetric_name)
@@ -350,11 +1058,15 @@ class OpenPoseDetector:
                 # Find the midline x-coordinate
                 midline_x = None
                 
-                # Try to find midline using nose/neck
+                # Try to find midline using nose/neck (head/chest on MPI)
                 if is_valid("NOSE"):
                     midline_x = pos("NOSE")[0]
                 elif is_valid("NECK"):
                     midline_x = pos("NECK")[0]
+                elif is_valid("HEAD"):
+                    midline_x = pos("HEAD")[0]
+                elif is_valid("CHEST"):
+                    midline_x = pos("CHEST")[0]
                 # If we have both shoulders or both hips, use their midpoint
                 elif is_valid("LEFT_SHOULDER") and is_valid("RIGHT_SHOULDER"):
                     midline_x = (pos("LEFT_SHOULDER")[0] + pos("RIGHT_SHOULDER")[0]) / 2
@@ -390,20 +1102,14 @@ class OpenPoseDetector:
                 cv2.putText(img_copy, name, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
         
         # Draw connections
-        for pair in self.POSE_PAIRS:
-            from_idx, to_idx = pair
-            
-            if from_idx in self.KEYPOINT_MAPPING and to_idx in self.KEYPOINT_MAPPING:
-                from_name = self.KEYPOINT_MAPPING[from_idx]
-                to_name = self.KEYPOINT_MAPPING[to_idx]
+        for from_name, to_name in self.profile.pairs:
+            if (from_name in landmarks and to_name in landmarks and 
+                landmarks[from_name]["visibility"] > 0.1 and 
+                landmarks[to_name]["visibility"] > 0.1):
+                
+                from_x, from_y = int(landmarks[from_name]["x"]), int(landmarks[from_name]["y"])
+                to_x, to_y = int(landmarks[to_name]["x"]), int(landmarks[to_name]["y"])
                 
-                if (from_name in landmarks and to_name in landmarks and 
-                    landmarks[from_name]["visibility"] > 0.1 and 
-                    landmarks[to_name]["visibility"] > 0.1):
-                    
-                    from_x, from_y = int(landmarks[from_name]["x"]), int(landmarks[from_name]["y"])
-                    to_x, to_y = int(landmarks[to_name]["x"]), int(landmarks[to_name]["y"])
-                    
-                    cv2.line(img_copy, (from_x, from_y), (to_x, to_y), (0, 255, 0), 2)
+                cv2.line(img_copy, (from_x, from_y), (to_x, to_y), (0, 255, 0), 2)
         
         return img_copy
\ No newline at end of file
@@ -0,0 +1,216 @@
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+
+class PoseResultCache:
+    """
+    Content-addressed cache for pose detection results
+
+    Results are keyed by a hash of the uploaded image bytes plus the detector's
+    model/input configuration, so the same photo uploaded to /detect-pose/ and
+    then /predict-size/ only runs through OpenPose once. Entries are evicted in
+    LRU order when either the entry limit or the memory cap is exceeded, and
+    expire after `ttl_seconds`.
+
+    Concurrent requests for the same key are coalesced: the first one starts
+    the inference and the others await the same in-flight result.
+
+    The cache is only used from the asyncio event loop, so it needs no locking.
+
+    Args:
+        max_entries: Maximum number of cached results (0 disables caching)
+        max_bytes: Approximate memory cap for cached results
+        ttl_seconds: Time-to-live of a cached result (0 means no expiry)
+    """
+
+    def __init__(self, max_entries=256, max_bytes=16 * 1024 * 1024, ttl_seconds=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        # key -> (expires_at, size_bytes, result)
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def make_key(contents, config_fingerprint):
+        """
+        Build a cache key for an uploaded image
+
+        Args:
+            contents: Raw bytes of the uploaded image
+            config_fingerprint: Detector configuration string (see OpenPoseDetector.config_fingerprint)
+
+        Returns:
+            Hex digest identifying the image/configuration combination
+        """
+        digest = hashlib.sha256(config_fingerprint.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(contents)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return a copy of the cached result for `key`, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, _, result = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return copy.deepcopy(result)
+
+    def put(self, key, result):
+        """Store a pose result, evicting least recently used entries as needed"""
+        if not self.enabled:
+            return
+
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        self._entries[key] = (expires_at, size, copy.deepcopy(result))
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    async def get_or_compute(self, key, compute):
+        """
+        Return the cached result for `key`, computing it at most once
+
+        Args:
+            key: Cache key from make_key
+            compute: Zero-argument coroutine function producing the result
+
+        Returns:
+            The pose result (a private copy the caller may modify)
+        """
+        async def compute_many(indices):
+            return [await compute()]
+
+        return (await self.get_or_compute_many([key], compute_many))[0]
+
+    async def get_or_compute_many(self, keys, compute_many, return_exceptions=False):
+        """
+        Resolve several keys at once, computing all misses together
+
+        Cached keys are answered immediately, keys already being computed by
+        another request are awaited, and the remaining misses are passed to a
+        single `compute_many` call (so e.g. they can share one inference batch).
+
+        Args:
+            keys: List of cache keys from make_key
+            compute_many: Coroutine function taking the list of indices (into `keys`)
+                that must be computed and returning one result per index; an item
+                may be an Exception instance to fail only that key
+            return_exceptions: Return failures in place instead of raising the first one
+
+        Returns:
+            List of pose results (private copies), one per key
+        """
+        if not self.enabled:
+            results = await compute_many(list(range(len(keys))))
+            return self._unwrap(results, return_exceptions)
+
+        results = [None] * len(keys)
+        waiting = {}
+        missing = []
+        missing_keys = set()
+        for index, key in enumerate(keys):
+            cached = self.get(key)
+            if cached is not None:
+                self.hits += 1
+                results[index] = cached
+            elif key in self._inflight:
+                self.coalesced += 1
+                waiting[index] = self._inflight[key]
+            elif key in missing_keys:
+                # Same upload twice in one call - compute it once
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                missing.append(index)
+                missing_keys.add(key)
+
+        if missing:
+            batch_task = asyncio.ensure_future(compute_many(missing))
+            for position, index in enumerate(missing):
+                key = keys[index]
+                task = asyncio.ensure_future(self._pick(batch_task, position))
+                self._inflight[key] = task
+                task.add_done_callback(lambda done, key=key: self._finish(key, done))
+
+        for index, key in enumerate(keys):
+            if results[index] is None and index not in waiting:
+                waiting[index] = self._inflight[key]
+
+        if waiting:
+            # Shield the shared tasks so one cancelled client doesn't cancel them for the others
+            outcomes = await asyncio.gather(
+                *[asyncio.shield(task) for task in waiting.values()],
+                return_exceptions=True
+            )
+            for index, outcome in zip(waiting, outcomes):
+                results[index] = outcome if isinstance(outcome, BaseException) else copy.deepcopy(outcome)
+
+        return self._unwrap(results, return_exceptions)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+    @staticmethod
+    async def _pick(batch_task, position):
+        result = (await batch_task)[position]
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    @staticmethod
+    def _unwrap(results, return_exceptions):
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        return results
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        # Failures are not cached; retrieving the exception also keeps asyncio quiet
+        # when every waiter has gone away
+        if task.exception() is None:
+            self.put(key, task.result())
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
@@ -1,42 +1,230 @@
-from openpose_utils import OpenPoseDetector
+import functools
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
 import cv2
-import numpy as np
 
-# Global pose detector instance
-pose_detector = None
+from openpose_utils import OpenPoseDetector
+from config import settings
+from pose_models import candidate_profiles
+from synthetic_pose import SyntheticPoseNet
+
+# Pose networks selectable with POSE_BACKEND
+POSE_BACKENDS = ("openpose", "synthetic")
 
-def initialize_pose_detector():
-    """Initialize the OpenPose detector"""
-    global pose_detector
-    try:
-        pose_detector = OpenPoseDetector()
-        print("OpenPose detector initialized successfully")
-        if hasattr(pose_detector, 'demo_mode') and pose_detector.demo_mode:
+class DetectorPool:
+    """
+    Pool of independent OpenPose detector instances for parallel inference
+    
+    cv2.dnn.Net is not safe to call setInput/forward on from several threads,
+    so every inference checks out its own detector and returns it afterwards.
+    The model files are read from disk once and every network is built from
+    the same in-memory copy.
+    
+    State that belongs to the service rather than to one network (fixed pose
+    mode and its reference landmarks) lives on the pool, so all detectors see
+    the same values.
+    
+    Args:
+        size: Number of detector instances
+        model_path: Model directory, relative to the backend directory
+        model_cache_dir: Directory of prepared fast-loading models (None loads the source files)
+        fp16_weights: Use FP16 weights from the model cache
+        **detector_options: Options passed to every OpenPoseDetector (peak_mode, dnn_backend,
+            dnn_target, input_heights, input_aspect, resize_mode, color_order, read_net, model_profile,
+            stages, person_crop, crop_input_height, crop_margin, crop_min_gain)
+    """
+    
+    def __init__(self, size, model_path="models/openpose", model_cache_dir=None, fp16_weights=True,
+                 **detector_options):
+        start = time.perf_counter()
+        self.size = max(1, int(size))
+        self.benchmark_results = None
+        self.warmup_ms = None
+        self._available = queue.LifoQueue()
+        
+        # Shared fixed pose mode state
+        self._state_lock = threading.Lock()
+        self.fixed_pose_mode = False
+        self.reference_landmarks = None
+        
+        # OpenCV networks can't share weight blobs, but they can all be parsed from one read of the files
+        model_buffers = None
+        if detector_options.get("read_net") is None:
+            model_buffers = OpenPoseDetector.read_model_buffers(
+                model_path, model_cache_dir, fp16_weights, detector_options.get("model_profile", "auto")
+            )
+        self.model_read_ms = model_buffers["read_ms"] if model_buffers is not None else None
+        self._detectors = [
+            OpenPoseDetector(model_path, model_buffers=model_buffers, model_cache_dir=model_cache_dir,
+                             fp16_weights=fp16_weights, **detector_options)
+            for _ in range(self.size)
+        ]
+        for detector in self._detectors:
+            self._available.put(detector)
+        
+        self.startup_ms = (time.perf_counter() - start) * 1000.0
+        print(f"Detector pool ready with {self.size} instance(s) in {self.startup_ms:.0f} ms")
+        if self._detectors[0].demo_mode:
             print("Running in DEMO mode with synthetic poses - model weights not found")
-        return pose_detector
-    except Exception as e:
-        print(f"Error initializing OpenPose detector: {e}")
-        print("Please make sure the model files are downloaded correctly.")
-        # We'll create the detector in demo mode
+    
+    @contextmanager
+    def checkout(self, timeout=None):
+        """
+        Borrow a detector for one inference
+        
+        Args:
+            timeout: Seconds to wait for a free detector (None waits forever)
+            
+        Yields:
+            An OpenPoseDetector no other thread is using
+        """
+        detector = self._available.get(timeout=timeout)
         try:
-            # Force demo mode
-            pose_detector = OpenPoseDetector()
-            pose_detector.demo_mode = True
-            print("Falling back to DEMO mode with synthetic poses")
-            return pose_detector
-        except Exception as e2:
-            print(f"Could not initialize even in demo mode: {e2}")
-            return None
+            yield detector
+        finally:
+            self._available.put(detector)
+    
+    def warm_up(self, batch_sizes=(1,), passes=1):
+        """
+        Warm up every detector in the pool at every input shape and batch size
+        
+        Must be called before the pool starts serving inferences.
+        
+        Returns:
+            Total warm-up time in milliseconds
+        """
+        total_ms = 0.0
+        for detector in self._detectors:
+            total_ms += detector.warm_up(batch_sizes, passes)
+        self.warmup_ms = total_ms
+        if total_ms > 0:
+            print(f"Warmed up {self.size} detector(s) for batch sizes {list(batch_sizes)} in {total_ms:.0f} ms")
+        return total_ms
+    
+    def run_benchmark(self, runs=3):
+        """
+        Benchmark forward-pass latency on one of the pool's detectors
+        
+        Args:
+            runs: Number of timed forward passes
+            
+        Returns:
+            Benchmark results per input shape (see OpenPoseDetector.benchmark), or None in demo mode
+        """
+        with self.checkout() as detector:
+            self.benchmark_results = detector.benchmark(runs)
+        for result in self.benchmark_results or []:
+            print(f"OpenPose benchmark ({result['backend']}/{result['target']}, {result['threads']} threads, "
+                  f"{result['input']}): first pass {result['first_ms']:.1f} ms, "
+                  f"steady state {result['mean_ms']:.1f} ms (min {result['min_ms']:.1f}, max {result['max_ms']:.1f})")
+        return self.benchmark_results
+    
+    def set_fixed_pose(self, enabled, reference_landmarks=None):
+        """Enable or disable fixed pose mode for all detectors in the pool"""
+        with self._state_lock:
+            self.fixed_pose_mode = bool(enabled)
+            if reference_landmarks is not None:
+                self.reference_landmarks = reference_landmarks
+    
+    def scale_latency(self):
+        """Forward-pass latency per input shape, summed over all detectors in the pool"""
+        totals = {}
+        for detector in self._detectors:
+            for shape, (passes, total_ms, max_ms) in list(detector.scale_latency.items()):
+                entry = totals.setdefault(shape, [0, 0.0, 0.0])
+                entry[0] += passes
+                entry[1] += total_ms
+                entry[2] = max(entry[2], max_ms)
+        return [
+            {
+                "input": f"{width}x{height}",
+                "passes": passes,
+                "mean_ms": round(total_ms / passes, 2) if passes else None,
+                "max_ms": round(max_ms, 2) if passes else None,
+            }
+            for (width, height), (passes, total_ms, max_ms) in totals.items()
+        ]
+    
+    def describe(self):
+        """Summarize the pool's model and fixed pose state"""
+        detector = self._detectors[0]
+        return {
+            "demo_mode": bool(detector.demo_mode),
+            "model_loaded": getattr(detector, "net", None) is not None,
+            "model_type": detector.model_type,
+            "stages": detector.stages or detector.profile.stages,
+            "fixed_pose_mode": self.fixed_pose_mode,
+            "has_reference_pose": self.reference_landmarks is not None,
+            "config_fingerprint": detector.config_fingerprint(),
+            "pool_size": self.size,
+            "dnn_backend": detector.dnn_backend,
+            "dnn_target": detector.dnn_target,
+            "num_threads": cv2.getNumThreads(),
+            "weights_format": detector.weights_format,
+            "input_shapes": [f"{width}x{height}" for width, height in detector.input_shapes()],
+            "resize_mode": detector.resize_mode,
+            "person_crop_input": (f"{detector.coarse_shape[0]}x{detector.coarse_shape[1]}"
+                                  if detector.person_crop else None),
+            "startup_ms": round(self.startup_ms, 1),
+            "model_read_ms": round(self.model_read_ms, 1) if self.model_read_ms is not None else None,
+            "model_load_ms": [
+                round(d.load_time_ms, 1) if d.load_time_ms is not None else None for d in self._detectors
+            ],
+            "warmup_ms": round(self.warmup_ms, 1) if self.warmup_ms is not None else None,
+            "benchmark": self.benchmark_results,
+        }
 
-def detect_pose_in_image(detector, img_bgr):
+def create_detector_pool(size, read_net=None):
     """
-    Detect pose landmarks in an image using OpenPose
+    Create a pool of OpenPose detectors configured from settings
+    
+    Used as the factory for the inference executor. Must stay a module-level
+    function so it can be pickled for process workers. The service decodes
+    uploads straight to RGB, so the detectors take RGB images.
     
     Args:
-        detector: OpenPose detector instance
-        img_bgr: Image in BGR format (OpenCV)
-        
-    Returns:
-        Dictionary containing landmarks and connections
+        size: Number of detectors
+        read_net: Optional picklable callable returning the network of each detector
+            instead of the OpenPose model (see synthetic_pose.SyntheticPoseNet);
+            defaults to the network selected by POSE_BACKEND
     """
-    return detector.detect_pose(img_bgr)
\ No newline at end of file
+    if settings.pose_backend not in POSE_BACKENDS:
+        raise ValueError(f"Unknown pose backend '{settings.pose_backend}', expected one of {POSE_BACKENDS}")
+    if read_net is None and settings.pose_backend == "synthetic":
+        read_net = functools.partial(
+            SyntheticPoseNet,
+            model_type=candidate_profiles(settings.openpose_model)[0].name,
+            inference_ms=settings.synthetic_inference_ms,
+            per_image_ms=settings.synthetic_inference_per_image_ms
+        )
+    
+    # Intra-op thread budget of OpenCV (process-wide, shared by all networks)
+    cv2.setNumThreads(settings.dnn_num_threads)
+    
+    pool = DetectorPool(
+        size,
+        peak_mode=settings.peak_extraction_mode,
+        dnn_backend=settings.dnn_backend,
+        dnn_target=settings.dnn_target,
+        input_heights=settings.input_heights,
+        input_aspect=settings.input_aspect,
+        resize_mode=settings.resize_mode,
+        color_order="rgb",
+        model_cache_dir=settings.model_cache_dir if settings.model_cache_enabled else None,
+        fp16_weights=settings.model_cache_fp16,
+        read_net=read_net,
+        model_profile=settings.openpose_model,
+        stages=settings.openpose_stages,
+        person_crop=settings.person_crop_enabled,
+        crop_input_height=settings.person_crop_input_height or None,
+        crop_margin=settings.person_crop_margin,
+        crop_min_gain=settings.person_crop_min_gain
+    )
+    if settings.warmup_passes > 0:
+        pool.warm_up(sorted({1, settings.inference_max_batch_size}), settings.warmup_passes)
+    if settings.startup_benchmark_runs > 0:
+        pool.run_benchmark(settings.startup_benchmark_runs)
+    return pool
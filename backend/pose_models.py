@@ -0,0 +1,172 @@
+"""
+Profiles of the OpenPose models the detector can run
+
+A profile describes everything that differs between the models: the model
+files, the keypoints in the order of the network's output channels (with
+the landmark name each is reported under), the skeleton connections, the
+output channel layout and the native input size. Landmarks are reported
+under MediaPipe-like names, so body_measurements and side_view_processing
+work unchanged with every model that provides REQUIRED_LANDMARKS.
+"""
+
+# Landmarks the measurements and side view processing need from every model
+REQUIRED_LANDMARKS = ("LEFT_SHOULDER", "RIGHT_SHOULDER", "LEFT_HIP", "RIGHT_HIP", "LEFT_KNEE", "LEFT_ANKLE")
+
+
+class ModelProfile:
+    """
+    Keypoint schema, output layout and files of one OpenPose model
+
+    The network output holds one heatmap per keypoint, a background heatmap
+    and two part affinity field channels per limb, in that order. Every
+    refinement stage has a heatmap branch (L2) and a PAF branch (L1); the
+    heatmap output of an earlier stage can be read instead of the final
+    output (see stage_output_layer).
+
+    Args:
+        name: Model type name, reported in the model info and pose cache keys
+        prototxt: Network definition, relative to the model directory
+        weights: Caffe weights, relative to the model directory
+        keypoints: (model part name, landmark name) per heatmap channel, in output order
+        pairs: (landmark name, landmark name) skeleton connections for visualization
+        output_channels: Number of network output channels
+        input_size: (width, height) the network was trained at, the default network input
+        stages: Number of stages (the initial one and the refinement stages)
+        description: Short human-readable description
+    """
+
+    def __init__(self, name, prototxt, weights, keypoints, pairs, output_channels, input_size, stages,
+                 description=""):
+        self.name = name
+        self.prototxt = prototxt
+        self.weights = weights
+        self.parts = [part for part, _ in keypoints]
+        self.landmarks = [landmark for _, landmark in keypoints]
+        self.pairs = list(pairs)
+        self.output_channels = output_channels
+        self.input_size = input_size
+        self.stages = stages
+        self.description = description
+
+        self.index = {landmark: i for i, landmark in enumerate(self.landmarks)}
+        missing = [landmark for landmark in REQUIRED_LANDMARKS if landmark not in self.index]
+        if missing:
+            raise ValueError(f"Model profile {name} lacks required landmarks: {', '.join(missing)}")
+        unknown = [landmark for pair in self.pairs for landmark in pair if landmark not in self.index]
+        if unknown:
+            raise ValueError(f"Model profile {name} connects unknown landmarks: {', '.join(unknown)}")
+        if output_channels < len(self.landmarks) + 1:
+            raise ValueError(f"Model profile {name} has fewer output channels than keypoints")
+
+        # Left/right counterparts of every landmark that has one
+        self.symmetric = {}
+        for landmark in self.landmarks:
+            for side, other in (("LEFT_", "RIGHT_"), ("RIGHT_", "LEFT_")):
+                counterpart = other + landmark[len(side):]
+                if landmark.startswith(side) and counterpart in self.index:
+                    self.symmetric[landmark] = counterpart
+
+    @property
+    def num_keypoints(self):
+        return len(self.landmarks)
+
+    @property
+    def required_landmarks(self):
+        return REQUIRED_LANDMARKS
+
+    @property
+    def heatmap_channels(self):
+        """Channels of a heatmap branch output: the keypoints and the background"""
+        return self.num_keypoints + 1
+
+    def stage_output_layer(self, stage):
+        """
+        Name of the layer producing the heatmaps of a stage (1 is the initial stage)
+
+        Raises:
+            ValueError: If the model has no such stage
+        """
+        if not 1 <= stage <= self.stages:
+            raise ValueError(f"The {self.name} model has stages 1 to {self.stages}, not {stage}")
+        return "conv5_5_CPM_L2" if stage == 1 else f"Mconv7_stage{stage}_L2"
+
+
+COCO = ModelProfile(
+    "COCO",
+    "pose/coco/pose_deploy_linevec.prototxt",
+    "pose/coco/pose_iter_440000.caffemodel",
+    keypoints=[
+        ("Nose", "NOSE"), ("Neck", "NECK"),
+        ("RShoulder", "RIGHT_SHOULDER"), ("RElbow", "RIGHT_ELBOW"), ("RWrist", "RIGHT_WRIST"),
+        ("LShoulder", "LEFT_SHOULDER"), ("LElbow", "LEFT_ELBOW"), ("LWrist", "LEFT_WRIST"),
+        ("RHip", "RIGHT_HIP"), ("RKnee", "RIGHT_KNEE"), ("RAnkle", "RIGHT_ANKLE"),
+        ("LHip", "LEFT_HIP"), ("LKnee", "LEFT_KNEE"), ("LAnkle", "LEFT_ANKLE"),
+        ("REye", "RIGHT_EYE"), ("LEye", "LEFT_EYE"), ("REar", "RIGHT_EAR"), ("LEar", "LEFT_EAR"),
+    ],
+    pairs=[
+        # Torso
+        ("NECK", "NOSE"), ("NECK", "RIGHT_SHOULDER"), ("NECK", "LEFT_SHOULDER"),
+        ("RIGHT_SHOULDER", "LEFT_SHOULDER"), ("NECK", "RIGHT_HIP"), ("NECK", "LEFT_HIP"), ("RIGHT_HIP", "LEFT_HIP"),
+        # Arms
+        ("RIGHT_SHOULDER", "RIGHT_ELBOW"), ("RIGHT_ELBOW", "RIGHT_WRIST"),
+        ("LEFT_SHOULDER", "LEFT_ELBOW"), ("LEFT_ELBOW", "LEFT_WRIST"),
+        # Legs
+        ("RIGHT_HIP", "RIGHT_KNEE"), ("RIGHT_KNEE", "RIGHT_ANKLE"),
+        ("LEFT_HIP", "LEFT_KNEE"), ("LEFT_KNEE", "LEFT_ANKLE"),
+        # Face
+        ("NOSE", "RIGHT_EYE"), ("NOSE", "LEFT_EYE"), ("RIGHT_EYE", "RIGHT_EAR"), ("LEFT_EYE", "LEFT_EAR"),
+    ],
+    # 18 keypoints, background and 19 limbs x 2 PAF channels
+    output_channels=57,
+    input_size=(368, 368),
+    stages=6,
+    description="COCO, 18 keypoints, 6 stages",
+)
+
+MPI_FASTER = ModelProfile(
+    "MPI_FASTER",
+    "pose/mpi/pose_deploy_linevec.prototxt",
+    "pose/mpi/pose_iter_160000.caffemodel",
+    keypoints=[
+        ("Head", "HEAD"), ("Neck", "NECK"),
+        ("RShoulder", "RIGHT_SHOULDER"), ("RElbow", "RIGHT_ELBOW"), ("RWrist", "RIGHT_WRIST"),
+        ("LShoulder", "LEFT_SHOULDER"), ("LElbow", "LEFT_ELBOW"), ("LWrist", "LEFT_WRIST"),
+        ("RHip", "RIGHT_HIP"), ("RKnee", "RIGHT_KNEE"), ("RAnkle", "RIGHT_ANKLE"),
+        ("LHip", "LEFT_HIP"), ("LKnee", "LEFT_KNEE"), ("LAnkle", "LEFT_ANKLE"),
+        ("Chest", "CHEST"),
+    ],
+    pairs=[
+        ("HEAD", "NECK"), ("NECK", "RIGHT_SHOULDER"), ("RIGHT_SHOULDER", "RIGHT_ELBOW"),
+        ("RIGHT_ELBOW", "RIGHT_WRIST"), ("NECK", "LEFT_SHOULDER"), ("LEFT_SHOULDER", "LEFT_ELBOW"),
+        ("LEFT_ELBOW", "LEFT_WRIST"), ("NECK", "CHEST"), ("CHEST", "RIGHT_HIP"), ("RIGHT_HIP", "RIGHT_KNEE"),
+        ("RIGHT_KNEE", "RIGHT_ANKLE"), ("CHEST", "LEFT_HIP"), ("LEFT_HIP", "LEFT_KNEE"), ("LEFT_KNEE", "LEFT_ANKLE"),
+    ],
+    # 15 keypoints, background and 14 limbs x 2 PAF channels
+    output_channels=44,
+    input_size=(368, 368),
+    stages=4,
+    description="MPI, 15 keypoints, 4 stages (openpose_pose_mpi_faster_4_stages)",
+)
+
+# Profiles by name, in order of preference when the model is picked automatically
+PROFILES = {profile.name: profile for profile in (COCO, MPI_FASTER)}
+
+
+def get_profile(name):
+    """
+    Profile by name (case-insensitive)
+
+    Raises:
+        ValueError: If there's no profile of that name
+    """
+    profile = PROFILES.get(str(name).upper())
+    if profile is None:
+        raise ValueError(f"Unknown OpenPose model '{name}', expected one of {list(PROFILES)} or 'auto'")
+    return profile
+
+
+def candidate_profiles(name="auto"):
+    """Profiles to try in order: all of them for "auto", otherwise just the named one"""
+    if str(name).lower() == "auto":
+        return list(PROFILES.values())
+    return [get_profile(name)]
@@ -1,7 +1,170 @@
 import cv2
 import numpy as np
 
-def process_side_view(landmarks, side_img_np, waist_y_offset):
+from metrics import stage_timer
+
+# Longest depth allowed per measurement level, as a fraction of the image width
+MAX_DEPTH_FRACTION = {
+    "bust": 0.4,
+    "waist": 0.35,
+    "natural_waist": 0.35,
+    "high_hip": 0.5,
+    "hip": 0.5,
+}
+
+def prepare_side_view(side_img_np, working_width=480):
+    """
+    Run the landmark-independent part of the side view processing
+    
+    This only needs the pixels, so it can run while pose detection is still in progress.
+    The silhouette is segmented at a reduced working resolution (an integer
+    reduction, which OpenCV does much faster than an arbitrary resize); depths
+    are converted back to image pixels afterwards.
+    
+    Args:
+        side_img_np: Side view image as numpy array (RGB format)
+        working_width: Smallest width the image is reduced to for segmentation
+        
+    Returns:
+        Dictionary with the blurred grayscale working image and its scale
+        (working pixels per image pixel)
+    """
+    with stage_timer("side_view_prepare"):
+        side_height, side_width, _ = side_img_np.shape
+        factor = max(1, side_width // working_width)
+        if factor > 1:
+            # Drop the few edge pixels that don't fill a whole factor x factor block
+            cropped = side_img_np[:side_height - side_height % factor, :side_width - side_width % factor]
+            side_img_np = cv2.resize(cropped, (side_width // factor, side_height // factor),
+                                     interpolation=cv2.INTER_AREA)
+        side_gray = cv2.cvtColor(side_img_np, cv2.COLOR_RGB2GRAY)
+        side_blur = cv2.GaussianBlur(side_gray, (5, 5), 0)
+    return {"blur": side_blur, "scale": 1.0 / factor}
+
+class DepthProfile:
+    """
+    Front and back edge of a torso silhouette for every row of a side view band
+    
+    Built once per image; depth queries at any height are then plain array lookups.
+    
+    Args:
+        work_y_start: First row of the band in the working image
+        scale: Working pixels per image pixel
+        front_x: Leftmost silhouette column per row (working pixels, NaN where the row is empty)
+        back_x: Rightmost silhouette column per row (working pixels, NaN where the row is empty)
+    """
+    
+    def __init__(self, work_y_start, scale, front_x, back_x):
+        self.work_y_start = work_y_start
+        self.scale = scale
+        self.front_x = front_x
+        self.back_x = back_x
+        # Same convention as measuring rightmost - leftmost column at full resolution
+        self.depth = (back_x - front_x + 1) / scale - 1
+    
+    @classmethod
+    def from_mask(cls, mask, work_y_start, scale):
+        """Build the profile from a binary silhouette mask of the band"""
+        filled = mask > 0
+        has_silhouette = filled.any(axis=1)
+        front_x = filled.argmax(axis=1).astype(np.float64)
+        back_x = (filled.shape[1] - 1 - filled[:, ::-1].argmax(axis=1)).astype(np.float64)
+        front_x[~has_silhouette] = np.nan
+        back_x[~has_silhouette] = np.nan
+        return cls(work_y_start, scale, front_x, back_x)
+    
+    def _row(self, y):
+        return int(round((y + 0.5) * self.scale - 0.5)) - self.work_y_start
+    
+    def _to_image(self, x):
+        return (x + 0.5) / self.scale - 0.5
+    
+    def row(self, y):
+        """Profile row of image row y, or None outside the band"""
+        row = self._row(y)
+        return row if 0 <= row < len(self.depth) else None
+    
+    def y_of_row(self, row):
+        """Image row at the center of a profile row"""
+        return int(round(self._to_image(row + self.work_y_start)))
+    
+    def edges_at(self, y):
+        """
+        Silhouette edges at image row y
+        
+        Returns:
+            (front_x, back_x, depth) in image pixels, or None where there is no silhouette
+        """
+        row = self.row(y)
+        if row is None or np.isnan(self.depth[row]):
+            return None
+        return self._to_image(self.front_x[row]), self._to_image(self.back_x[row]), self.depth[row]
+    
+    def min_depth_y(self, y_from, y_to, smoothing_px=10):
+        """
+        Image row with the smallest depth between two heights (natural waist)
+        
+        The profile is smoothed first so single noisy rows don't win.
+        
+        Returns:
+            Image row, or None if the range holds no silhouette
+        """
+        start = max(0, self._row(y_from))
+        end = min(len(self.depth) - 1, self._row(y_to))
+        if end <= start:
+            return None
+        window = max(1, int(round(smoothing_px * self.scale)))
+        depth = self.depth[start:end + 1]
+        valid = ~np.isnan(depth)
+        if not valid.any():
+            return None
+        kernel = np.ones(window)
+        smoothed = np.convolve(np.where(valid, depth, 0.0), kernel, mode="same")
+        counts = np.convolve(valid.astype(np.float64), kernel, mode="same")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            smoothed = np.where(valid, smoothed / counts, np.inf)
+        return self.y_of_row(start + int(np.argmin(smoothed)))
+
+def build_depth_profile(prepared, y_top, y_bottom):
+    """
+    Segment the torso silhouette between two image rows once and build its depth profile
+    
+    One Otsu threshold and one morphological clean-up run over the whole band,
+    and the largest contour is taken as the torso.
+    
+    Args:
+        prepared: Result of prepare_side_view
+        y_top: First image row of the band
+        y_bottom: Last image row of the band
+        
+    Returns:
+        DepthProfile, or None if the band is empty or holds no silhouette
+    """
+    blur, scale = prepared["blur"], prepared["scale"]
+    work_y_start = max(0, int(np.floor(y_top * scale)))
+    work_y_end = min(blur.shape[0], int(np.ceil((y_bottom + 1) * scale)))
+    if work_y_end - work_y_start < 2:
+        return None
+    band = blur[work_y_start:work_y_end, :]
+    
+    # Threshold the band of the blurred grayscale image
+    _, thresh = cv2.threshold(band, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    
+    # Clean up mask
+    kernel = np.ones((3, 3), np.uint8)
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    
+    # Fill the largest contour as the torso
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    largest_contour = max(contours, key=cv2.contourArea)
+    mask = np.zeros_like(thresh)
+    cv2.drawContours(mask, [largest_contour], 0, 255, -1)
+    return DepthProfile.from_mask(mask, work_y_start, scale)
+
+def process_side_view(landmarks, side_img_np, waist_y_offset, prepared=None):
     """
     Process side view image to get depth measurements
     
@@ -9,21 +172,26 @@ def process_side_view(landmarks, side_img_np, waist_y_offset):
         landmarks: Dictionary of pose landmarks from side view
         side_img_np: Side view image as numpy array
         waist_y_offset: Waist position offset calculated from front view
+        prepared: Result of prepare_side_view for this image (computed here if omitted)
         
     Returns:
-        Dictionary containing depth measurements and marked image
+        Dictionary containing depth measurements, the analysed band and the
+        marker geometry (see render_side_view_markers)
     """
     side_height, side_width, _ = side_img_np.shape
-    side_img_with_markers = None
+    if prepared is None:
+        prepared = prepare_side_view(side_img_np)
+    markers = []
     
     # Get key points from side view
     side_hip = (landmarks["LEFT_HIP"]["x"], landmarks["LEFT_HIP"]["y"])
     side_shoulder = (landmarks["LEFT_SHOULDER"]["x"], landmarks["LEFT_SHOULDER"]["y"])
+    torso_length = side_hip[1] - side_shoulder[1]
     
     # Calculate positions for measurements
     hip_y = int(side_hip[1])
-    waist_y = int(side_hip[1] - (side_hip[1] - side_shoulder[1]) * waist_y_offset)
-    bust_y = int(side_shoulder[1] + (side_hip[1] - side_shoulder[1]) * 0.25)
+    waist_y = int(side_hip[1] - torso_length * waist_y_offset)
+    bust_y = int(side_shoulder[1] + torso_length * 0.25)
     
     # Initialize measurements with default values
     measurements = {
@@ -32,68 +200,49 @@ def process_side_view(landmarks, side_img_np, waist_y_offset):
         "bust_depth_px": side_width * 0.14
     }
     
-    # Process each measurement point (hip, waist, bust)
-    for point_name, y_coord in [("hip", hip_y), ("waist", waist_y), ("bust", bust_y)]:
-        if 0 <= y_coord < side_height:
-            roi_y_start = max(0, y_coord - 15)
-            roi_y_end = min(side_height, y_coord + 15)
-            roi = side_img_np[roi_y_start:roi_y_end, :, :]
-            
-            # Convert ROI to grayscale and process
-            roi_gray = cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
-            roi_blur = cv2.GaussianBlur(roi_gray, (5, 5), 0)
-            _, roi_thresh = cv2.threshold(roi_blur, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-            
-            # Clean up mask
-            kernel = np.ones((3, 3), np.uint8)
-            roi_thresh = cv2.morphologyEx(roi_thresh, cv2.MORPH_OPEN, kernel)
-            roi_thresh = cv2.morphologyEx(roi_thresh, cv2.MORPH_CLOSE, kernel)
-            
-            # Find contours
-            contours, _ = cv2.findContours(roi_thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Segment the torso from shoulder to just below the hip once
+    margin = max(15, int(abs(torso_length) * 0.1))
+    band = (max(0, int(min(side_shoulder[1], side_hip[1])) - margin),
+            min(side_height - 1, int(max(side_shoulder[1], side_hip[1])) + margin))
+    profile = build_depth_profile(prepared, *band) if band[0] < band[1] else None
+    
+    levels = [("hip", hip_y), ("waist", waist_y), ("bust", bust_y)]
+    if profile is not None:
+        # Extra levels come from the same profile: the narrowest point between the bust and
+        # just above the hip, and the high hip halfway between the waist and the hip
+        natural_waist_y = profile.min_depth_y(bust_y + abs(torso_length) * 0.1, hip_y - abs(torso_length) * 0.15)
+        if natural_waist_y is not None:
+            levels.append(("natural_waist", natural_waist_y))
+            measurements["natural_waist_y"] = natural_waist_y
+            levels.append(("high_hip", int((natural_waist_y + hip_y) / 2)))
+    
+    # Look up each measurement level in the depth profile
+    for point_name, y_coord in levels:
+        if profile is None or not 0 <= y_coord < side_height:
+            continue
+        edges = profile.edges_at(y_coord)
+        if edges is None:
+            continue
+        leftmost, rightmost, depth_px = edges
+        
+        # Validate measurement
+        min_depth = side_width * 0.05
+        max_depth = side_width * MAX_DEPTH_FRACTION[point_name]
+        
+        if depth_px < min_depth:
+            depth_px = min_depth
+        elif depth_px > max_depth:
+            depth_px = max_depth
             
-            if contours and len(contours) > 0:
-                largest_contour = max(contours, key=cv2.contourArea)
-                mask = np.zeros_like(roi_thresh)
-                cv2.drawContours(mask, [largest_contour], 0, 255, -1)
-                
-                # Get depth measurement
-                point_center_y = y_coord - roi_y_start
-                if 0 <= point_center_y < mask.shape[0]:
-                    mask_row = mask[point_center_y, :]
-                    non_zero_indices = np.where(mask_row > 0)[0]
-                    
-                    if len(non_zero_indices) > 0:
-                        leftmost = non_zero_indices[0]
-                        rightmost = non_zero_indices[-1]
-                        depth_px = rightmost - leftmost
-                        
-                        # Validate measurement
-                        min_depth = side_width * 0.05
-                        max_depth = side_width * (0.5 if point_name == "hip" else 0.4 if point_name == "bust" else 0.35)
-                        
-                        if depth_px < min_depth:
-                            depth_px = min_depth
-                        elif depth_px > max_depth:
-                            depth_px = max_depth
-                            
-                        measurements[f"{point_name}_depth_px"] = depth_px
-                        
-                        # Update visualization
-                        if side_img_with_markers is None:
-                            side_img_with_markers = side_img_np.copy()
-                        
-                        # Draw markers
-                        cv2.rectangle(side_img_with_markers, (0, roi_y_start), (side_width, roi_y_end), (0, 255, 0), 1)
-                        cv2.line(side_img_with_markers, (0, y_coord), (side_width, y_coord), (0, 255, 255), 1)
-                        cv2.circle(side_img_with_markers, (leftmost, y_coord), 5, (0, 0, 255), -1)
-                        cv2.circle(side_img_with_markers, (rightmost, y_coord), 5, (255, 0, 0), -1)
-                        
-                        # Add labels
-                        cv2.putText(side_img_with_markers, f"{point_name.title()} Front", (leftmost - 30, y_coord - 10),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-                        cv2.putText(side_img_with_markers, f"{point_name.title()} Back", (rightmost + 5, y_coord - 10),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
+        measurements[f"{point_name}_depth_px"] = depth_px
+        
+        # Remember where the markers go; they are only drawn on request
+        markers.append({
+            "name": point_name,
+            "y": y_coord,
+            "front_x": int(round(leftmost)),
+            "back_x": int(round(rightmost))
+        })
     
     # Calculate circumferences using ellipse approximation
     def ellipse_perimeter(width, depth):
@@ -106,6 +255,52 @@ def process_side_view(landmarks, side_img_np, waist_y_offset):
     
     return {
         "measurements": measurements,
-        "marked_image": side_img_with_markers,
+        "band": band if profile is not None else None,
+        "markers": markers,
         "ellipse_perimeter_func": ellipse_perimeter
-    }
\ No newline at end of file
+    }
+
+def render_side_view_markers(side_img_np, markers, band=None, max_side=640):
+    """
+    Draw the depth measurement markers on a reduced-size copy of the side view
+    
+    Args:
+        side_img_np: Side view image as numpy array (RGB format)
+        markers: Marker geometry from process_side_view
+        band: (first, last) image rows of the analysed torso band, if any
+        max_side: Longest side of the rendered image
+        
+    Returns:
+        The marked image in BGR format, ready for cv2.imencode
+    """
+    side_height, side_width, _ = side_img_np.shape
+    scale = min(1.0, max_side / max(side_height, side_width))
+    width, height = max(1, int(round(side_width * scale))), max(1, int(round(side_height * scale)))
+    marked = cv2.cvtColor(cv2.resize(side_img_np, (width, height), interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2BGR)
+    
+    def at(value):
+        return int(round(value * scale))
+    
+    if band is not None:
+        cv2.rectangle(marked, (0, at(band[0])), (width - 1, at(band[1])), (0, 255, 0), 1)
+    
+    for marker in markers:
+        y_coord, front_x, back_x = at(marker["y"]), at(marker["front_x"]), at(marker["back_x"])
+        name = marker["name"].replace("_", " ").title()
+        
+        # Draw markers
+        cv2.line(marked, (0, y_coord), (width, y_coord), (0, 255, 255), 1)
+        cv2.circle(marked, (front_x, y_coord), 4, (0, 0, 255), -1)
+        cv2.circle(marked, (back_x, y_coord), 4, (255, 0, 0), -1)
+        
+        # Add labels
+        cv2.putText(marked, f"{name} Front", (front_x - 30, y_coord - 8),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 255), 1)
+        cv2.putText(marked, f"{name} Back", (back_x + 5, y_coord - 8),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 0, 0), 1)
+    
+    # Add a title and explanation to the image
+    cv2.putText(marked, "Improved Depth Measurement", (10, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+    cv2.putText(marked, "Red: Front point, Blue: Back point", (10, 44), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+    cv2.putText(marked, "Green box: Analysed torso band", (10, 62), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+    return marked
\ No newline at end of file
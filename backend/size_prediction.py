@@ -1,218 +1,224 @@
+import numpy as np
+
+# How a garment is fitted when its chart has no "fit" entry: the weight of each
+# measurement in the distance to a chart size, and the measurement used to tell
+# whether someone falls between two sizes
+DEFAULT_FIT = {
+    "jeans": {"primary": "waist", "weights": {"waist": 0.7, "hip": 0.3}},
+    "dresses": {"primary": "bust", "weights": {"bust": 0.4, "waist": 0.35, "hip": 0.25}},
+    "skirts": {"primary": "waist", "weights": {"waist": 0.65, "hip": 0.35}},
+}
+
+# Between two neighbouring sizes, a primary measurement within this fraction of the gap
+# picks the nearer size, and one that is also inside this band is reported as a range
+NEAREST_SIZE_FRACTION = 0.3
+SIZE_RANGE_FRACTIONS = (0.15, 0.85)
+
+
+def size_label(size_code):
+    """Size as shown to the user: "US_4/S" -> "4" """
+    return size_code.split("/")[0].replace("US_", "")
+
+
+class SizeChartIndex:
+    """
+    Size charts compiled into arrays so every garment is sized in one vectorized pass
+
+    Each garment's sizes are stably sorted by its primary measurement and
+    stacked into one table covering all garments: the chart value, the
+    measurement it is compared with and its weight for each weighted
+    measurement ("slot"), plus the primary measurement of the size and of its
+    next larger neighbour. Slots keep the order of the chart's weights so the
+    weighted distances are summed exactly like the per-garment functions did.
+    Size code -> details lookups are precomputed as well.
+
+    A garment is sized from the chart entry alone: "size_mapping" with the
+    measurements of every size and "fit" (see DEFAULT_FIT), so adding a
+    garment type needs no code.
+
+    Args:
+        size_charts: Size charts as loaded from data/size_charts.json
+    """
+
+    def __init__(self, size_charts):
+        charts = []
+        for garment, chart in size_charts.items():
+            if not isinstance(chart, dict):
+                continue
+            size_mapping = chart.get("size_mapping") or {}
+            fit = chart.get("fit") or DEFAULT_FIT.get(garment)
+            if size_mapping and fit:
+                charts.append((garment, size_mapping, fit))
+
+        self.garments = [garment for garment, _, _ in charts]
+        self.measurements = sorted({
+            name for _, _, fit in charts for name in [fit["primary"], *fit["weights"]]
+        })
+        measurement_index = {name: i for i, name in enumerate(self.measurements)}
+        # Unused slots point at an extra measurement that is always 0
+        padding = len(self.measurements)
+        num_slots = max((len(fit["weights"]) for _, _, fit in charts), default=0)
+
+        self._codes = []
+        self._required = []
+        self._details = []
+        values, slot_measurement, weights = [], [], []
+        primary, primary_measurement, garment_id, starts = [], [], [], []
+        for g, (garment, size_mapping, fit) in enumerate(charts):
+            names = list(fit["weights"])
+            codes = list(size_mapping)
+            order = np.argsort([size_mapping[code][fit["primary"]] for code in codes], kind="stable")
+
+            starts.append(len(self._codes))
+            for i in order:
+                data = size_mapping[codes[i]]
+                self._codes.append(codes[i])
+                values.append([data[name] for name in names] + [0.0] * (num_slots - len(names)))
+                slot_measurement.append([measurement_index[name] for name in names] + [padding] * (num_slots - len(names)))
+                weights.append([fit["weights"][name] for name in names] + [0.0] * (num_slots - len(names)))
+                primary.append(data[fit["primary"]])
+                primary_measurement.append(measurement_index[fit["primary"]])
+                garment_id.append(g)
+
+            self._required.append({fit["primary"], *names})
+            self._details.append(self._details_lookup(size_mapping))
+
+        self._values = np.array(values, dtype=np.float64).reshape(len(self._codes), num_slots)
+        self._slot_measurement = np.array(slot_measurement, dtype=np.intp).reshape(len(self._codes), num_slots)
+        self._weights = np.array(weights, dtype=np.float64).reshape(len(self._codes), num_slots)
+        self._primary = np.array(primary, dtype=np.float64)
+        self._primary_measurement = np.array(primary_measurement, dtype=np.intp)
+        self._garment_id = np.array(garment_id, dtype=np.intp)
+        self._starts = np.array(starts, dtype=np.intp)
+        self._row_index = np.arange(len(self._codes))
+
+        # Primary measurement of the next larger size (NaN on each garment's largest size)
+        self._next_primary = np.full_like(self._primary, np.nan)
+        self._next_primary[:-1] = self._primary[1:]
+        self._next_primary[self._starts[1:] - 1] = np.nan
+
+    @staticmethod
+    def _details_lookup(size_mapping):
+        """Map size codes as returned to the user ("4", "4/S") to their chart entries"""
+        exact, prefixed = {}, {}
+        for key, details in size_mapping.items():
+            if not key.startswith("US_"):
+                continue
+            code = key[len("US_"):]
+            exact[code] = details
+            parts = code.split("/")
+            for n in range(1, len(parts)):
+                prefixed.setdefault("/".join(parts[:n]), details)
+        return {**prefixed, **exact}
+
+    def determine_sizes(self, measurements):
+        """
+        Determine the size of every garment type
+
+        Args:
+            measurements: Body measurements by name ("waist", "hip", "bust", ...)
+
+        Returns:
+            Dictionary mapping garment types to sizes ("4", or "4-6" between two
+            sizes); garment types needing a measurement that wasn't given are left out
+        """
+        if not self.garments:
+            return {}
+
+        x = np.zeros(len(self.measurements) + 1)
+        for i, name in enumerate(self.measurements):
+            if measurements.get(name) is not None:
+                x[i] = measurements[name]
+
+        # Weighted distance to every size, summed slot by slot
+        diff = np.abs(self._values - x[self._slot_measurement]) * self._weights
+        scores = diff[:, 0].copy()
+        for slot in range(1, diff.shape[1]):
+            scores += diff[:, slot]
+        best = self._first_per_garment(scores == np.minimum.reduceat(scores, self._starts)[self._garment_id])
+
+        # Between sizes: the first pair of neighbouring sizes whose primary measurements
+        # enclose the person's and where one of them is close enough to pick
+        lower, upper = self._primary, self._next_primary
+        xp = x[self._primary_measurement]
+        lower_diff = np.abs(lower - xp)
+        upper_diff = np.abs(upper - xp)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lower_fraction = lower_diff / (upper - lower)
+            upper_fraction = upper_diff / (upper - lower)
+        enclosed = (lower <= xp) & (xp <= upper)
+        near = (lower_fraction <= NEAREST_SIZE_FRACTION) | (upper_fraction <= NEAREST_SIZE_FRACTION)
+        between = self._first_per_garment(enclosed & near)
+
+        low, high = SIZE_RANGE_FRACTIONS
+        given = {name for name, value in measurements.items() if value is not None}
+        sizes = {}
+        for g, garment in enumerate(self.garments):
+            if not self._required[g] <= given:
+                continue
+
+            i = between[g]
+            if i < 0:
+                sizes[garment] = size_label(self._codes[best[g]])
+            elif low < lower_fraction[i] < high and low < upper_fraction[i] < high:
+                sizes[garment] = f"{size_label(self._codes[i])}-{size_label(self._codes[i + 1])}"
+            else:
+                sizes[garment] = size_label(self._codes[i + 1] if upper_diff[i] < lower_diff[i] else self._codes[i])
+        return sizes
+
+    def _first_per_garment(self, mask):
+        """Index of the first True row of every garment (-1 where there is none)"""
+        rows = np.where(mask, self._row_index, len(mask))
+        first = np.minimum.reduceat(rows, self._starts)
+        first[first == len(mask)] = -1
+        return first
+
+    def size_details(self, garment_type, size_code):
+        """
+        Get the chart entry (EU/UK sizes, measurements) for a size
+
+        Args:
+            garment_type: Garment type as named in the size charts
+            size_code: Size as returned by determine_sizes
+
+        Returns:
+            The chart entry, or an empty dictionary (unknown sizes and size ranges)
+        """
+        if not size_code or garment_type not in self.garments:
+            return {}
+        return self._details[self.garments.index(garment_type)].get(size_code, {})
+
+
+_compiled_charts = (None, None)
+
+
+def compile_size_charts(size_charts):
+    """
+    Get the SizeChartIndex for a size chart dictionary
+
+    The index of the last dictionary passed in is kept, so the helpers below
+    only compile the charts once. Charts changed in place are not picked up.
+    """
+    global _compiled_charts
+    charts, index = _compiled_charts
+    if charts is not size_charts:
+        index = SizeChartIndex(size_charts)
+        _compiled_charts = (size_charts, index)
+    return index
+
+
 def determine_jeans_size(waist_cm, hip_cm, size_charts):
     """Determine jeans size based on waist and hip measurements"""
-    best_match = None
-    min_diff = float('inf')
-    between_sizes = False
-    between_size_lower = None
-    between_size_upper = None
-    
-    # Prioritize waist measurement for jeans (70% waist, 30% hip)
-    waist_weight = 0.7
-    hip_weight = 0.3
-    
-    # Sort sizes for potential between-size determination
-    size_data = []
-    for size, data in size_charts.get("jeans", {}).get("size_mapping", {}).items():
-        size_data.append((size, data))
-    
-    # Sort by waist measurement
-    size_data.sort(key=lambda x: x[1]["waist"])
-    
-    # Find best match with weighted measurements
-    for size, data in size_data:
-        waist_diff = abs(data["waist"] - waist_cm) * waist_weight
-        hip_diff = abs(data["hip"] - hip_cm) * hip_weight
-        total_diff = waist_diff + hip_diff
-        
-        if total_diff < min_diff:
-            min_diff = total_diff
-            best_match = size
-    
-    # Check if measurements are between sizes
-    for i in range(len(size_data) - 1):
-        current_size, current_data = size_data[i]
-        next_size, next_data = size_data[i + 1]
-        
-        if (current_data["waist"] <= waist_cm <= next_data["waist"]):
-            lower_diff = abs(current_data["waist"] - waist_cm)
-            upper_diff = abs(next_data["waist"] - waist_cm)
-            total_range = next_data["waist"] - current_data["waist"]
-            
-            if lower_diff / total_range <= 0.3 or upper_diff / total_range <= 0.3:
-                between_sizes = True
-                between_size_lower = current_size
-                between_size_upper = next_size
-                
-                if upper_diff < lower_diff:
-                    best_match = next_size
-                else:
-                    best_match = current_size
-                break
-    
-    result = best_match.replace("US_", "") if best_match else ""
-    
-    if between_sizes:
-        lower = between_size_lower.replace("US_", "")
-        upper = between_size_upper.replace("US_", "")
-        
-        lower_diff = abs(size_charts["jeans"]["size_mapping"][between_size_lower]["waist"] - waist_cm)
-        upper_diff = abs(size_charts["jeans"]["size_mapping"][between_size_upper]["waist"] - waist_cm)
-        total_range = size_charts["jeans"]["size_mapping"][between_size_upper]["waist"] - size_charts["jeans"]["size_mapping"][between_size_lower]["waist"]
-        
-        if 0.15 < lower_diff / total_range < 0.85 and 0.15 < upper_diff / total_range < 0.85:
-            result = f"{lower}-{upper}"
-    
-    return result
+    return compile_size_charts(size_charts).determine_sizes({"waist": waist_cm, "hip": hip_cm}).get("jeans", "")
 
 def determine_dress_size(bust_cm, waist_cm, hip_cm, size_charts):
     """Determine dress size based on bust, waist, and hip measurements"""
-    best_match = None
-    min_diff = float('inf')
-    between_sizes = False
-    between_size_lower = None
-    between_size_upper = None
-    
-    # Weight measurements by importance
-    bust_weight = 0.4
-    waist_weight = 0.35
-    hip_weight = 0.25
-    
-    # Sort sizes
-    size_data = []
-    for size, data in size_charts.get("dresses", {}).get("size_mapping", {}).items():
-        size_data.append((size, data))
-    
-    size_data.sort(key=lambda x: x[1]["bust"])
-    
-    # Find best match
-    for size, data in size_data:
-        bust_diff = abs(data["bust"] - bust_cm) * bust_weight
-        waist_diff = abs(data["waist"] - waist_cm) * waist_weight
-        hip_diff = abs(data["hip"] - hip_cm) * hip_weight
-        total_diff = bust_diff + waist_diff + hip_diff
-        
-        if total_diff < min_diff:
-            min_diff = total_diff
-            best_match = size
-    
-    # Check for between sizes
-    for i in range(len(size_data) - 1):
-        current_size, current_data = size_data[i]
-        next_size, next_data = size_data[i + 1]
-        
-        if (current_data["bust"] <= bust_cm <= next_data["bust"]):
-            lower_diff = abs(current_data["bust"] - bust_cm)
-            upper_diff = abs(next_data["bust"] - bust_cm)
-            total_range = next_data["bust"] - current_data["bust"]
-            
-            if lower_diff / total_range <= 0.3 or upper_diff / total_range <= 0.3:
-                between_sizes = True
-                between_size_lower = current_size
-                between_size_upper = next_size
-                
-                if upper_diff < lower_diff:
-                    best_match = next_size
-                else:
-                    best_match = current_size
-                break
-    
-    result = best_match.split("/")[0].replace("US_", "") if best_match else ""
-    
-    if between_sizes:
-        lower = between_size_lower.split("/")[0].replace("US_", "")
-        upper = between_size_upper.split("/")[0].replace("US_", "")
-        
-        lower_diff = abs(size_charts["dresses"]["size_mapping"][between_size_lower]["bust"] - bust_cm)
-        upper_diff = abs(size_charts["dresses"]["size_mapping"][between_size_upper]["bust"] - bust_cm)
-        total_range = size_charts["dresses"]["size_mapping"][between_size_upper]["bust"] - size_charts["dresses"]["size_mapping"][between_size_lower]["bust"]
-        
-        if 0.15 < lower_diff / total_range < 0.85 and 0.15 < upper_diff / total_range < 0.85:
-            result = f"{lower}-{upper}"
-    
-    return result
+    return compile_size_charts(size_charts).determine_sizes({"bust": bust_cm, "waist": waist_cm, "hip": hip_cm}).get("dresses", "")
 
 def determine_skirt_size(waist_cm, hip_cm, size_charts):
     """Determine skirt size based on waist and hip measurements"""
-    best_match = None
-    min_diff = float('inf')
-    between_sizes = False
-    between_size_lower = None
-    between_size_upper = None
-    
-    # Weight measurements
-    waist_weight = 0.65
-    hip_weight = 0.35
-    
-    # Sort sizes
-    size_data = []
-    for size, data in size_charts.get("skirts", {}).get("size_mapping", {}).items():
-        size_data.append((size, data))
-    
-    size_data.sort(key=lambda x: x[1]["waist"])
-    
-    # Find best match
-    for size, data in size_data:
-        waist_diff = abs(data["waist"] - waist_cm) * waist_weight
-        hip_diff = abs(data["hip"] - hip_cm) * hip_weight
-        total_diff = waist_diff + hip_diff
-        
-        if total_diff < min_diff:
-            min_diff = total_diff
-            best_match = size
-    
-    # Check for between sizes
-    for i in range(len(size_data) - 1):
-        current_size, current_data = size_data[i]
-        next_size, next_data = size_data[i + 1]
-        
-        if (current_data["waist"] <= waist_cm <= next_data["waist"]):
-            lower_diff = abs(current_data["waist"] - waist_cm)
-            upper_diff = abs(next_data["waist"] - waist_cm)
-            total_range = next_data["waist"] - current_data["waist"]
-            
-            if lower_diff / total_range <= 0.3 or upper_diff / total_range <= 0.3:
-                between_sizes = True
-                between_size_lower = current_size
-                between_size_upper = next_size
-                
-                if upper_diff < lower_diff:
-                    best_match = next_size
-                else:
-                    best_match = current_size
-                break
-    
-    result = best_match.split("/")[0].replace("US_", "") if best_match else ""
-    
-    if between_sizes:
-        lower = between_size_lower.split("/")[0].replace("US_", "")
-        upper = between_size_upper.split("/")[0].replace("US_", "")
-        
-        lower_diff = abs(size_charts["skirts"]["size_mapping"][between_size_lower]["waist"] - waist_cm)
-        upper_diff = abs(size_charts["skirts"]["size_mapping"][between_size_upper]["waist"] - waist_cm)
-        total_range = size_charts["skirts"]["size_mapping"][between_size_upper]["waist"] - size_charts["skirts"]["size_mapping"][between_size_lower]["waist"]
-        
-        if 0.15 < lower_diff / total_range < 0.85 and 0.15 < upper_diff / total_range < 0.85:
-            result = f"{lower}-{upper}"
-    
-    return result
+    return compile_size_charts(size_charts).determine_sizes({"waist": waist_cm, "hip": hip_cm}).get("skirts", "")
 
 def get_size_details(garment_type, size_code, size_charts):
     """Get detailed size information for a given garment type and size code"""
-    if not size_code:
-        return {}
-    
-    lookup_code = f"US_{size_code}"
-    
-    if garment_type in ["dresses", "skirts"]:
-        size_mapping = size_charts.get(garment_type, {}).get("size_mapping", {})
-        if lookup_code in size_mapping:
-            return size_mapping.get(lookup_code, {})
-        
-        for key in size_mapping.keys():
-            if key.startswith(lookup_code + "/"):
-                return size_mapping.get(key, {})
-    else:
-        size_mapping = size_charts.get(garment_type, {}).get("size_mapping", {})
-        return size_mapping.get(lookup_code, {})
-    
-    return {}
\ No newline at end of file
+    return compile_size_charts(size_charts).size_details(garment_type, size_code)
@@ -0,0 +1,229 @@
+"""
+Sizing pipeline shared by the API and the bulk sizing tool
+
+Turns detected front and side poses into body measurements and garment
+sizes. The API runs it per request on top of its batched, cached pose
+detection; bulk_size.py runs whole chunks of photo pairs on process inference
+workers through size_image_pairs.
+"""
+
+import csv
+import json
+import os
+import time
+
+from body_measurements import calculate_body_measurements
+from config import settings
+from image_decode import ImageDecoder
+from inference import worker_detector_pool
+from metrics import stage_timer
+from side_view_processing import prepare_side_view, process_side_view
+from size_prediction import DEFAULT_FIT, SizeChartIndex
+
+DEFAULT_SIZE_CHARTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "size_charts.json")
+
+# Garment types as named in API responses and result files (other garments keep their chart name)
+GARMENT_RESPONSE_NAMES = {"dresses": "dress", "skirts": "skirt"}
+
+# Decoder and compiled size charts of a process inference worker, created on first use
+_worker_state = {}
+
+
+def load_size_charts(path=DEFAULT_SIZE_CHARTS_PATH):
+    """Load the size charts JSON file"""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def parse_manifest(f, jsonl=False):
+    """
+    Parse a manifest of photo pairs
+
+    The manifest is a CSV file with a header, or JSONL, with the columns
+    `front`, `side` and `height_cm` and an optional `id`.
+
+    Args:
+        f: Text file object
+        jsonl: Parse JSONL instead of CSV
+
+    Returns:
+        List of {"id", "front", "side", "height_cm"} dicts; id defaults to the row
+        number, height_cm is None when it is missing or not a number
+    """
+    if jsonl:
+        rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        rows = list(csv.DictReader(f))
+
+    pairs = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            height_cm = float(row.get("height_cm"))
+        except (TypeError, ValueError):
+            height_cm = None
+        pairs.append({
+            "id": str(row.get("id") or number),
+            "front": str(row.get("front") or ""),
+            "side": str(row.get("side") or ""),
+            "height_cm": height_cm,
+        })
+    return pairs
+
+
+def response_garments(size_index):
+    """Garment types reported for a size index, as (chart name, response name) pairs"""
+    garments = dict.fromkeys([*DEFAULT_FIT, *size_index.garments])
+    return [(garment, GARMENT_RESPONSE_NAMES.get(garment, garment)) for garment in garments]
+
+
+def measure_and_size(front_results, side_results, side_img_np, height_cm, size_index, side_prepared=None):
+    """
+    Calculate body measurements and garment sizes from the poses of a photo pair
+
+    Args:
+        front_results: Pose results for the front view (see OpenPoseDetector.detect_pose)
+        side_results: Pose results for the side view
+        side_img_np: Side view image as numpy array (RGB format)
+        height_cm: Height of the person in centimeters
+        size_index: SizeChartIndex used for sizing
+        side_prepared: Result of prepare_side_view for the side view (computed if omitted)
+
+    Returns:
+        Dictionary with "measurements" (circumferences and inseam in cm, rounded),
+        "circumferences" (unrounded, by chart measurement name), "sizes" (US/EU/UK
+        size per garment type) and "side_view" (the process_side_view results,
+        for rendering the depth markers)
+    """
+    # Calculate body measurements from front view
+    with stage_timer("body_measurements"):
+        measurements = calculate_body_measurements(
+            front_results["landmarks"],
+            (front_results["image_height"], front_results["image_width"], 3),
+            height_cm
+        )
+
+    # Process side view to get depth measurements
+    with stage_timer("side_view"):
+        side_view_results = process_side_view(
+            side_results["landmarks"],
+            side_img_np,
+            measurements["waist_y_offset"],
+            side_prepared
+        )
+    measurements.update(side_view_results["measurements"])
+
+    # Calculate circumferences using ellipse approximation
+    ellipse_perimeter = side_view_results["ellipse_perimeter_func"]
+    scaling_factor = measurements["scaling_factor"]
+    hip_circumference_cm = ellipse_perimeter(measurements["hip_width_px"], measurements["hip_depth_px"]) * scaling_factor
+    waist_circumference_cm = ellipse_perimeter(measurements["waist_width_px"], measurements["waist_depth_px"]) * scaling_factor
+    bust_circumference_cm = ellipse_perimeter(measurements["bust_width_px"], measurements["bust_depth_px"]) * scaling_factor
+
+    # Determine sizes for every garment type in one pass over the compiled charts
+    circumferences = {
+        "waist": waist_circumference_cm,
+        "hip": hip_circumference_cm,
+        "bust": bust_circumference_cm
+    }
+    with stage_timer("sizing"):
+        sizes = size_index.determine_sizes(circumferences)
+
+        # Add EU and UK sizes from the chart entry of each size
+        garment_sizes = {}
+        for garment, name in response_garments(size_index):
+            size = sizes.get(garment, "")
+            details = size_index.size_details(garment, size)
+            garment_sizes[name] = {
+                "us": size,
+                "eu": details.get("eu_size", ""),
+                "uk": details.get("uk_size", "")
+            }
+
+    return {
+        "measurements": {
+            "waist": round(waist_circumference_cm, 1),
+            "hip": round(hip_circumference_cm, 1),
+            "inseam": round(measurements["inseam_cm"], 1),
+            "bust": round(bust_circumference_cm, 1)
+        },
+        "circumferences": circumferences,
+        "sizes": garment_sizes,
+        "side_view": side_view_results
+    }
+
+
+def _worker_resources(charts_path):
+    """Decoder and size index of this worker process"""
+    if "decoder" not in _worker_state:
+        _worker_state["decoder"] = ImageDecoder(max_side=settings.decode_max_side, max_pixels=settings.max_image_pixels)
+    if _worker_state.get("charts_path") != charts_path:
+        _worker_state["size_index"] = SizeChartIndex(load_size_charts(charts_path))
+        _worker_state["charts_path"] = charts_path
+    return _worker_state["decoder"], _worker_state["size_index"]
+
+
+def size_image_pairs(pairs, charts_path=DEFAULT_SIZE_CHARTS_PATH):
+    """
+    Size a chunk of front/side photo pairs on a process inference worker
+
+    All images of the chunk that decode are run through the network in one
+    batched forward pass. A pair that fails (unreadable image, nobody
+    detected, ...) is reported on its own and doesn't affect the others.
+
+    Args:
+        pairs: List of (front_path, side_path, height_cm) tuples
+        charts_path: Size charts to size against
+
+    Returns:
+        (results, timings) - one result per pair, either {"measurements", "sizes"}
+        or {"error": message}, and the time spent per stage in milliseconds
+    """
+    decoder, size_index = _worker_resources(charts_path)
+    timings = {"decode_ms": 0.0, "inference_ms": 0.0, "measure_ms": 0.0}
+    results = [None] * len(pairs)
+
+    # Decode both views of every pair
+    start = time.perf_counter()
+    images = []
+    for i, (front_path, side_path, _) in enumerate(pairs):
+        decoded = []
+        for label, path in (("front view image", front_path), ("side view image", side_path)):
+            try:
+                with open(path, "rb") as f:
+                    decoded.append(decoder.decode(f.read()))
+            except Exception as e:
+                results[i] = {"error": f"Failed to process {label}: {str(e)}"}
+                break
+        images.append(decoded if results[i] is None else None)
+    timings["decode_ms"] = (time.perf_counter() - start) * 1000.0
+
+    # Detect the poses of all decoded images in one batch
+    start = time.perf_counter()
+    valid = [i for i, decoded in enumerate(images) if decoded is not None]
+    poses = {}
+    if valid:
+        with worker_detector_pool().checkout() as detector:
+            batch = detector.detect_pose_batch([img for i in valid for img in images[i]])
+        for k, i in enumerate(valid):
+            poses[i] = (batch[2 * k], batch[2 * k + 1])
+    timings["inference_ms"] = (time.perf_counter() - start) * 1000.0
+
+    # Measure and size every pair with both poses
+    start = time.perf_counter()
+    for i, (front_results, side_results) in poses.items():
+        if not front_results["landmarks"]:
+            results[i] = {"error": "No person detected in the front view image"}
+            continue
+        if not side_results["landmarks"]:
+            results[i] = {"error": "No person detected in the side view image"}
+            continue
+        try:
+            side_img_np = images[i][1]
+            side_prepared = prepare_side_view(side_img_np, settings.side_view_working_width)
+            sizing = measure_and_size(front_results, side_results, side_img_np, pairs[i][2], size_index, side_prepared)
+            results[i] = {"measurements": sizing["measurements"], "sizes": sizing["sizes"]}
+        except Exception as e:
+            results[i] = {"error": f"Error processing image: {str(e)}"}
+    timings["measure_ms"] = (time.perf_counter() - start) * 1000.0
+
+    return results, timings
@@ -0,0 +1,194 @@
+"""
+Deterministic stand-in for the OpenPose network, and synthetic photos to feed it
+
+SyntheticPoseNet answers forward() with canned heatmaps (in the output layout
+of any model profile) of a person standing in the middle of the image, so the whole pipeline (blob preparation,
+heatmap post-processing, measurements, side view, sizing) runs without the
+caffemodel and always produces the same landmarks. synthetic_photo draws a
+matching front or side view photo at any resolution, with a silhouette the
+side view segmentation can measure.
+
+Used by the benchmark suite and the load generator (benchmarks/) to run
+offline and reproducibly, and by the service with POSE_BACKEND=synthetic.
+"""
+
+import io
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import pose_models
+
+# Landmarks of the synthetic person, as (x, y) fractions of the image (covering the
+# keypoints of every model profile, see pose_models)
+SKELETON = {
+    "NOSE": (0.50, 0.12),
+    "HEAD": (0.50, 0.07),
+    "NECK": (0.50, 0.20),
+    "CHEST": (0.50, 0.35),
+    "RIGHT_SHOULDER": (0.41, 0.21),
+    "RIGHT_ELBOW": (0.37, 0.35),
+    "RIGHT_WRIST": (0.35, 0.48),
+    "LEFT_SHOULDER": (0.59, 0.21),
+    "LEFT_ELBOW": (0.63, 0.35),
+    "LEFT_WRIST": (0.65, 0.48),
+    "RIGHT_HIP": (0.44, 0.50),
+    "RIGHT_KNEE": (0.44, 0.70),
+    "RIGHT_ANKLE": (0.44, 0.90),
+    "LEFT_HIP": (0.56, 0.50),
+    "LEFT_KNEE": (0.56, 0.70),
+    "LEFT_ANKLE": (0.56, 0.90),
+    "RIGHT_EYE": (0.48, 0.10),
+    "LEFT_EYE": (0.52, 0.10),
+    "RIGHT_EAR": (0.46, 0.11),
+    "LEFT_EAR": (0.54, 0.11),
+}
+
+# Heatmap peaks that differ from DEFAULT_CONFIDENCE. The left ear (COCO) and the chest (MPI)
+# stay below the detection threshold, so every image also runs the missing keypoint inference
+PEAK_CONFIDENCE = {"RIGHT_EAR": 0.6, "LEFT_EAR": 0.05, "CHEST": 0.05}
+DEFAULT_CONFIDENCE = 0.9
+
+# Network stride: heatmaps are 1/8 of the input size
+STRIDE = 8
+
+
+def peak_confidence(landmark_name):
+    """Heatmap peak of a landmark of the synthetic person"""
+    return PEAK_CONFIDENCE.get(landmark_name, DEFAULT_CONFIDENCE)
+
+
+class SyntheticPoseNet:
+    """
+    Stand-in for a cv2.dnn.Net of an OpenPose model
+
+    Every image in the input blob gets Gaussian keypoint peaks at the SKELETON
+    positions, relative to the part of the input the image occupies (the
+    letterbox padding is all zeros and is left out). Pass the class as
+    `read_net` to OpenPoseDetector, DetectorPool or create_detector_pool, or
+    select it with POSE_BACKEND=synthetic.
+
+    A forward pass can be made to take as long as the real network's would,
+    so load tests see realistic inference capacity. The simulated time is
+    slept, not computed: it holds the inference worker but leaves the CPU to
+    decoding and post-processing.
+
+    Args:
+        model_type: Name of the model profile whose output layout is produced (see pose_models)
+        sigma: Peak radius in heatmap cells
+        inference_ms: Minimum duration of a forward pass in milliseconds
+        per_image_ms: Added to the minimum duration for every image in the batch
+    """
+
+    weights_format = "synthetic"
+
+    def __init__(self, model_type="COCO", sigma=1.0, inference_ms=0.0, per_image_ms=0.0):
+        self.profile = pose_models.get_profile(model_type)
+        self.model_type = self.profile.name
+        self.sigma = sigma
+        self.inference_ms = inference_ms
+        self.per_image_ms = per_image_ms
+        self._blob = None
+
+    def setPreferableBackend(self, backend):
+        pass
+
+    def setPreferableTarget(self, target):
+        pass
+
+    def setInput(self, blob, name="", scalefactor=1.0, mean=None):
+        self._blob = blob
+
+    def forward(self, output_name=None):
+        if self._blob is None:
+            raise RuntimeError("setInput must be called before forward")
+        start = time.perf_counter()
+        batch, _, input_height, input_width = self._blob.shape
+        map_height, map_width = input_height // STRIDE, input_width // STRIDE
+        output = np.zeros((batch, self.profile.output_channels, map_height, map_width), dtype=np.float32)
+        ys = np.arange(map_height, dtype=np.float32)[:, None]
+        xs = np.arange(map_width, dtype=np.float32)[None, :]
+
+        for i in range(batch):
+            # Extent of the image inside the input (the padding is zero in every channel)
+            filled = self._blob[i].any(axis=0)
+            rows = np.flatnonzero(filled.any(axis=1))
+            cols = np.flatnonzero(filled.any(axis=0))
+            content_height = (rows[-1] + 1) if len(rows) else input_height
+            content_width = (cols[-1] + 1) if len(cols) else input_width
+
+            for k, landmark_name in enumerate(self.profile.landmarks):
+                fx, fy = SKELETON[landmark_name]
+                peak = peak_confidence(landmark_name)
+                cx = fx * content_width / STRIDE - 0.5
+                cy = fy * content_height / STRIDE - 0.5
+                output[i, k] = peak * np.exp(-((xs - cx) ** 2 + (ys - cy) ** 2) / (2.0 * self.sigma ** 2))
+
+        # Reading a stage's heatmap layer returns the heatmap channels only
+        if output_name:
+            output = output[:, :self.profile.heatmap_channels]
+
+        remaining = (self.inference_ms + self.per_image_ms * batch) / 1000.0 - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+        return output
+
+
+def synthetic_photo(width, height, view="front", seed=0):
+    """
+    Draw a photo of the synthetic person
+
+    The figure matches SKELETON, so its landmarks are those the stand-in
+    network reports. The side view has a torso silhouette with a realistic
+    depth profile for the side view measurements.
+
+    Args:
+        width: Image width
+        height: Image height
+        view: "front" or "side"
+        seed: Seed of the background texture
+
+    Returns:
+        RGB numpy array
+    """
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    # Light, slightly textured background
+    image[:] = (rng.random((height, width, 1)) * 30 + 200).astype(np.uint8)
+
+    def point(fx, fy):
+        return int(round(fx * width)), int(round(fy * height))
+
+    color = (40, 45, 60)
+    limb = max(2, int(width * 0.03))
+    cv2.circle(image, point(0.5, 0.11), max(2, int(height * 0.05)), color, -1)
+
+    if view == "side":
+        # Profile of the torso: front and back edge (as x fractions) down from the neck
+        front = [(0.54, 0.19), (0.57, 0.27), (0.56, 0.36), (0.55, 0.44), (0.57, 0.52)]
+        back = [(0.46, 0.52), (0.44, 0.44), (0.45, 0.36), (0.44, 0.27), (0.46, 0.19)]
+        torso = np.array([point(x, y) for x, y in front + back], dtype=np.int32)
+        cv2.fillPoly(image, [torso], color)
+        for knee, ankle in (((0.49, 0.70), (0.49, 0.90)), ((0.52, 0.70), (0.52, 0.90))):
+            cv2.line(image, point(0.5, 0.52), point(*knee), color, limb)
+            cv2.line(image, point(*knee), point(*ankle), color, limb)
+        cv2.line(image, point(0.5, 0.22), point(0.52, 0.35), color, limb)
+        cv2.line(image, point(0.52, 0.35), point(0.53, 0.48), color, limb)
+    else:
+        corners = ("RIGHT_SHOULDER", "LEFT_SHOULDER", "LEFT_HIP", "RIGHT_HIP")
+        torso = np.array([point(*SKELETON[name]) for name in corners], dtype=np.int32)
+        cv2.fillPoly(image, [torso], color)
+        cv2.line(image, point(*SKELETON["NECK"]), point(0.5, 0.12), color, limb)
+        for side in ("RIGHT_", "LEFT_"):
+            for a, b in (("SHOULDER", "ELBOW"), ("ELBOW", "WRIST"), ("HIP", "KNEE"), ("KNEE", "ANKLE")):
+                cv2.line(image, point(*SKELETON[side + a]), point(*SKELETON[side + b]), color, limb)
+    return image
+
+
+def synthetic_photo_jpeg(width, height, view="front", seed=0, quality=90):
+    """synthetic_photo encoded as JPEG bytes, like an upload"""
+    buffer = io.BytesIO()
+    Image.fromarray(synthetic_photo(width, height, view, seed)).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,81 @@
+"""
+Tests of the multi-brand size chart store
+
+Covers the binary save/open round trip and leaving out brands whose fit
+needs a measurement that wasn't given.
+
+Usage:
+    python -m pytest test_brand_charts.py
+"""
+
+import copy
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from brand_charts import BrandChartStore
+from size_prediction import SizeChartIndex
+
+SIZE_CHARTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "size_charts.json")
+
+MEASUREMENT_SETS = [
+    {"waist": 30.0, "hip": 40.0, "bust": 36.0, "inseam": 31.0},
+    {"waist": 26.5, "hip": 36.0, "bust": 33.0, "inseam": 30.0},
+    {"waist": 41.0, "hip": 52.0, "bust": 47.0, "inseam": 32.0},
+]
+
+
+def write_brand_charts(directory):
+    """Two brands: "acme" with the default charts, "tailor" whose jeans fit also weighs the inseam"""
+    with open(SIZE_CHARTS_PATH, "r") as f:
+        charts = json.load(f)
+    tailor = copy.deepcopy(charts)
+    tailor["jeans"]["fit"] = {"primary": "waist", "weights": {"waist": 0.6, "hip": 0.2, "inseam": 0.2}}
+    for brand, brand_charts in (("acme", charts), ("tailor", tailor)):
+        with open(os.path.join(directory, f"{brand}.json"), "w") as f:
+            json.dump(brand_charts, f)
+    return charts
+
+
+def test_save_and_open_round_trip():
+    with tempfile.TemporaryDirectory() as directory:
+        write_brand_charts(directory)
+        store = BrandChartStore.load(directory)
+        path = os.path.join(directory, "brands.bin")
+        store.save(path)
+        opened = BrandChartStore.load(path)
+
+        assert isinstance(opened._garments["jeans"]["values"], np.memmap)
+        assert opened.brands() == store.brands() == ["acme", "tailor"]
+        assert opened.garments == store.garments
+        assert opened.measurements == store.measurements
+        for measurements in MEASUREMENT_SETS:
+            assert opened.predict(measurements) == store.predict(measurements)
+            assert opened.predict(measurements, brands=["tailor"]) == store.predict(measurements, brands=["tailor"])
+        del opened
+
+
+def test_brands_missing_fit_measurements_are_left_out():
+    with tempfile.TemporaryDirectory() as directory:
+        charts = write_brand_charts(directory)
+        store = BrandChartStore.load(directory)
+        index = SizeChartIndex(charts)
+
+        # Without the inseam only the brand whose jeans fit doesn't need it is sized;
+        # without the bust no brand gets a dress size
+        measurements = {"waist": 30.0, "hip": 40.0, "bust": None}
+        sizes = store.predict(measurements)
+        assert list(sizes["jeans"]) == ["acme"]
+        assert sizes["dresses"] == {}
+        assert sizes["jeans"]["acme"]["us"] == index.determine_sizes(measurements)["jeans"]
+
+        assert all(sizes == {} for sizes in store.predict({"waist": 30.0}).values())
+        assert set(store.best_sizes("jeans", MEASUREMENT_SETS[0])) == {"acme", "tailor"}
+
+
+if __name__ == "__main__":
+    test_save_and_open_round_trip()
+    test_brands_missing_fit_measurements_are_left_out()
+    print("Brand chart store tests passed")
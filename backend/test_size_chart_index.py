@@ -0,0 +1,105 @@
+"""
+Regression test of the vectorized size chart index
+
+Checks that SizeChartIndex picks the same sizes on data/size_charts.json as
+the per-garment lookups it replaced (reproduced below as they were), for
+every size's own measurements and for random measurement sets.
+
+Usage:
+    python -m pytest test_size_chart_index.py
+"""
+
+import json
+import os
+import random
+
+from size_prediction import SizeChartIndex
+
+SIZE_CHARTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "size_charts.json")
+
+# Weights and between-sizes measurement of the legacy determine_*_size functions
+LEGACY_FIT = {
+    "jeans": ({"waist": 0.7, "hip": 0.3}, "waist"),
+    "dresses": ({"bust": 0.4, "waist": 0.35, "hip": 0.25}, "bust"),
+    "skirts": ({"waist": 0.65, "hip": 0.35}, "waist"),
+}
+
+
+def load_charts():
+    with open(SIZE_CHARTS_PATH, "r") as f:
+        return json.load(f)
+
+
+def legacy_size(size_mapping, measurements, weights, primary):
+    """The legacy per-garment lookup: weighted nearest size, then the between-sizes check"""
+    size_data = sorted(size_mapping.items(), key=lambda item: item[1][primary])
+    best_match = None
+    min_diff = float("inf")
+    for size, data in size_data:
+        total_diff = sum(abs(data[name] - measurements[name]) * weight for name, weight in weights.items())
+        if total_diff < min_diff:
+            min_diff = total_diff
+            best_match = size
+
+    value = measurements[primary]
+    between = None
+    for (current_size, current_data), (next_size, next_data) in zip(size_data, size_data[1:]):
+        if current_data[primary] <= value <= next_data[primary]:
+            lower_diff = abs(current_data[primary] - value)
+            upper_diff = abs(next_data[primary] - value)
+            total_range = next_data[primary] - current_data[primary]
+            if lower_diff / total_range <= 0.3 or upper_diff / total_range <= 0.3:
+                between = (current_size, next_size, lower_diff / total_range, upper_diff / total_range)
+                best_match = next_size if upper_diff < lower_diff else current_size
+                break
+
+    def label(size):
+        return size.split("/")[0].replace("US_", "")
+
+    result = label(best_match) if best_match else ""
+    if between is not None:
+        lower, upper, lower_fraction, upper_fraction = between
+        if 0.15 < lower_fraction < 0.85 and 0.15 < upper_fraction < 0.85:
+            result = f"{label(lower)}-{label(upper)}"
+    return result
+
+
+def legacy_sizes(size_charts, measurements):
+    return {
+        garment: legacy_size(size_charts[garment]["size_mapping"], measurements, weights, primary)
+        for garment, (weights, primary) in LEGACY_FIT.items()
+    }
+
+
+def measurement_sets(size_charts, count=5000, seed=0):
+    """Every size's own measurements, then random sets spanning the charts"""
+    for chart in size_charts.values():
+        for data in chart["size_mapping"].values():
+            yield {name: float(data.get(name, data.get("waist"))) for name in ("waist", "hip", "bust")}
+
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield {
+            "waist": round(rng.uniform(18.0, 50.0), 1),
+            "hip": round(rng.uniform(28.0, 60.0), 1),
+            "bust": round(rng.uniform(26.0, 56.0), 1),
+        }
+
+
+def test_index_matches_legacy_lookups():
+    size_charts = load_charts()
+    index = SizeChartIndex(size_charts)
+    for measurements in measurement_sets(size_charts):
+        assert index.determine_sizes(measurements) == legacy_sizes(size_charts, measurements), measurements
+
+
+def test_garments_without_their_measurements_are_left_out():
+    index = SizeChartIndex(load_charts())
+    assert index.determine_sizes({"waist": 30.0}) == {}
+    assert set(index.determine_sizes({"waist": 30.0, "hip": 40.0, "bust": None})) == {"jeans", "skirts"}
+
+
+if __name__ == "__main__":
+    test_index_matches_legacy_lookups()
+    test_garments_without_their_measurements_are_left_out()
+    print("SizeChartIndex matches the legacy lookups")
@@ -0,0 +1,330 @@
+"""
+Request-scoped tracing and on-demand profiling
+
+A traced request carries a Trace in a context variable. Pipeline stages
+timed through metrics.record_stage / metrics.stage_timer add a span to it, on
+the event loop as well as on the thread pool (which inherits the context).
+Inference runs in batches on executor workers, outside any request context:
+the workers collect the spans of each call (collect_spans) and the batch
+scheduler copies them into the trace of every request in the batch.
+
+TracingMiddleware returns the span durations of a request in a Server-Timing
+header and can append every trace to a file in the Chrome trace event format
+(open it in chrome://tracing or https://ui.perfetto.dev). It also profiles
+single requests on demand, for admins only (see TracingMiddleware).
+"""
+
+import collections
+import contextvars
+import cProfile
+import json
+import marshal
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+from fastapi.concurrency import run_in_threadpool as _run_in_threadpool
+from fastapi.responses import JSONResponse
+
+PROFILE_MODES = ("cprofile", "sample")
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """
+    Spans recorded for one request (or one inference call on a worker)
+
+    Spans are (name, start, end, pid, thread id) tuples with perf_counter
+    timestamps, which come from the same monotonic clock in every process of
+    the machine, so spans recorded by process workers line up with the rest.
+
+    Args:
+        name: Name of the traced operation (the request path)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = []
+        self.profiler = None
+
+    def add_span(self, name, start, end):
+        # list.append is atomic, so thread pool threads can add spans concurrently
+        self.spans.append((name, start, end, os.getpid(), threading.get_ident()))
+
+    def server_timing(self, end):
+        """Server-Timing header value: the total duration of each stage, and of the whole request"""
+        totals = {}
+        for name, start, stop, _, _ in list(self.spans):
+            totals[name] = totals.get(name, 0.0) + (stop - start)
+        entries = [f"{name};dur={seconds * 1000.0:.1f}" for name, seconds in totals.items()]
+        entries.append(f"total;dur={(end - self.start) * 1000.0:.1f}")
+        return ", ".join(entries)
+
+    def trace_events(self, end):
+        """The request and its spans as Chrome trace events (complete events, microsecond timestamps)"""
+        events = [{
+            "name": self.name, "cat": "request", "ph": "X",
+            "ts": round(self.start * 1e6, 1), "dur": round((end - self.start) * 1e6, 1),
+            "pid": os.getpid(), "tid": threading.get_ident(),
+        }]
+        for name, start, stop, pid, thread_id in list(self.spans):
+            events.append({
+                "name": name, "cat": "stage", "ph": "X",
+                "ts": round(start * 1e6, 1), "dur": round((stop - start) * 1e6, 1),
+                "pid": pid, "tid": thread_id, "args": {"request": self.name},
+            })
+        return events
+
+
+def current_trace():
+    """Trace of the running request, or None outside a traced request"""
+    return _current_trace.get()
+
+
+def add_span(name, start, end):
+    """Add a span to the trace of the running request (does nothing outside a traced request)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start, end)
+
+
+@contextmanager
+def collect_spans():
+    """
+    Collect the spans recorded by the with-block into a list
+
+    Used around inference calls on executor workers, which run outside any
+    request context; the list is sent back with the results.
+    """
+    trace = Trace("worker")
+    token = _current_trace.set(trace)
+    try:
+        yield trace.spans
+    finally:
+        _current_trace.reset(token)
+
+
+async def run_in_threadpool(func, *args):
+    """
+    Run func(*args) on the thread pool (like starlette's run_in_threadpool)
+
+    When the request is being profiled with cProfile, the call is profiled.
+    """
+    trace = _current_trace.get()
+    if trace is not None and isinstance(trace.profiler, CallProfiler):
+        return await _run_in_threadpool(trace.profiler.runcall, func, *args)
+    return await _run_in_threadpool(func, *args)
+
+
+class CallProfiler:
+    """
+    cProfile of the thread pool calls of one request
+
+    cProfile only sees the thread it is enabled on, so every call gets a
+    profiler of its own and the statistics are merged at the end. Work on the
+    event loop and in shared inference batches isn't included; use the
+    sampling profiler for those.
+    """
+
+    media_type = "application/octet-stream"
+
+    def __init__(self):
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def runcall(self, func, *args):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args)
+        finally:
+            with self._lock:
+                self._profiles.append(profile)
+
+    def stop(self):
+        """Merged statistics in the pstats file format (load with pstats.Stats or snakeviz)"""
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return marshal.dumps({})
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return marshal.dumps(stats.stats)
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of every thread of the process from a background thread
+
+    Catches everything running while the request does: the event loop, the
+    thread pool and thread inference workers, including work for other
+    requests running at the same time. Threads waiting for work are left out.
+
+    Args:
+        interval_seconds: Time between samples
+    """
+
+    media_type = "text/plain"
+
+    # Innermost frames of threads that are waiting rather than working
+    IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+
+    def __init__(self, interval_seconds=0.005):
+        self.interval_seconds = interval_seconds
+        self.samples = 0
+        self._stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Sampled stacks in the folded format ("frame;frame;... count" lines, for flame graph tools)"""
+        self._stop.set()
+        self._thread.join()
+        lines = [f"{stack} {count}" for stack, count in self._stacks.most_common()]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or self._is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    @classmethod
+    def _is_idle(cls, frame):
+        filename = os.path.basename(frame.f_code.co_filename)
+        return filename in cls.IDLE_FILES or (filename == "thread.py" and frame.f_code.co_name == "_worker")
+
+
+class TraceFileWriter:
+    """
+    Appends trace events to a file in the Chrome trace event (JSON array) format
+
+    The closing bracket of the array is optional in that format, so events
+    can be appended for as long as the service runs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._lock, open(path, "a") as f:
+            if f.tell() == 0:
+                f.write("[\n")
+
+    def write(self, events):
+        data = "".join(json.dumps(event) + ",\n" for event in events)
+        with self._lock, open(self.path, "a") as f:
+            f.write(data)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware tracing requests to selected paths
+
+    Every traced response gets a Server-Timing header with the duration of
+    each pipeline stage. With a trace writer, the spans are also appended to
+    the trace file.
+
+    Sending `profile=cprofile` or `profile=sample` (query parameter or
+    X-Profile header) together with a valid X-Admin-Token profiles that one
+    request. The profile is stored as a debug artifact once the response has
+    been sent; the X-Profile-Artifact response header holds its URL (under
+    artifact_path, which should only serve it to admins).
+
+    Args:
+        app: The wrapped ASGI application
+        paths: Request paths to trace
+        trace_writer: TraceFileWriter for the traces (None keeps them in the header only)
+        artifact_store: DebugArtifactStore receiving profiles (None disables profiling)
+        artifact_path: URL path the profiles of artifact_store are served under
+        admin_token: Token allowing requests to be profiled (empty disables profiling)
+        sample_interval_seconds: Sampling interval of the sampling profiler
+    """
+
+    def __init__(self, app, paths, trace_writer=None, artifact_store=None, artifact_path="/admin/profiles/",
+                 admin_token="", sample_interval_seconds=0.005):
+        self.app = app
+        self.paths = set(paths)
+        self.trace_writer = trace_writer
+        self.artifact_store = artifact_store
+        self.artifact_path = artifact_path
+        self.admin_token = admin_token
+        self.sample_interval_seconds = sample_interval_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        profile_mode = headers.get(b"x-profile", b"").decode("latin-1").strip().lower()
+        if not profile_mode:
+            profile_mode = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile", [""])[0].lower()
+        artifact_id = None
+        if profile_mode:
+            token = headers.get(b"x-admin-token", b"").decode("latin-1")
+            if not self.admin_token or not self.artifact_store or not secrets.compare_digest(token, self.admin_token):
+                response = JSONResponse(status_code=403, content={"detail": "Profiling requires a valid X-Admin-Token"})
+                await response(scope, receive, send)
+                return
+            if profile_mode not in PROFILE_MODES:
+                response = JSONResponse(
+                    status_code=400, content={"detail": f"Unknown profile mode, expected one of {PROFILE_MODES}"}
+                )
+                await response(scope, receive, send)
+                return
+            artifact_id = self.artifact_store.reserve()
+
+        trace = Trace(scope["path"])
+        if artifact_id is not None:
+            trace.profiler = (
+                CallProfiler() if profile_mode == "cprofile" else SamplingProfiler(self.sample_interval_seconds)
+            )
+            trace.profiler.start()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", []))
+                message["headers"].append((b"server-timing", trace.server_timing(time.perf_counter()).encode()))
+                # Let the frontend (another origin) read the timings through the Performance API
+                message["headers"].append((b"timing-allow-origin", b"*"))
+                if artifact_id is not None:
+                    message["headers"].append((b"x-profile-artifact", f"{self.artifact_path}{artifact_id}".encode()))
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            end = time.perf_counter()
+            if trace.profiler is not None:
+                profile = await _run_in_threadpool(trace.profiler.stop)
+                self.artifact_store.put(artifact_id, profile, trace.profiler.media_type)
+            if self.trace_writer is not None:
+                try:
+                    self.trace_writer.write(trace.trace_events(end))
+                except OSError as e:
+                    print(f"Error writing trace: {e}")
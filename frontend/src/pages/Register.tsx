@@ -5,6 +5,7 @@ import { Card } from '@/components/ui/card';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { Button } from '@/components/ui/button';
+import { Checkbox } from '@/components/ui/checkbox';
 import { toast } from 'sonner';
 import Navigation from '@/components/Navigation';
 import PoseVisualizer from '@/components/PoseVisualizer';
@@ -34,7 +35,7 @@ interface SizeResult {
     };
   };
   debug_images?: {
-    side_view_with_markers?: string;
+    side_view_with_markers?: string;  // URL path of the rendered image on the API
   };
 }
 
@@ -70,6 +71,7 @@ const Register = () => {
   const [sideFile, setSideFile] = useState<File | null>(null);
   const [sidePreviewUrl, setSidePreviewUrl] = useState<string | null>(null);
   const [height, setHeight] = useState<string>('');
+  const [showDepthAnalysis, setShowDepthAnalysis] = useState<boolean>(false);
   const [loading, setLoading] = useState<boolean>(false);
   const [result, setResult] = useState<SizeResult | null>(null);
   const [poseData, setPoseData] = useState<PoseResult | null>(null);
@@ -140,6 +142,9 @@ const Register = () => {
     formData.append('image', file);
     formData.append('height_cm', height);
     formData.append('side_image', sideFile);
+    if (showDepthAnalysis) {
+      formData.append('debug', 'true');
+    }
 
     try {
       const response = await axios.post('http://localhost:8000/predict-size/', formData, {
@@ -268,6 +273,15 @@ const Register = () => {
                       />
                     </div>
 
+                    <div className="flex items-center space-x-2">
+                      <Checkbox
+                        id="depth-analysis"
+                        checked={showDepthAnalysis}
+                        onCheckedChange={(checked) => setShowDepthAnalysis(checked === true)}
+                      />
+                      <Label htmlFor="depth-analysis">Show depth analysis image</Label>
+                    </div>
+
                     <Button
                       onClick={handleSubmit}
                       disabled={!file || !sideFile || loading || !height}
@@ -396,7 +410,7 @@ const Register = () => {
                         <h3 className="text-lg font-semibold mb-3">Depth Analysis</h3>
                         <div className="border rounded-lg overflow-hidden">
                           <img
-                            src={`data:image/jpeg;base64,${result.debug_images.side_view_with_markers}`}
+                            src={`http://localhost:8000${result.debug_images.side_view_with_markers}`}
                             alt="Side view analysis"
                             className="w-full"
                           />